@@ -1,8 +1,9 @@
 from flask import Flask
 from backend.api.trip_endpoints import trips_bp
 from backend.api.insights_endpoints import insights_bp
-from backend.config.db_connection import get_db_connection
+from backend.config.db_connection import db_cursor, get_pool_stats
 from backend.utils.db_insert import insert_all_from_cleaned
+from backend.utils.metrics import init_app as init_metrics
 
 
 def create_app():
@@ -11,6 +12,7 @@ def create_app():
 
     app.register_blueprint(trips_bp, url_prefix='/api/trips')
     app.register_blueprint(insights_bp, url_prefix='/api/insights')
+    init_metrics(app)
 
     @app.route('/')
     def home():
@@ -18,27 +20,28 @@ def create_app():
             "message": "Welcome to NYC Mobility API",
             "endpoints": {
                 "trips": "/api/trips",
-                "insights": "/api/insights"
+                "insights": "/api/insights",
+                "db_pool": "/api/db-pool",
+                "metrics": "/metrics"
             }
         }
 
+    @app.route('/api/db-pool')
+    def db_pool():
+        return get_pool_stats()
+
     return app
 
 
 if __name__ == '__main__':
     try:
-        conn = get_db_connection()
-        if conn is None:
-            raise RuntimeError("Database connection failed")
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM trips")
-        count = cur.fetchone()[0]
-        cur.close()
-        conn.close()
-        if count == 0:
-            inserted = insert_all_from_cleaned()
-            print(
-                f"Auto-ingest completed. Inserted {inserted} rows from data/cleaned.")
+        with db_cursor(dictionary=False) as (conn, cur):
+            cur.execute("SELECT COUNT(*) FROM trips")
+            count = cur.fetchone()[0]
+        # The ingest ledger skips files already loaded; an empty table reloads everything
+        inserted = insert_all_from_cleaned(force=count == 0)
+        print(
+            f"Auto-ingest completed. Inserted {inserted} rows from data/cleaned.")
     except Exception as e:
         print(f"Auto-ingest skipped due to error: {e}")
 
@@ -1,11 +1,16 @@
 """
 Routes for insights and analytics API endpoints
 """
-from backend.config.db_connection import get_db_connection
+from backend.config.db_connection import db_cursor
+from backend.utils.anomaly_detection import FLAG_BITS, flag_names
+from backend.utils.response_cache import cached_response
+from backend.utils.sketches import HLL_STD_ERROR, METRICS, RELATIVE_ERROR, get_sketches
+from backend.utils.snapshot import get_snapshot
+from backend.utils.travel_matrix import ETA_BBOX, get_travel_matrix
 import os
 import sys
-from flask import Blueprint, jsonify
-import mysql.connector
+from datetime import datetime
+from flask import Blueprint, jsonify, request
 
 backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if backend_dir not in sys.path:
@@ -13,43 +18,98 @@ if backend_dir not in sys.path:
 
 insights_bp = Blueprint('insights', __name__)
 
+# "rollup" answers from trip_rollup_hourly (maintained by ingest);
+# "raw" aggregates the trips table directly; "snapshot" aggregates the
+# memory-mapped columns from backend/utils/snapshot.py, falling back to the
+# rollups until a snapshot has been built.
+INSIGHTS_BACKEND = os.getenv("INSIGHTS_BACKEND", "rollup")
 
-@insights_bp.route('/stats', methods=['GET'])
-def get_trip_stats():
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
 
-        cursor = conn.cursor(dictionary=True)
-        stats = {}
+def _stats_from_raw(cursor):
+    stats = {}
+
+    cursor.execute("SELECT COUNT(*) as count FROM trips")
+    stats["total_trips"] = cursor.fetchone()['count']
+
+    cursor.execute(
+        "SELECT AVG(trip_duration_min) as avg_duration FROM trips")
+    stats["avg_duration_min"] = cursor.fetchone()['avg_duration']
+
+    cursor.execute("SELECT AVG(speed_kmh) as avg_speed FROM trips")
+    stats["avg_speed_kmh"] = cursor.fetchone()['avg_speed']
+
+    cursor.execute(
+        "SELECT AVG(trip_distance_km) as avg_distance FROM trips")
+    stats["avg_distance_km"] = cursor.fetchone()['avg_distance']
+
+    cursor.execute("""
+        SELECT passenger_count, COUNT(*) as count 
+        FROM trips 
+        GROUP BY passenger_count 
+        ORDER BY count DESC 
+        LIMIT 1
+    """)
+    result = cursor.fetchone()
+    stats["most_common_passenger_count"] = result['passenger_count'] if result else None
+    return stats
 
-        cursor.execute("SELECT COUNT(*) as count FROM trips")
-        stats["total_trips"] = cursor.fetchone()['count']
 
-        cursor.execute(
-            "SELECT AVG(trip_duration_min) as avg_duration FROM trips")
-        stats["avg_duration_min"] = cursor.fetchone()['avg_duration']
+def _stats_from_rollups(cursor):
+    cursor.execute("""
+        SELECT CAST(COALESCE(SUM(trip_count), 0) AS SIGNED) as total_trips,
+               SUM(sum_duration_min) / SUM(trip_count) as avg_duration_min,
+               SUM(sum_speed_kmh) / SUM(trip_count) as avg_speed_kmh,
+               SUM(sum_distance_km) / SUM(trip_count) as avg_distance_km
+        FROM trip_rollup_hourly
+    """)
+    stats = dict(cursor.fetchone())
 
-        cursor.execute("SELECT AVG(speed_kmh) as avg_speed FROM trips")
-        stats["avg_speed_kmh"] = cursor.fetchone()['avg_speed']
+    cursor.execute("""
+        SELECT passenger_count, SUM(trip_count) as count
+        FROM trip_rollup_hourly
+        GROUP BY passenger_count
+        ORDER BY count DESC
+        LIMIT 1
+    """)
+    result = cursor.fetchone()
+    stats["most_common_passenger_count"] = result['passenger_count'] if result else None
+    return stats
 
-        cursor.execute(
-            "SELECT AVG(trip_distance_km) as avg_distance FROM trips")
-        stats["avg_distance_km"] = cursor.fetchone()['avg_distance']
 
-        cursor.execute("""
-            SELECT passenger_count, COUNT(*) as count 
-            FROM trips 
-            GROUP BY passenger_count 
-            ORDER BY count DESC 
-            LIMIT 1
-        """)
-        result = cursor.fetchone()
-        stats["most_common_passenger_count"] = result['passenger_count'] if result else None
+def _hourly_from_raw(cursor):
+    query = """
+    SELECT HOUR(pickup_datetime) as hour, COUNT(*) as trip_count 
+    FROM trips 
+    GROUP BY HOUR(pickup_datetime)
+    ORDER BY hour
+    """
+    cursor.execute(query)
+    return cursor.fetchall()
 
-        cursor.close()
-        conn.close()
+
+def _hourly_from_rollups(cursor):
+    cursor.execute("""
+        SELECT pickup_hour as hour, CAST(SUM(trip_count) AS SIGNED) as trip_count
+        FROM trip_rollup_hourly
+        GROUP BY pickup_hour
+        ORDER BY hour
+    """)
+    return cursor.fetchall()
+
+
+@insights_bp.route('/stats', methods=['GET'])
+@cached_response()
+def get_trip_stats():
+    try:
+        snapshot = get_snapshot() if INSIGHTS_BACKEND == "snapshot" else None
+        if snapshot is not None:
+            return jsonify(snapshot.stats())
+
+        with db_cursor() as (conn, cursor):
+            if INSIGHTS_BACKEND == "raw":
+                stats = _stats_from_raw(cursor)
+            else:
+                stats = _stats_from_rollups(cursor)
 
         return jsonify(stats)
 
@@ -58,26 +118,155 @@ def get_trip_stats():
 
 
 @insights_bp.route('/hourly-pattern', methods=['GET'])
+@cached_response()
 def get_hourly_pattern():
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
+        snapshot = get_snapshot() if INSIGHTS_BACKEND == "snapshot" else None
+        if snapshot is not None:
+            return jsonify(snapshot.hourly())
 
-        cursor = conn.cursor(dictionary=True)
-        query = """
-        SELECT HOUR(pickup_datetime) as hour, COUNT(*) as trip_count 
-        FROM trips 
-        GROUP BY HOUR(pickup_datetime)
-        ORDER BY hour
-        """
-        cursor.execute(query)
-        hourly_data = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
+        with db_cursor() as (conn, cursor):
+            if INSIGHTS_BACKEND == "raw":
+                hourly_data = _hourly_from_raw(cursor)
+            else:
+                hourly_data = _hourly_from_rollups(cursor)
 
         return jsonify(hourly_data)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+DEFAULT_QUANTILES = "0.5,0.9,0.95,0.99"
+
+
+@insights_bp.route('/percentiles', methods=['GET'])
+def get_percentiles():
+    """Quantiles of duration/speed/distance, or distinct pickup cells, from the ingest sketches.
+
+    ``q`` is a comma-separated list in [0, 1]; ``hour`` and ``vendor``
+    narrow the trips considered. Every quantile comes with the bucket
+    edges that contain the exact value.
+    """
+    metric = request.args.get('metric', default='duration')
+    hour = request.args.get('hour', type=int)
+    vendor = request.args.get('vendor')
+
+    if metric not in METRICS and metric != "pickup_cells":
+        return jsonify({"error": f"metric must be one of {', '.join(list(METRICS) + ['pickup_cells'])}"}), 400
+    if hour is not None and not 0 <= hour <= 23:
+        return jsonify({"error": "hour must be between 0 and 23"}), 400
+    try:
+        qs = [float(q) for q in request.args.get('q', default=DEFAULT_QUANTILES).split(',')]
+        if not all(0 <= q <= 1 for q in qs):
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "q must be comma-separated numbers between 0 and 1"}), 400
+
+    try:
+        sketches = get_sketches()
+        result = {"metric": metric, "hour": hour, "vendor": vendor}
+        if metric == "pickup_cells":
+            result.update(sketches.distinct_cells(hour, vendor))
+            result["error_bound"] = {
+                "type": "relative_standard_error", "value": round(HLL_STD_ERROR, 4),
+                "note": "lower/upper span about two standard errors (~95%)",
+            }
+        else:
+            result["unit"] = METRICS[metric][1]
+            result.update(sketches.quantiles(metric, qs, hour, vendor))
+            result["error_bound"] = {
+                "type": "relative", "value": RELATIVE_ERROR,
+                "note": "the exact quantile lies in [lower, upper]; value is within this relative error of it",
+            }
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@insights_bp.route('/eta', methods=['GET'])
+def get_eta():
+    """Trip duration estimate from the zone-to-zone travel-time matrix.
+
+    ``at`` is the ISO pickup time (default now); its hour of the week
+    selects the matrix slice. ``source`` says whether the estimate came
+    from the exact cell, neighbouring zones and hours, or the hour's
+    median speed.
+    """
+    coords = [request.args.get(k, type=float) for k in ('from_lat', 'from_lon', 'to_lat', 'to_lon')]
+    if any(c is None for c in coords):
+        return jsonify({"error": "from_lat, from_lon, to_lat and to_lon are required"}), 400
+    try:
+        at = datetime.fromisoformat(request.args['at']) if request.args.get('at') else datetime.now()
+    except ValueError:
+        return jsonify({"error": "at must be an ISO datetime, e.g. 2016-03-02T18:15:00"}), 400
+
+    try:
+        matrix = get_travel_matrix()
+        if matrix is None:
+            return jsonify({"error": "ETA matrix not built; run python3 scripts/eta_matrix.py build"}), 503
+        result = matrix.eta(*coords, at)
+        if result["from_zone"] is None or result["to_zone"] is None:
+            return jsonify({"error": f"Both points must lie within {ETA_BBOX} (min_lat, min_lon, max_lat, max_lon)"}), 400
+        if "eta_min" not in result:
+            return jsonify({"error": "No trips recorded at this hour of the week"}), 404
+        result["at"] = at.isoformat()
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+MAX_ANOMALY_PAGE = 1000
+
+
+@insights_bp.route('/anomalies', methods=['GET'])
+@cached_response()
+def get_anomalies():
+    """Flagged trips, newest first. Pass back ``next_cursor`` as ``cursor`` for the next page."""
+    limit = request.args.get('limit', default=100, type=int)
+    after = request.args.get('cursor', type=int)
+    metric = request.args.get('metric')
+    vendor = request.args.get('vendor')
+
+    if limit < 1 or limit > MAX_ANOMALY_PAGE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_ANOMALY_PAGE}"}), 400
+    if metric and metric not in FLAG_BITS:
+        return jsonify({"error": f"metric must be one of {', '.join(FLAG_BITS)}"}), 400
+
+    where = "WHERE 1=1"
+    params = []
+    if after is not None:
+        where += " AND a.anomaly_id < %s"
+        params.append(after)
+    if metric:
+        where += " AND a.flags & %s"
+        params.append(FLAG_BITS[metric])
+    if vendor:
+        where += " AND a.vendor_id = %s"
+        params.append(vendor)
+
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute(f"""
+                SELECT a.anomaly_id, a.vendor_id, a.pickup_datetime, a.dropoff_datetime, a.flags,
+                       a.duration_z, a.speed_z, a.distance_z, a.trip_id
+                FROM trip_anomalies a
+                {where}
+                ORDER BY a.anomaly_id DESC
+                LIMIT %s
+            """, params + [limit + 1])
+            anomalies = cursor.fetchall()
+
+        next_cursor = None
+        if len(anomalies) > limit:
+            anomalies = anomalies[:limit]
+            next_cursor = str(anomalies[-1]["anomaly_id"])
+        for row in anomalies:
+            row["flags"] = flag_names(row["flags"])
+
+        return jsonify({"anomalies": anomalies, "next_cursor": next_cursor, "limit": limit})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
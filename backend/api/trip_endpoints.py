@@ -1,101 +1,470 @@
-from flask import Blueprint, jsonify, request
-from backend.config.db_connection import get_db_cursor
-from backend.utils.db_insert import insert_from_csv, insert_dataframe
+import base64
+import json
+import os
+from datetime import datetime
+import pandas as pd
+from flask import Blueprint, Response, jsonify, request, url_for
+from backend.config.db_connection import DB_BACKEND, db_cursor, get_pool
+from backend.utils.db_insert import CLEANED_FILE_DEFAULT
+from backend.utils.efficiency_algorithm import top_k_streaming
+from backend.utils.ingest_jobs import QueueFullError, cancel_job, get_job, submit_job
+from backend.utils.geo_grid import (
+    bbox_for_radius, cell_range_sql, cell_ranges_for_bbox, haversine_sql,
+)
+from backend.utils.response_cache import cached_response, get_cache, versioned_key
+from backend.utils.trip_export import EXPORT_BATCH_ROWS, EXPORT_FORMATS, encode_batches, gzip_stream
 
 trips_bp = Blueprint('trips', __name__)
 
+# Sortable columns for cursor pagination, each backed by an index. The
+# select expression returns FLOAT columns as exact doubles so the value in
+# the cursor compares equal to the stored one when seeking.
+SORT_COLUMNS = {
+    "trip_id": "trip_id",
+    "pickup_datetime": "pickup_datetime",
+    "speed_kmh": "speed_kmh + 0E0",
+}
+
+COUNT_CACHE_TTL = float(os.getenv("TRIPS_COUNT_CACHE_TTL", "60"))
+
+
+def _trip_filters(min_speed=None, max_speed=None, start=None, end=None, vendor=None, passenger_count=None):
+    """Return the WHERE clause and params shared by the page, count and export queries.
+
+    ``start``/``end`` bound pickup_datetime (end is exclusive), which lets a
+    partitioned trips table prune to the months they cover.
+    """
+    where = "WHERE 1=1"
+    params = []
+
+    if min_speed is not None:
+        where += " AND speed_kmh >= %s"
+        params.append(min_speed)
+
+    if max_speed is not None:
+        where += " AND speed_kmh <= %s"
+        params.append(max_speed)
+
+    if start is not None:
+        where += " AND pickup_datetime >= %s"
+        params.append(start)
+
+    if end is not None:
+        where += " AND pickup_datetime < %s"
+        params.append(end)
+
+    if vendor:
+        where += " AND vendor_id = %s"
+        params.append(vendor)
+
+    if passenger_count is not None:
+        where += " AND passenger_count = %s"
+        params.append(passenger_count)
+
+    return where, params
+
+
+def _time_range(args):
+    """Parse the ``start``/``end`` query args as ISO dates or datetimes."""
+    try:
+        return tuple(datetime.fromisoformat(args[name]) if args.get(name) else None
+                     for name in ('start', 'end'))
+    except ValueError:
+        raise ValueError("start and end must be ISO dates, e.g. 2016-01-31 or 2016-01-31T12:00:00")
+
+
+def _filter_args(args):
+    """_trip_filters keyword arguments from the query string, with the defaults
+    GET /api/trips and /export share. Raises ValueError for a bad start/end."""
+    start, end = _time_range(args)
+    return {
+        "min_speed": args.get('min_speed', default=0, type=float),
+        "max_speed": args.get('max_speed', type=float),
+        "start": start,
+        "end": end,
+        "vendor": args.get('vendor'),
+        "passenger_count": args.get('passenger_count', type=int),
+    }
+
+
+def encode_cursor(sort, order, sort_value, trip_id):
+    payload = {"s": sort, "o": order, "k": sort_value, "id": trip_id}
+    raw = json.dumps(payload, default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    padded = token + "=" * (-len(token) % 4)
+    try:
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def _count_trips(cursor, where, params, mode):
+    """Total matching rows: 'exact' (cached per filter set and data version),
+    'approx' (planner estimate) or 'none'. SQLite keeps no row estimates, so
+    'approx' gives None there rather than a full count."""
+    if mode == "none" or (mode == "approx" and DB_BACKEND == "sqlite"):
+        return None
+    if mode == "approx":
+        cursor.execute(f"EXPLAIN SELECT trip_id FROM trips {where}", params)
+        plan = cursor.fetchall()
+        return int(plan[0]["rows"]) if plan else 0
+
+    cache = get_cache()
+    key = versioned_key("trips-count", where, params)
+    count = cache.get(key) if cache else None
+    if count is not None:
+        return count
+
+    cursor.execute(f"SELECT COUNT(*) as count FROM trips {where}", params)
+    count = cursor.fetchone()['count']
+    if cache:
+        cache.set(key, count, COUNT_CACHE_TTL)
+    return count
+
+
 @trips_bp.route('/', methods=['GET'])
 def get_trips():
     limit = request.args.get('limit', default=100, type=int)
     offset = request.args.get('offset', default=0, type=int)
-    min_speed = request.args.get('min_speed', default=0, type=float)
-    max_speed = request.args.get('max_speed', type=float)
-
-    conn, cursor = get_db_cursor()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
+    count_mode = request.args.get('count', default='exact')
+    use_cursor = 'cursor' in request.args
+    token = request.args.get('cursor', default='')
+    sort = request.args.get('sort', default='trip_id')
+    order = request.args.get('order', default='asc').lower()
 
+    if count_mode not in ("exact", "approx", "none"):
+        return jsonify({"error": "count must be one of exact, approx, none"}), 400
+    if sort not in SORT_COLUMNS:
+        return jsonify({"error": f"sort must be one of {', '.join(SORT_COLUMNS)}"}), 400
+    if order not in ("asc", "desc"):
+        return jsonify({"error": "order must be asc or desc"}), 400
     try:
-        query = "SELECT * FROM trips WHERE 1=1"
-        params = []
+        filters = _filter_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        if min_speed is not None:
-            query += " AND speed_kmh >= %s"
-            params.append(min_speed)
+    after = None
+    if use_cursor and token:
+        try:
+            after = decode_cursor(token)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if after.get("s") != sort or after.get("o") != order:
+            return jsonify({"error": "Cursor does not match sort/order"}), 400
 
-        if max_speed is not None:
-            query += " AND speed_kmh <= %s"
-            params.append(max_speed)
+    try:
+        with db_cursor() as (conn, cursor):
+            where, params = _trip_filters(**filters)
+
+            if not use_cursor:
+                cursor.execute(f"SELECT * FROM trips {where} LIMIT %s OFFSET %s", params + [limit, offset])
+                trips = cursor.fetchall()
+                total_count = _count_trips(cursor, where, params, count_mode)
 
-        query += " LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
+                return jsonify({
+                    "trips": trips,
+                    "total_count": total_count,
+                    "total_count_approximate": count_mode == "approx",
+                    "limit": limit,
+                    "offset": offset
+                })
 
-        cursor.execute(query, params)
-        trips = cursor.fetchall()
+            # Keyset pagination: seek past the last (sort key, trip_id) seen
+            # instead of scanning and discarding OFFSET rows.
+            cmp = ">" if order == "asc" else "<"
+            direction = "ASC" if order == "asc" else "DESC"
+            page_where, page_params = where, list(params)
+            if after is not None:
+                if sort == "trip_id":
+                    page_where += f" AND trip_id {cmp} %s"
+                    page_params.append(after["id"])
+                else:
+                    page_where += f" AND ({sort} {cmp} %s OR ({sort} = %s AND trip_id {cmp} %s))"
+                    page_params.extend([after["k"], after["k"], after["id"]])
 
-        count_query = "SELECT COUNT(*) as count FROM trips WHERE 1=1"
-        count_params = []
+            order_by = "trip_id" if sort == "trip_id" else f"{sort} {direction}, trip_id"
+            cursor.execute(
+                f"SELECT *, {SORT_COLUMNS[sort]} AS _sort_key FROM trips {page_where} "
+                f"ORDER BY {order_by} {direction} LIMIT %s",
+                page_params + [limit + 1],
+            )
+            trips = cursor.fetchall()
 
-        if min_speed is not None:
-            count_query += " AND speed_kmh >= %s"
-            count_params.append(min_speed)
-        if max_speed is not None:
-            count_query += " AND speed_kmh <= %s"
-            count_params.append(max_speed)
+            next_cursor = None
+            if len(trips) > limit:
+                trips = trips[:limit]
+                last = trips[-1]
+                next_cursor = encode_cursor(sort, order, last["_sort_key"], last["trip_id"])
+            for trip in trips:
+                trip.pop("_sort_key", None)
 
-        cursor.execute(count_query, count_params)
-        total_count = cursor.fetchone()['count']
+            total_count = _count_trips(cursor, where, params, count_mode)
 
         return jsonify({
             "trips": trips,
+            "next_cursor": next_cursor,
+            "sort": sort,
+            "order": order,
             "total_count": total_count,
-            "limit": limit,
-            "offset": offset
+            "total_count_approximate": count_mode == "approx",
+            "limit": limit
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
+
+# Seconds the server waits on a slow export client before aborting the query
+EXPORT_NET_WRITE_TIMEOUT = int(os.getenv("EXPORT_NET_WRITE_TIMEOUT", "600"))
+
+
+@trips_bp.route('/export', methods=['GET'])
+def export_trips():
+    """Stream every matching trip as NDJSON or CSV, optionally gzip-compressed.
+
+    Rows come from an unbuffered cursor in batches of EXPORT_BATCH_ROWS, so
+    memory stays flat however many rows are exported. Takes the same
+    filters as GET /api/trips.
+    """
+    fmt = request.args.get('format', default='ndjson')
+    compress = request.args.get('gzip', default='0') in ('1', 'true', 'yes')
+
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+
+    try:
+        filters = _filter_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    where, params = _trip_filters(**filters)
+
+    pool = get_pool()
+    try:
+        conn = pool.acquire()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SET SESSION net_write_timeout = %s", (EXPORT_NET_WRITE_TIMEOUT,))
+        cursor.execute(f"SELECT * FROM trips {where}", params)
+        columns = [d[0] for d in cursor.description]
+    except Exception as e:
+        pool.release(conn, discard=True)
+        return jsonify({"error": str(e)}), 500
+
+    state = {"finished": False}
+
+    def batches():
+        while True:
+            batch = cursor.fetchmany(EXPORT_BATCH_ROWS)
+            if not batch:
+                break
+            yield batch
+        cursor.execute("SET SESSION net_write_timeout = DEFAULT")
+        state["finished"] = True
+
+    def release():
+        # A client that disconnects early leaves unread rows on the wire;
+        # that connection cannot be reused
+        if state["finished"]:
+            cursor.close()
+        pool.release(conn, discard=not state["finished"])
+
+    rows = encode_batches(batches(), columns, fmt)
+    resp = Response(gzip_stream(rows) if compress else rows, mimetype=EXPORT_FORMATS[fmt])
+    resp.call_on_close(release)
+    resp.headers["Content-Disposition"] = f"attachment; filename=trips.{fmt}{'.gz' if compress else ''}"
+    if compress:
+        resp.headers["Content-Encoding"] = "gzip"
+    return resp
+
 
 @trips_bp.route('/ingest', methods=['POST'])
 def ingest_trips():
+    """Start a background ingest job; poll the returned status_url for progress."""
     try:
         data = request.get_json(silent=True) or {}
-        csv_path = data.get('csv_path') if isinstance(data, dict) else None
-        inserted = insert_from_csv(csv_path)
-        return jsonify({"inserted": inserted}), 201
+        if not isinstance(data, dict):
+            data = {}
+        csv_path = data.get('csv_path') or CLEANED_FILE_DEFAULT
+        job_id = submit_job(csv_path, force=bool(data.get('force')))
+        return jsonify({"job_id": job_id, "status": "queued",
+                        "status_url": url_for('trips.get_ingest_job', job_id=job_id)}), 202
     except FileNotFoundError:
         return jsonify({"error": "CSV file not found"}), 400
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 429
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@trips_bp.route('/ingest/<job_id>', methods=['GET'])
+def get_ingest_job(job_id):
+    try:
+        job = get_job(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@trips_bp.route('/ingest/<job_id>/cancel', methods=['POST'])
+def cancel_ingest_job(job_id):
+    try:
+        status = cancel_job(job_id)
+        if status is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify({"job_id": job_id, "status": status, "cancel_requested": True}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _spatial_columns(by):
+    if by not in ("pickup", "dropoff"):
+        raise ValueError("by must be pickup or dropoff")
+    return f"{by}_latitude", f"{by}_longitude", f"{by}_cell"
+
+
+@trips_bp.route('/near', methods=['GET'])
+def get_trips_near():
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    radius_km = request.args.get('radius_km', default=1.0, type=float)
+    limit = request.args.get('limit', default=100, type=int)
+    by = request.args.get('by', default='pickup')
+
+    if lat is None or lon is None:
+        return jsonify({"error": "lat and lon are required"}), 400
+    if radius_km <= 0:
+        return jsonify({"error": "radius_km must be positive"}), 400
+
+    try:
+        lat_col, lon_col, cell_col = _spatial_columns(by)
+        min_lat, min_lon, max_lat, max_lon = bbox_for_radius(lat, lon, radius_km)
+        ranges = cell_ranges_for_bbox(min_lat, min_lon, max_lat, max_lon)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Cell ranges pick candidates from the index; the bbox and exact
+    # haversine distance then trim them to the circle. The distance filter
+    # sits on a derived table so both backends can refer to the alias.
+    cell_clause, cell_params = cell_range_sql(cell_col, ranges)
+    query = (
+        f"SELECT * FROM (SELECT *, {haversine_sql(lat_col, lon_col)} AS distance_km FROM trips "
+        f"WHERE {cell_clause} AND {lat_col} BETWEEN %s AND %s AND {lon_col} BETWEEN %s AND %s) AS candidates "
+        f"WHERE distance_km <= %s ORDER BY distance_km LIMIT %s"
+    )
+    params = [lat, lat, lon] + cell_params + [min_lat, max_lat, min_lon, max_lon, radius_km, limit]
+
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute(query, params)
+            trips = cursor.fetchall()
+        return jsonify({"trips": trips, "count": len(trips), "cell_ranges": len(ranges)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@trips_bp.route('/bbox', methods=['GET'])
+def get_trips_in_bbox():
+    bounds = [request.args.get(k, type=float) for k in ('min_lat', 'min_lon', 'max_lat', 'max_lon')]
+    limit = request.args.get('limit', default=100, type=int)
+    by = request.args.get('by', default='pickup')
+
+    if any(b is None for b in bounds):
+        return jsonify({"error": "min_lat, min_lon, max_lat and max_lon are required"}), 400
+
+    min_lat, min_lon, max_lat, max_lon = bounds
+    try:
+        lat_col, lon_col, cell_col = _spatial_columns(by)
+        ranges = cell_ranges_for_bbox(min_lat, min_lon, max_lat, max_lon)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cell_clause, cell_params = cell_range_sql(cell_col, ranges)
+    query = (
+        f"SELECT * FROM trips WHERE {cell_clause} "
+        f"AND {lat_col} BETWEEN %s AND %s AND {lon_col} BETWEEN %s AND %s LIMIT %s"
+    )
+    params = cell_params + [min_lat, max_lat, min_lon, max_lon, limit]
+
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute(query, params)
+            trips = cursor.fetchall()
+        return jsonify({"trips": trips, "count": len(trips), "cell_ranges": len(ranges)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+EFFICIENCY_CHUNK_ROWS = 50000
+MAX_EFFICIENT_K = 1000
+
+
+@trips_bp.route('/efficient', methods=['GET'])
+@cached_response()
+def get_efficient_trips():
+    k = request.args.get('k', default=10, type=int)
+    vendor = request.args.get('vendor')
+    hour = request.args.get('hour', type=int)
+
+    if k < 1 or k > MAX_EFFICIENT_K:
+        return jsonify({"error": f"k must be between 1 and {MAX_EFFICIENT_K}"}), 400
+    if hour is not None and not 0 <= hour <= 23:
+        return jsonify({"error": "hour must be between 0 and 23"}), 400
+
+    where = "WHERE 1=1"
+    params = []
+    if vendor:
+        where += " AND vendor_id = %s"
+        params.append(vendor)
+    if hour is not None:
+        where += " AND HOUR(pickup_datetime) = %s"
+        params.append(hour)
+
+    # trips stores fare_per_km rather than the fare; rebuild it for the scorer
+    query = (
+        "SELECT trip_id, vendor_id, pickup_datetime, trip_distance_km, trip_duration_min, "
+        f"fare_per_km * trip_distance_km AS fare_amount FROM trips {where}"
+    )
+
+    try:
+        with db_cursor(dictionary=False) as (conn, cursor):
+            cursor.execute(query, params)
+            columns = [d[0] for d in cursor.description]
+
+            def chunks():
+                while True:
+                    rows = cursor.fetchmany(EFFICIENCY_CHUNK_ROWS)
+                    if not rows:
+                        return
+                    yield pd.DataFrame.from_records(rows, columns=columns)
+
+            ranked = top_k_streaming(chunks(), k)
+        return jsonify({"trips": ranked, "k": k})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @trips_bp.route('/<int:trip_id>', methods=['GET'])
 def get_trip(trip_id):
-    conn, cursor = get_db_cursor()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
     try:
-        query = "SELECT * FROM trips WHERE trip_id = %s"
-        cursor.execute(query, (trip_id,))
-        trip = cursor.fetchone()
+        with db_cursor() as (conn, cursor):
+            query = "SELECT * FROM trips WHERE trip_id = %s"
+            cursor.execute(query, (trip_id,))
+            trip = cursor.fetchone()
         if trip:
             return jsonify(trip)
         else:
             return jsonify({"error": "Trip not found"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 if __name__ == "__main__":
     print("Testing database connection...")
-    conn, cursor = get_db_cursor()
-    if conn:
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
         print("Database connection successful!")
-        cursor.close()
-        conn.close()
-    else:
-        print("Database connection failed!")
+    except Exception as e:
+        print(f"Database connection failed! {e}")
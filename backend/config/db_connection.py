@@ -1,12 +1,31 @@
 import mysql.connector
 from mysql.connector import MySQLConnection
-from typing import Optional, Tuple
+from contextlib import contextmanager
+from collections import deque
+from typing import Iterator, Optional, Tuple
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+from backend.config import sqlite_backend
+from backend.utils.metrics import (
+    METRICS_ENABLED, instrument_connection, observe_acquire, unwrap_connection,
+)
+
 load_dotenv()
 
+# "mysql" (the server in DB_HOST/DB_NAME) or "sqlite" (the embedded file in
+# SQLITE_PATH, see backend/config/sqlite_backend.py)
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+if DB_BACKEND not in ("mysql", "sqlite"):
+    raise ValueError(f"DB_BACKEND must be mysql or sqlite, not {DB_BACKEND!r}")
+
+DB_ERRORS = (mysql.connector.Error, sqlite_backend.Error)
+
 def get_db_config() -> dict:
+    if DB_BACKEND == "sqlite":
+        return {"database": sqlite_backend.SQLITE_PATH}
     return {
         "host": os.getenv("DB_HOST", "localhost"),
         "user": os.getenv("DB_USER", "nyc_user"),
@@ -14,22 +33,228 @@ def get_db_config() -> dict:
         "database": os.getenv("DB_NAME", "trip_data"),
     }
 
-def get_db_connection() -> Optional[MySQLConnection]:
-    """Return a new MySQL connection using config."""
+def get_pool_config() -> dict:
+    """Pool sizing knobs, read from the environment like the DB credentials."""
+    return {
+        "size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_POOL_MAX_OVERFLOW", "10")),
+        "timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "recycle": float(os.getenv("DB_POOL_RECYCLE", "3600")),
+        "pre_ping": os.getenv("DB_POOL_PRE_PING", "1").lower() in ("1", "true", "yes"),
+    }
+
+def connect(**config) -> MySQLConnection:
+    """Open a connection on the configured backend; both speak the mysql-connector API."""
+    if DB_BACKEND == "sqlite":
+        return sqlite_backend.connect(**config)
+    return mysql.connector.connect(**config)
+
+def get_db_connection(**overrides) -> Optional[MySQLConnection]:
+    """Return a new, unpooled connection using config (plus any overrides)."""
     try:
-        config = get_db_config()
-        
-        conn = mysql.connector.connect(**config)
-        print("connected to DB")
-        return conn
-    except mysql.connector.Error as error:
-        print(f"Error connecting to MySQL: {error}")
+        config = {**get_db_config(), **overrides}
+        return instrument_connection(connect(**config))
+    except DB_ERRORS as error:
+        print(f"Error connecting to the database: {error}")
         return None
 
-def get_db_cursor() -> Tuple[Optional[MySQLConnection], Optional[mysql.connector.cursor.MySQLCursor]]:
-    """Return a connection and a dictionary cursor (if connection works)."""
-    conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        return conn, cursor
-    return None, None
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no connection could be checked out within the pool timeout."""
+
+
+class ConnectionPool:
+    """Thread-safe pool of database connections.
+
+    Keeps up to ``size`` idle connections around and allows ``max_overflow``
+    extra ones under load; overflow connections are closed on release.
+    Connections older than ``recycle`` seconds are replaced, and with
+    ``pre_ping`` every borrowed connection is pinged before it is handed out.
+    """
+
+    def __init__(self, size: int = 5, max_overflow: int = 10, timeout: float = 30.0,
+                 recycle: float = 3600.0, pre_ping: bool = True, db_config: Optional[dict] = None):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.db_config = db_config or get_db_config()
+
+        self._idle: deque = deque()
+        self._created_at: dict = {}
+        self._open = 0
+        self._cond = threading.Condition()
+
+        self._waiters = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._recycled = 0
+        self._failed_pings = 0
+
+    def _connect(self) -> MySQLConnection:
+        conn = connect(**self.db_config)
+        self._created_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn: MySQLConnection) -> None:
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn: MySQLConnection) -> bool:
+        created = self._created_at.get(id(conn), 0.0)
+        # Runs outside the pool lock (see acquire); take it for the counters
+        if self.recycle >= 0 and time.monotonic() - created > self.recycle:
+            with self._cond:
+                self._recycled += 1
+            return False
+        if self.pre_ping:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                with self._cond:
+                    self._failed_pings += 1
+                return False
+        return True
+
+    def acquire(self) -> MySQLConnection:
+        """Check out a connection, blocking up to ``timeout`` seconds."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            self._waiters += 1
+            try:
+                while True:
+                    if self._idle:
+                        conn = self._idle.pop()
+                        break
+                    if self._open < self.size + self.max_overflow:
+                        self._open += 1
+                        conn = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available within {self.timeout}s")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters -= 1
+
+        # Connecting and pinging happen outside the lock so other threads
+        # are not serialized behind network round-trips.
+        try:
+            if conn is not None and not self._is_usable(conn):
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        if METRICS_ENABLED:
+            observe_acquire(waited)
+            return instrument_connection(conn)
+        return conn
+
+    def release(self, conn: MySQLConnection, discard: bool = False) -> None:
+        """Return a connection to the pool, closing it if broken or overflow."""
+        conn = unwrap_connection(conn)
+        if not discard:
+            try:
+                # End any implicit read snapshot so the next borrower sees fresh data.
+                if conn.in_transaction:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            if discard or len(self._idle) >= self.size:
+                self._open -= 1
+                self._discard(conn)
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        with self._cond:
+            while self._idle:
+                self._open -= 1
+                self._discard(self._idle.pop())
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "waiters": self._waiters,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "recycled": self._recycled,
+                "failed_pings": self._failed_pings,
+                "avg_wait_ms": (self._wait_total / self._checkouts * 1000.0) if self._checkouts else 0.0,
+                "max_wait_ms": self._wait_max * 1000.0,
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide pool, creating it lazily (and again after fork)."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool(**get_pool_config())
+                _pool_pid = pid
+    return _pool
+
+def get_pool_stats() -> dict:
+    return get_pool().stats()
+
+@contextmanager
+def db_connection() -> Iterator[MySQLConnection]:
+    """Borrow a pooled connection for the duration of a ``with`` block."""
+    pool = get_pool()
+    conn = pool.acquire()
+    discard = False
+    try:
+        yield conn
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            discard = True
+        raise
+    finally:
+        pool.release(conn, discard=discard)
+
+@contextmanager
+def db_cursor(dictionary: bool = True) -> Iterator[Tuple[MySQLConnection, mysql.connector.cursor.MySQLCursor]]:
+    """Borrow a pooled connection and a (dictionary) cursor on it."""
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=dictionary)
+        try:
+            yield conn, cursor
+        finally:
+            cursor.close()
@@ -0,0 +1,288 @@
+"""
+Embedded SQLite storage backend (DB_BACKEND=sqlite).
+
+The rest of the code base talks to the database through mysql-connector
+style connections and MySQL-flavoured SQL. SQLiteConnection offers the same
+surface (cursor(dictionary=...), commit, rollback, ping, in_transaction,
+%s placeholders, rowcount/description/fetchmany) over one SQLite file, and
+translate() rewrites the MySQL-only constructs the queries use:
+
+    INSERT IGNORE                     -> INSERT OR IGNORE
+    ON DUPLICATE KEY UPDATE c = c     -> ON CONFLICT DO NOTHING
+    ON DUPLICATE KEY UPDATE VALUES(c) -> ON CONFLICT DO UPDATE SET excluded.c
+    HOUR(col)                         -> CAST(substr(col, 12, 2) AS INTEGER)
+    CAST(x AS SIGNED), GREATEST, IF, NOW(3), CURRENT_TIMESTAMP, TIMESTAMPDIFF
+    ... FOR UPDATE                    -> (dropped; writers are serialized)
+    SET SESSION foreign_key_checks    -> PRAGMA foreign_keys, other SET SESSION: no-op
+
+Queries whose meaning differs between the two (EXPLAIN row estimates,
+HAVING on a select alias without GROUP BY) are written per backend or in
+SQL both accept instead of being rewritten here.
+
+The database is created from database_setup_sqlite.sql on first connect and
+runs in WAL mode, so readers never block the (single) writer. Writes start
+with BEGIN IMMEDIATE, and concurrent writers queue on SQLITE_BUSY_TIMEOUT.
+DATETIME/DATE columns come back as datetime/date objects, as from MySQL.
+"""
+import math
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(BASE_DIR, "data/trip_data.sqlite3"))
+SCHEMA_FILE = os.path.join(BASE_DIR, "database/database_setup_sqlite.sql")
+
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "60"))
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "256"))
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "1024"))
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    # Durable at every WAL checkpoint; a power cut can only lose the last commits
+    "synchronous": "NORMAL",
+    "cache_size": -SQLITE_CACHE_MB * 1024,
+    "mmap_size": SQLITE_MMAP_MB * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+
+_LOCAL_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+
+# Parameter types the sqlite3 module does not bind by itself
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+sqlite3.register_adapter(pd.Timestamp, lambda d: d.isoformat(" "))
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(Decimal, float)
+for _t in (np.int8, np.int16, np.int32, np.int64, np.uint8, np.uint16, np.uint32, np.uint64):
+    sqlite3.register_adapter(_t, int)
+sqlite3.register_adapter(np.float32, float)
+sqlite3.register_adapter(np.bool_, int)
+
+sqlite3.register_converter("DATETIME", lambda b: datetime.fromisoformat(b.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda b: datetime.fromisoformat(b.decode()))
+sqlite3.register_converter("DATE", lambda b: date.fromisoformat(b.decode()))
+
+Error = sqlite3.Error
+
+
+def _call_spans(sql: str, name: str):
+    """(start, end, args) of each top-level ``name(...)`` call, last first."""
+    spans = []
+    for m in re.finditer(rf"\b{name}\s*\(", sql, re.IGNORECASE):
+        depth, args, arg_start = 1, [], m.end()
+        for i in range(m.end(), len(sql)):
+            ch = sql[i]
+            if ch == "(":
+                depth += 1
+            elif ch == ")":
+                depth -= 1
+                if depth == 0:
+                    args.append(sql[arg_start:i].strip())
+                    spans.append((m.start(), i + 1, [a for a in args if a]))
+                    break
+            elif ch == "," and depth == 1:
+                args.append(sql[arg_start:i].strip())
+                arg_start = i + 1
+    return reversed(spans)
+
+
+def _rewrite_calls(sql: str, name: str, rewrite) -> str:
+    for start, end, args in _call_spans(sql, name):
+        sql = sql[:start] + rewrite(args) + sql[end:]
+    return sql
+
+
+def _upsert(assignments: str) -> str:
+    parts = [p.strip() for p in assignments.split(",")]
+    if all(re.fullmatch(r"(\w+)\s*=\s*\1", p) for p in parts):
+        return "ON CONFLICT DO NOTHING"
+    return "ON CONFLICT DO UPDATE SET " + re.sub(r"\bVALUES\((\w+)\)", r"excluded.\1", assignments)
+
+
+@lru_cache(maxsize=1024)
+def translate(sql: str) -> Optional[str]:
+    """SQLite form of a MySQL statement; None for statements with no SQLite meaning."""
+    stripped = sql.strip()
+    session = re.fullmatch(r"SET SESSION foreign_key_checks\s*=\s*(\d)", stripped, re.IGNORECASE)
+    if session:
+        return f"PRAGMA foreign_keys = {session.group(1)}"
+    if re.match(r"SET SESSION\b", stripped, re.IGNORECASE):
+        return None
+
+    sql = sql.replace("%s", "?")
+    sql = re.sub(r"\bINSERT IGNORE\b", "INSERT OR IGNORE", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bON DUPLICATE KEY UPDATE\s+(.*)$", lambda m: _upsert(m.group(1)), sql,
+                 flags=re.IGNORECASE | re.DOTALL)
+    sql = re.sub(r"\s+FOR UPDATE\s*$", "", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bAS SIGNED\)", "AS INTEGER)", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bCURRENT_TIMESTAMP\b(\(\d?\))?", _LOCAL_NOW, sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bRAND\(\)", "RANDOM()", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bGREATEST\(", "MAX(", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bLEAST\(", "MIN(", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bIF\(", "IIF(", sql, flags=re.IGNORECASE)
+    # Stored datetimes are 'YYYY-MM-DD HH:MM:SS' text, so the hour is a substring
+    sql = _rewrite_calls(sql, "HOUR", lambda a: f"CAST(substr({a[0]}, 12, 2) AS INTEGER)")
+    sql = _rewrite_calls(sql, "NOW", lambda a: _LOCAL_NOW)
+    sql = _rewrite_calls(
+        sql, "TIMESTAMPDIFF",
+        lambda a: f"((julianday({a[2]}) - julianday({a[1]})) * "
+                  f"{86400000000 if a[0].upper() == 'MICROSECOND' else 86400})")
+
+    return sql
+
+
+class SQLiteCursor:
+    """mysql-connector style cursor; ``dictionary`` rows are dicts keyed by column."""
+
+    def __init__(self, raw: sqlite3.Cursor, dictionary: bool = False):
+        self._cursor = raw
+        self._dictionary = dictionary
+        self._names = None
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def execute(self, operation: str, params=()) -> None:
+        sql = translate(operation)
+        self._names = None
+        if sql is not None:
+            self._cursor.execute(sql, tuple(params or ()))
+            if self._dictionary and self._cursor.description:
+                self._names = [d[0] for d in self._cursor.description]
+
+    def executemany(self, operation: str, seq_params) -> None:
+        sql = translate(operation)
+        self._names = None
+        if sql is not None:
+            self._cursor.executemany(sql, seq_params)
+
+    def _rows(self, rows):
+        return [dict(zip(self._names, r)) for r in rows] if self._names else rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return dict(zip(self._names, row)) if self._names and row is not None else row
+
+    def fetchmany(self, size: Optional[int] = None):
+        return self._rows(self._cursor.fetchmany(size or self._cursor.arraysize))
+
+    def fetchall(self):
+        return self._rows(self._cursor.fetchall())
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """mysql-connector style connection over one SQLite database file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(
+            path, timeout=SQLITE_BUSY_TIMEOUT, detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level="IMMEDIATE", check_same_thread=False)
+        for name, value in PRAGMAS.items():
+            self._conn.execute(f"PRAGMA {name} = {value}")
+        _add_math_functions(self._conn)
+
+    def cursor(self, dictionary: bool = False, **kwargs) -> SQLiteCursor:
+        return SQLiteCursor(self._conn.cursor(), dictionary=dictionary)
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._conn.in_transaction
+
+    def ping(self, reconnect: bool = False, **kwargs) -> None:
+        self._conn.execute("SELECT 1")
+
+    def is_connected(self) -> bool:
+        try:
+            self.ping()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def rollback(self) -> None:
+        self._conn.rollback()
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _add_math_functions(conn: sqlite3.Connection) -> None:
+    """Register the functions haversine_sql uses when SQLite was built without them."""
+    try:
+        conn.execute("SELECT asin(0), sqrt(1), pow(2, 2), radians(0), sin(0), cos(0)")
+        return
+    except sqlite3.OperationalError:
+        pass
+    for name, fn in (("ASIN", math.asin), ("SQRT", math.sqrt), ("SIN", math.sin), ("COS", math.cos),
+                     ("RADIANS", math.radians)):
+        conn.create_function(name, 1, fn, deterministic=True)
+    conn.create_function("POW", 2, math.pow, deterministic=True)
+
+
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def init_schema(conn: sqlite3.Connection) -> bool:
+    """Create the tables and indexes if the database is empty. Returns True if it was."""
+    exists = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trips'"
+    if conn.execute(exists).fetchone():
+        return False
+    with open(SCHEMA_FILE) as f:
+        schema = f.read()
+    try:
+        # One write transaction, so another process never sees half a schema
+        conn.executescript(f"BEGIN IMMEDIATE;\n{schema}\nCOMMIT;")
+    except sqlite3.OperationalError:
+        conn.rollback()
+        if conn.execute(exists).fetchone():  # another process created it first
+            return False
+        raise
+    return True
+
+
+def connect(database: str = SQLITE_PATH, **kwargs) -> SQLiteConnection:
+    """Open ``database`` (a file path), creating the schema on first use.
+
+    MySQL-only options (host, user, allow_local_infile, ...) are ignored.
+    """
+    if os.path.dirname(database):
+        os.makedirs(os.path.dirname(database), exist_ok=True)
+    conn = SQLiteConnection(database)
+    key = os.path.abspath(database)
+    if key not in _initialized:
+        with _init_lock:
+            if key not in _initialized:
+                init_schema(conn._conn)
+                _initialized.add(key)
+    return conn
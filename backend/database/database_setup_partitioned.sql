@@ -0,0 +1,167 @@
+-- Variant of database_setup.sql with trips RANGE-partitioned by pickup month
+-- (see backend/utils/partitions.py). Use one file or the other. Partitioned
+-- tables cannot have foreign keys, so trips has no fk_vendor here. Add
+-- partitions ahead of new data with: python3 scripts/partitions.py ensure
+-- To convert an existing database: python3 scripts/partitions.py migrate
+CREATE DATABASE IF NOT EXISTS trip_data;
+USE trip_data;
+
+CREATE TABLE vendors (
+    vendor_id VARCHAR(10) PRIMARY KEY,
+    vendor_name VARCHAR(100)
+);
+
+CREATE TABLE trips (
+    trip_id INT AUTO_INCREMENT,
+    
+    vendor_id VARCHAR(10) NOT NULL,
+    
+    pickup_datetime DATETIME NOT NULL,
+    dropoff_datetime DATETIME NOT NULL,
+    
+    passenger_count INT NOT NULL CHECK (passenger_count >= 1),
+    
+    pickup_longitude FLOAT NOT NULL CHECK (pickup_longitude BETWEEN -180 AND 180) COMMENT 'Longitude in degrees',
+    pickup_latitude FLOAT NOT NULL CHECK (pickup_latitude BETWEEN -90 AND 90) COMMENT 'Latitude in degrees',
+    
+    dropoff_longitude FLOAT NOT NULL CHECK (dropoff_longitude BETWEEN -180 AND 180),
+    dropoff_latitude FLOAT NOT NULL CHECK (dropoff_latitude BETWEEN -90 AND 90),
+    
+    store_and_fwd_flag CHAR(1) DEFAULT 'N' CHECK (store_and_fwd_flag IN ('Y','N')),
+    
+    trip_duration INT NOT NULL CHECK (trip_duration > 0),
+    trip_distance_km FLOAT NOT NULL CHECK (trip_distance_km >= 0),
+    trip_duration_min FLOAT NOT NULL CHECK (trip_duration_min > 0),
+    speed_kmh FLOAT NOT NULL,
+    fare_per_km FLOAT CHECK (fare_per_km >= 0),
+
+    pickup_cell BIGINT COMMENT 'Grid cell id, see backend/utils/geo_grid.py',
+    dropoff_cell BIGINT COMMENT 'Grid cell id, see backend/utils/geo_grid.py',
+
+    -- Unique keys must include the partitioning column
+    PRIMARY KEY (trip_id, pickup_datetime)
+)
+PARTITION BY RANGE COLUMNS(pickup_datetime) (
+    PARTITION p201601 VALUES LESS THAN ('2016-02-01'),
+    PARTITION p201602 VALUES LESS THAN ('2016-03-01'),
+    PARTITION p201603 VALUES LESS THAN ('2016-04-01'),
+    PARTITION p201604 VALUES LESS THAN ('2016-05-01'),
+    PARTITION p201605 VALUES LESS THAN ('2016-06-01'),
+    PARTITION p201606 VALUES LESS THAN ('2016-07-01'),
+    PARTITION p201607 VALUES LESS THAN ('2016-08-01'),
+    PARTITION p201608 VALUES LESS THAN ('2016-09-01'),
+    PARTITION p201609 VALUES LESS THAN ('2016-10-01'),
+    PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+CREATE INDEX idx_pickup_datetime ON trips (pickup_datetime);
+CREATE INDEX idx_dropoff_datetime ON trips (dropoff_datetime);
+CREATE INDEX idx_passenger_count ON trips (passenger_count);
+CREATE INDEX idx_speed_kmh ON trips (speed_kmh);
+CREATE INDEX idx_vendor_time ON trips (vendor_id, pickup_datetime);
+CREATE INDEX idx_pickup_coords ON trips (pickup_latitude, pickup_longitude);
+CREATE INDEX idx_dropoff_coords ON trips (dropoff_latitude, dropoff_longitude);
+CREATE INDEX idx_pickup_cell ON trips (pickup_cell);
+CREATE INDEX idx_dropoff_cell ON trips (dropoff_cell);
+-- Natural key: makes replaying an ingest a no-op (see backend/utils/db_insert.py)
+CREATE UNIQUE INDEX uq_trip_natural ON trips (
+    vendor_id, pickup_datetime, dropoff_datetime,
+    pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude
+);
+
+-- Hourly rollups maintained by ingest (see backend/utils/rollups.py)
+CREATE TABLE trip_rollup_hourly (
+    pickup_date DATE NOT NULL,
+    pickup_hour TINYINT NOT NULL,
+    vendor_id VARCHAR(10) NOT NULL,
+    passenger_count INT NOT NULL,
+
+    trip_count BIGINT NOT NULL DEFAULT 0,
+    sum_duration_min DOUBLE NOT NULL DEFAULT 0,
+    sum_speed_kmh DOUBLE NOT NULL DEFAULT 0,
+    sum_distance_km DOUBLE NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (pickup_date, pickup_hour, vendor_id, passenger_count)
+);
+
+-- Trips flagged by the streaming detector (see backend/utils/anomaly_detection.py).
+CREATE TABLE trip_anomalies (
+    anomaly_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    trip_id INT COMMENT 'trips.trip_id of the flagged trip',
+    vendor_id VARCHAR(10) NOT NULL,
+    pickup_datetime DATETIME NOT NULL,
+    dropoff_datetime DATETIME NOT NULL,
+    pickup_cell BIGINT,
+
+    flags TINYINT UNSIGNED NOT NULL COMMENT 'bit 0 duration, bit 1 speed, bit 2 distance',
+    duration_z FLOAT,
+    speed_z FLOAT,
+    distance_z FLOAT,
+
+    detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Source files loaded by ingest and how far (see backend/utils/ingest_ledger.py)
+CREATE TABLE ingest_ledger (
+    file_path VARCHAR(512) PRIMARY KEY,
+    file_size BIGINT NOT NULL,
+    content_hash CHAR(64) NOT NULL COMMENT 'SHA-256 of the file',
+    rows_committed BIGINT NOT NULL DEFAULT 0 COMMENT 'source rows covered by committed chunks',
+    rows_inserted BIGINT NOT NULL DEFAULT 0,
+    status ENUM('loading', 'complete') NOT NULL DEFAULT 'loading',
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+    INDEX idx_ledger_hash (content_hash)
+);
+
+-- Background ingest jobs started by POST /api/trips/ingest (see backend/utils/ingest_jobs.py)
+CREATE TABLE ingest_jobs (
+    job_id CHAR(32) PRIMARY KEY,
+    file_path VARCHAR(512) NOT NULL,
+    status ENUM('queued', 'running', 'succeeded', 'failed', 'cancelled') NOT NULL DEFAULT 'queued',
+    cancel_requested TINYINT(1) NOT NULL DEFAULT 0,
+
+    total_rows BIGINT COMMENT 'exact for Parquet, estimated for CSV',
+    start_row BIGINT NOT NULL DEFAULT 0 COMMENT 'ledger offset the load resumed from',
+    rows_processed BIGINT NOT NULL DEFAULT 0,
+    rows_inserted BIGINT NOT NULL DEFAULT 0,
+    error TEXT,
+
+    created_at DATETIME(3) DEFAULT CURRENT_TIMESTAMP(3),
+    started_at DATETIME(3),
+    finished_at DATETIME(3),
+    updated_at DATETIME(3) DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3),
+
+    INDEX idx_jobs_created (created_at)
+);
+
+-- Prepared rows that would fail a NOT NULL or CHECK constraint on trips, set
+-- aside by ingest instead of failing the batch (see backend/utils/db_insert.py).
+-- Values are kept as read, so columns are loosely typed and nullable.
+CREATE TABLE trips_quarantine (
+    quarantine_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    file_path VARCHAR(512) COMMENT 'NULL for frames inserted directly',
+    source_row BIGINT NOT NULL COMMENT 'position in the source file (or frame)',
+    reason VARCHAR(32) NOT NULL COMMENT 'first constraint the row fails',
+
+    vendor_id VARCHAR(64),
+    pickup_datetime VARCHAR(64),
+    dropoff_datetime VARCHAR(64),
+    passenger_count DOUBLE,
+    pickup_longitude DOUBLE,
+    pickup_latitude DOUBLE,
+    dropoff_longitude DOUBLE,
+    dropoff_latitude DOUBLE,
+    store_and_fwd_flag CHAR(1),
+    trip_duration DOUBLE,
+    trip_distance_km DOUBLE,
+    trip_duration_min DOUBLE,
+    speed_kmh DOUBLE,
+    fare_per_km DOUBLE,
+
+    quarantined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    UNIQUE KEY uq_quarantine_source (file_path, source_row),
+    INDEX idx_quarantine_reason (reason)
+);
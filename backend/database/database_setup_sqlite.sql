@@ -0,0 +1,165 @@
+-- SQLite version of database_setup.sql, applied automatically by
+-- backend/config/sqlite_backend.py when DB_BACKEND=sqlite opens an empty file.
+-- Same tables, keys, CHECKs and indexes; ENUMs become CHECK lists and the
+-- ON UPDATE CURRENT_TIMESTAMP columns are kept up to date by triggers.
+-- Timestamps are local time, like MySQL's CURRENT_TIMESTAMP.
+
+CREATE TABLE vendors (
+    vendor_id VARCHAR(10) PRIMARY KEY,
+    vendor_name VARCHAR(100)
+);
+
+CREATE TABLE trips (
+    trip_id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+    vendor_id VARCHAR(10) NOT NULL,
+
+    pickup_datetime DATETIME NOT NULL,
+    dropoff_datetime DATETIME NOT NULL,
+
+    passenger_count INT NOT NULL CHECK (passenger_count >= 1),
+
+    pickup_longitude FLOAT NOT NULL CHECK (pickup_longitude BETWEEN -180 AND 180),
+    pickup_latitude FLOAT NOT NULL CHECK (pickup_latitude BETWEEN -90 AND 90),
+
+    dropoff_longitude FLOAT NOT NULL CHECK (dropoff_longitude BETWEEN -180 AND 180),
+    dropoff_latitude FLOAT NOT NULL CHECK (dropoff_latitude BETWEEN -90 AND 90),
+
+    store_and_fwd_flag CHAR(1) DEFAULT 'N' CHECK (store_and_fwd_flag IN ('Y','N')),
+
+    trip_duration INT NOT NULL CHECK (trip_duration > 0),
+    trip_distance_km FLOAT NOT NULL CHECK (trip_distance_km >= 0),
+    trip_duration_min FLOAT NOT NULL CHECK (trip_duration_min > 0),
+    speed_kmh FLOAT NOT NULL,
+    fare_per_km FLOAT CHECK (fare_per_km >= 0),
+
+    pickup_cell BIGINT,
+    dropoff_cell BIGINT,
+
+    CONSTRAINT fk_vendor FOREIGN KEY (vendor_id) REFERENCES vendors(vendor_id)
+);
+
+CREATE INDEX idx_pickup_datetime ON trips (pickup_datetime);
+CREATE INDEX idx_dropoff_datetime ON trips (dropoff_datetime);
+CREATE INDEX idx_passenger_count ON trips (passenger_count);
+CREATE INDEX idx_speed_kmh ON trips (speed_kmh);
+CREATE INDEX idx_vendor_time ON trips (vendor_id, pickup_datetime);
+CREATE INDEX idx_pickup_coords ON trips (pickup_latitude, pickup_longitude);
+CREATE INDEX idx_dropoff_coords ON trips (dropoff_latitude, dropoff_longitude);
+CREATE INDEX idx_pickup_cell ON trips (pickup_cell);
+CREATE INDEX idx_dropoff_cell ON trips (dropoff_cell);
+-- Natural key: makes replaying an ingest a no-op (see backend/utils/db_insert.py)
+CREATE UNIQUE INDEX uq_trip_natural ON trips (
+    vendor_id, pickup_datetime, dropoff_datetime,
+    pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude
+);
+
+-- Hourly rollups maintained by ingest (see backend/utils/rollups.py)
+CREATE TABLE trip_rollup_hourly (
+    pickup_date DATE NOT NULL,
+    pickup_hour TINYINT NOT NULL,
+    vendor_id VARCHAR(10) NOT NULL,
+    passenger_count INT NOT NULL,
+
+    trip_count BIGINT NOT NULL DEFAULT 0,
+    sum_duration_min DOUBLE NOT NULL DEFAULT 0,
+    sum_speed_kmh DOUBLE NOT NULL DEFAULT 0,
+    sum_distance_km DOUBLE NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (pickup_date, pickup_hour, vendor_id, passenger_count)
+) WITHOUT ROWID;
+
+-- Trips flagged by the streaming detector (see backend/utils/anomaly_detection.py).
+CREATE TABLE trip_anomalies (
+    anomaly_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    trip_id INTEGER,  -- trips.trip_id of the flagged trip
+    vendor_id VARCHAR(10) NOT NULL,
+    pickup_datetime DATETIME NOT NULL,
+    dropoff_datetime DATETIME NOT NULL,
+    pickup_cell BIGINT,
+
+    flags TINYINT NOT NULL CHECK (flags >= 0),  -- bit 0 duration, bit 1 speed, bit 2 distance
+    duration_z FLOAT,
+    speed_z FLOAT,
+    distance_z FLOAT,
+
+    detected_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+-- Source files loaded by ingest and how far (see backend/utils/ingest_ledger.py)
+CREATE TABLE ingest_ledger (
+    file_path VARCHAR(512) PRIMARY KEY,
+    file_size BIGINT NOT NULL,
+    content_hash CHAR(64) NOT NULL,  -- SHA-256 of the file
+    rows_committed BIGINT NOT NULL DEFAULT 0,  -- source rows covered by committed chunks
+    rows_inserted BIGINT NOT NULL DEFAULT 0,
+    status VARCHAR(16) NOT NULL DEFAULT 'loading' CHECK (status IN ('loading', 'complete')),
+    started_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE INDEX idx_ledger_hash ON ingest_ledger (content_hash);
+
+CREATE TRIGGER trg_ledger_updated AFTER UPDATE ON ingest_ledger
+BEGIN
+    UPDATE ingest_ledger SET updated_at = datetime('now', 'localtime') WHERE file_path = NEW.file_path;
+END;
+
+-- Background ingest jobs started by POST /api/trips/ingest (see backend/utils/ingest_jobs.py)
+CREATE TABLE ingest_jobs (
+    job_id CHAR(32) PRIMARY KEY,
+    file_path VARCHAR(512) NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'succeeded', 'failed', 'cancelled')),
+    cancel_requested TINYINT NOT NULL DEFAULT 0,
+
+    total_rows BIGINT,  -- exact for Parquet, estimated for CSV
+    start_row BIGINT NOT NULL DEFAULT 0,  -- ledger offset the load resumed from
+    rows_processed BIGINT NOT NULL DEFAULT 0,
+    rows_inserted BIGINT NOT NULL DEFAULT 0,
+    error TEXT,
+
+    created_at DATETIME(3) DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')),
+    started_at DATETIME(3),
+    finished_at DATETIME(3),
+    updated_at DATETIME(3) DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+);
+
+CREATE INDEX idx_jobs_created ON ingest_jobs (created_at);
+
+CREATE TRIGGER trg_jobs_updated AFTER UPDATE ON ingest_jobs
+BEGIN
+    UPDATE ingest_jobs SET updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')
+    WHERE job_id = NEW.job_id;
+END;
+
+-- Prepared rows that would fail a NOT NULL or CHECK constraint on trips, set
+-- aside by ingest instead of failing the batch (see backend/utils/db_insert.py).
+-- Values are kept as read, so columns are loosely typed and nullable.
+CREATE TABLE trips_quarantine (
+    quarantine_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_path VARCHAR(512),  -- NULL for frames inserted directly
+    source_row BIGINT NOT NULL,  -- position in the source file (or frame)
+    reason VARCHAR(32) NOT NULL,  -- first constraint the row fails
+
+    vendor_id VARCHAR(64),
+    pickup_datetime VARCHAR(64),
+    dropoff_datetime VARCHAR(64),
+    passenger_count DOUBLE,
+    pickup_longitude DOUBLE,
+    pickup_latitude DOUBLE,
+    dropoff_longitude DOUBLE,
+    dropoff_latitude DOUBLE,
+    store_and_fwd_flag CHAR(1),
+    trip_duration DOUBLE,
+    trip_distance_km DOUBLE,
+    trip_duration_min DOUBLE,
+    speed_kmh DOUBLE,
+    fare_per_km DOUBLE,
+
+    quarantined_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+
+    UNIQUE (file_path, source_row)
+);
+
+CREATE INDEX idx_quarantine_reason ON trips_quarantine (reason);
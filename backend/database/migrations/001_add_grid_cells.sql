@@ -0,0 +1,16 @@
+-- Add grid cell columns for spatial search to an existing trips table and
+-- backfill them. The expression mirrors backend/utils/geo_grid.py:
+-- cell = FLOOR((lat + 90) / 0.002) * 180000 + FLOOR((lon + 180) / 0.002)
+USE trip_data;
+
+ALTER TABLE trips
+    ADD COLUMN pickup_cell BIGINT COMMENT 'Grid cell id, see backend/utils/geo_grid.py',
+    ADD COLUMN dropoff_cell BIGINT COMMENT 'Grid cell id, see backend/utils/geo_grid.py';
+
+UPDATE trips SET
+    pickup_cell = FLOOR((pickup_latitude + 90) / 0.002) * 180000 + FLOOR((pickup_longitude + 180) / 0.002),
+    dropoff_cell = FLOOR((dropoff_latitude + 90) / 0.002) * 180000 + FLOOR((dropoff_longitude + 180) / 0.002);
+
+ALTER TABLE trips
+    ADD INDEX idx_pickup_cell (pickup_cell),
+    ADD INDEX idx_dropoff_cell (dropoff_cell);
@@ -0,0 +1,18 @@
+-- Side table for the streaming anomaly detector (backend/utils/anomaly_detection.py).
+-- Trips ingested before this migration are not scored.
+USE trip_data;
+
+CREATE TABLE IF NOT EXISTS trip_anomalies (
+    anomaly_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    vendor_id VARCHAR(10) NOT NULL,
+    pickup_datetime DATETIME NOT NULL,
+    dropoff_datetime DATETIME NOT NULL,
+    pickup_cell BIGINT,
+
+    flags TINYINT UNSIGNED NOT NULL COMMENT 'bit 0 duration, bit 1 speed, bit 2 distance',
+    duration_z FLOAT,
+    speed_z FLOAT,
+    distance_z FLOAT,
+
+    detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,41 @@
+-- Idempotent ingest for an existing database: remove trips loaded more than
+-- once, add the natural-key unique index and create the ingest ledger.
+-- Rebuild the rollups afterwards: python3 scripts/rollups.py rebuild
+USE trip_data;
+
+DELETE newer FROM trips newer
+JOIN trips older
+  ON older.vendor_id = newer.vendor_id
+ AND older.pickup_datetime = newer.pickup_datetime
+ AND older.dropoff_datetime = newer.dropoff_datetime
+ AND older.pickup_latitude = newer.pickup_latitude
+ AND older.pickup_longitude = newer.pickup_longitude
+ AND older.dropoff_latitude = newer.dropoff_latitude
+ AND older.dropoff_longitude = newer.dropoff_longitude
+ AND older.trip_id < newer.trip_id;
+
+DELETE newer FROM trip_anomalies newer
+JOIN trip_anomalies older
+  ON older.vendor_id = newer.vendor_id
+ AND older.pickup_datetime = newer.pickup_datetime
+ AND older.dropoff_datetime = newer.dropoff_datetime
+ AND older.pickup_cell <=> newer.pickup_cell
+ AND older.anomaly_id < newer.anomaly_id;
+
+CREATE UNIQUE INDEX uq_trip_natural ON trips (
+    vendor_id, pickup_datetime, dropoff_datetime,
+    pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude
+);
+
+CREATE TABLE IF NOT EXISTS ingest_ledger (
+    file_path VARCHAR(512) PRIMARY KEY,
+    file_size BIGINT NOT NULL,
+    content_hash CHAR(64) NOT NULL COMMENT 'SHA-256 of the file',
+    rows_committed BIGINT NOT NULL DEFAULT 0 COMMENT 'source rows covered by committed chunks',
+    rows_inserted BIGINT NOT NULL DEFAULT 0,
+    status ENUM('loading', 'complete') NOT NULL DEFAULT 'loading',
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+    INDEX idx_ledger_hash (content_hash)
+);
@@ -0,0 +1,22 @@
+-- Background ingest jobs for an existing database (see backend/utils/ingest_jobs.py)
+USE trip_data;
+
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    job_id CHAR(32) PRIMARY KEY,
+    file_path VARCHAR(512) NOT NULL,
+    status ENUM('queued', 'running', 'succeeded', 'failed', 'cancelled') NOT NULL DEFAULT 'queued',
+    cancel_requested TINYINT(1) NOT NULL DEFAULT 0,
+
+    total_rows BIGINT COMMENT 'exact for Parquet, estimated for CSV',
+    start_row BIGINT NOT NULL DEFAULT 0 COMMENT 'ledger offset the load resumed from',
+    rows_processed BIGINT NOT NULL DEFAULT 0,
+    rows_inserted BIGINT NOT NULL DEFAULT 0,
+    error TEXT,
+
+    created_at DATETIME(3) DEFAULT CURRENT_TIMESTAMP(3),
+    started_at DATETIME(3),
+    finished_at DATETIME(3),
+    updated_at DATETIME(3) DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3),
+
+    INDEX idx_jobs_created (created_at)
+);
@@ -0,0 +1,29 @@
+-- Quarantine table for an existing database (see backend/utils/db_insert.py)
+USE trip_data;
+
+CREATE TABLE IF NOT EXISTS trips_quarantine (
+    quarantine_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    file_path VARCHAR(512) COMMENT 'NULL for frames inserted directly',
+    source_row BIGINT NOT NULL COMMENT 'position in the source file (or frame)',
+    reason VARCHAR(32) NOT NULL COMMENT 'first constraint the row fails',
+
+    vendor_id VARCHAR(64),
+    pickup_datetime VARCHAR(64),
+    dropoff_datetime VARCHAR(64),
+    passenger_count DOUBLE,
+    pickup_longitude DOUBLE,
+    pickup_latitude DOUBLE,
+    dropoff_longitude DOUBLE,
+    dropoff_latitude DOUBLE,
+    store_and_fwd_flag CHAR(1),
+    trip_duration DOUBLE,
+    trip_distance_km DOUBLE,
+    trip_duration_min DOUBLE,
+    speed_kmh DOUBLE,
+    fare_per_km DOUBLE,
+
+    quarantined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    UNIQUE KEY uq_quarantine_source (file_path, source_row),
+    INDEX idx_quarantine_reason (reason)
+);
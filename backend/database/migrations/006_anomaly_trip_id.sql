@@ -0,0 +1,20 @@
+-- Store the flagged trip's id on trip_anomalies (see backend/utils/anomaly_detection.py).
+-- Older rows only kept vendor, times and pickup cell, so they are matched on
+-- those; a row whose match is ambiguous takes the lowest trip_id.
+USE trip_data;
+
+ALTER TABLE trip_anomalies
+    ADD COLUMN trip_id INT COMMENT 'trips.trip_id of the flagged trip' AFTER anomaly_id;
+
+UPDATE trip_anomalies a
+JOIN (
+    SELECT a2.anomaly_id, MIN(t.trip_id) AS trip_id
+    FROM trip_anomalies a2
+    JOIN trips t
+      ON t.vendor_id = a2.vendor_id
+     AND t.pickup_datetime = a2.pickup_datetime
+     AND t.dropoff_datetime = a2.dropoff_datetime
+     AND t.pickup_cell <=> a2.pickup_cell
+    GROUP BY a2.anomaly_id
+) m ON m.anomaly_id = a.anomaly_id
+SET a.trip_id = m.trip_id;
@@ -0,0 +1,354 @@
+"""
+Streaming anomaly detection for ingested trips.
+
+Trips are grouped by (pickup hour, vendor, coarse pickup cell). Each group
+keeps Welford count/mean/M2 of log duration, log speed and log distance,
+merged chunk by chunk with Chan's parallel update, so ingest never needs a
+second pass. A trip is flagged when one of its values lies more than
+ANOMALY_Z_THRESHOLD standard deviations from its group mean; groups with
+fewer than ANOMALY_MIN_COUNT trips fall back to the (hour, vendor) group.
+Flags go to trip_anomalies, with the trip_id they belong to, in the same
+transaction as the trips. A chunk's statistics join the detector only after
+that transaction commits, so a rolled back or retried chunk is never counted.
+
+Statistics persist in ANOMALY_STATE_FILE between runs. A process only adds
+its own delta to the file, under a lock, so concurrent ingests merge rather
+than overwrite each other.
+"""
+import os
+import tempfile
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backend.utils.geo_grid import cell_ids
+from backend.utils.trip_schema import parse_datetimes
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are not serialized across processes
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ANOMALY_DETECTION = os.getenv("ANOMALY_DETECTION", "1") not in ("0", "false", "off")
+ANOMALY_STATE_FILE = os.getenv(
+    "ANOMALY_STATE_FILE", os.path.join(os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "data/cache")), "anomaly_state.npz"))
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "4.0"))
+ANOMALY_MIN_COUNT = int(os.getenv("ANOMALY_MIN_COUNT", "30"))
+ANOMALY_CELL_DEG = 0.01  # ~1.1 km x 0.85 km at NYC; the index grid is too fine for stable stats
+
+# Bit per metric in trip_anomalies.flags
+METRICS = ["duration", "speed", "distance"]
+METRIC_COLUMNS = ["trip_duration_min", "speed_kmh", "trip_distance_km"]
+FLAG_BITS = {name: 1 << i for i, name in enumerate(METRICS)}
+METRIC_OFFSETS = np.array([0.1, 0.1, 0.01])  # minutes, km/h, km
+
+# Floor on the log-scale standard deviation, so near-constant groups do not flag everything
+MIN_STD = 0.05
+VENDOR_SLOTS = 64
+
+# Copied to flagged rows; the coordinates complete the natural key used to find trip_id
+FLAGGED_COLUMNS = [
+    'vendor_id', 'pickup_datetime', 'dropoff_datetime', 'pickup_cell',
+    'pickup_latitude', 'pickup_longitude', 'dropoff_latitude', 'dropoff_longitude',
+]
+
+SELECT_STATS_COLUMNS = (
+    "SELECT vendor_id, pickup_datetime, pickup_latitude, pickup_longitude, "
+    "trip_duration_min, speed_kmh, trip_distance_km FROM trips"
+)
+REBUILD_BATCH_ROWS = 100000
+
+INSERT_ANOMALY_QUERY = (
+    "INSERT INTO trip_anomalies (trip_id, vendor_id, pickup_datetime, dropoff_datetime, pickup_cell, "
+    "flags, duration_z, speed_z, distance_z) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+)
+
+
+def _combine(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    """Chan et al. merge of two sets of Welford accumulators (element-wise)."""
+    n = n_a + n_b
+    safe = np.where(n > 0, n, 1.0)[:, None]
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (n_b[:, None] / safe)
+    m2 = m2_a + m2_b + delta ** 2 * (n_a * n_b)[:, None] / safe
+    return n, mean, m2
+
+
+def chunk_stats(keys: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Per-key (unique keys, codes, count, mean, M2) of a chunk's metric values."""
+    codes, uniques = pd.factorize(keys, sort=False)
+    k = len(uniques)
+    count = np.bincount(codes, minlength=k).astype(np.float64)
+    mean = np.empty((k, values.shape[1]))
+    m2 = np.empty((k, values.shape[1]))
+    for j in range(values.shape[1]):
+        mean[:, j] = np.bincount(codes, weights=values[:, j], minlength=k) / count
+        m2[:, j] = np.bincount(codes, weights=(values[:, j] - mean[codes, j]) ** 2, minlength=k)
+    return np.asarray(uniques, dtype=np.int64), codes, count, mean, m2
+
+
+class StatTable:
+    """Welford accumulators for METRICS, one slot per int64 group key."""
+
+    def __init__(self, keys=None, count=None, mean=None, m2=None):
+        self.index = pd.Index(np.asarray(keys if keys is not None else [], dtype=np.int64))
+        n, m = len(self.index), len(METRICS)
+        self.count = np.zeros(n) if count is None else np.asarray(count, dtype=np.float64)
+        self.mean = np.zeros((n, m)) if mean is None else np.asarray(mean, dtype=np.float64)
+        self.m2 = np.zeros((n, m)) if m2 is None else np.asarray(m2, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def lookup(self, keys: np.ndarray):
+        """(count, mean, M2) for each key; unknown keys get empty accumulators."""
+        pos = self.index.get_indexer(keys)
+        found = pos >= 0
+        pos = np.where(found, pos, 0)
+        if not len(self.index):
+            m = len(METRICS)
+            return np.zeros(len(keys)), np.zeros((len(keys), m)), np.zeros((len(keys), m))
+        count = np.where(found, self.count[pos], 0.0)
+        mean = np.where(found[:, None], self.mean[pos], 0.0)
+        m2 = np.where(found[:, None], self.m2[pos], 0.0)
+        return count, mean, m2
+
+    def merge(self, keys: np.ndarray, count, mean, m2) -> None:
+        """Fold accumulators for unique ``keys`` into the table."""
+        pos = self.index.get_indexer(keys)
+        new = pos < 0
+        if new.any():
+            start = len(self.index)
+            added = int(new.sum())
+            self.index = self.index.append(pd.Index(keys[new]))
+            self.count = np.concatenate([self.count, np.zeros(added)])
+            self.mean = np.vstack([self.mean, np.zeros((added, len(METRICS)))])
+            self.m2 = np.vstack([self.m2, np.zeros((added, len(METRICS)))])
+            pos[new] = np.arange(start, start + added)
+        self.count[pos], self.mean[pos], self.m2[pos] = _combine(
+            self.count[pos], self.mean[pos], self.m2[pos], count, mean, m2)
+
+    def merged_with(self, other: "StatTable") -> "StatTable":
+        out = StatTable(self.index.to_numpy(), self.count.copy(), self.mean.copy(), self.m2.copy())
+        if len(other):
+            out.merge(other.index.to_numpy(), other.count, other.mean, other.m2)
+        return out
+
+
+def _group_keys(prepared: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """(fine, coarse) int64 group keys: (cell, vendor, hour) and (vendor, hour)."""
+    pickup = parse_datetimes(prepared['pickup_datetime'])
+    hour = pickup.dt.hour.fillna(0).to_numpy(dtype=np.int64)
+    # TLC vendor ids are small integers; anything else shares slot 0. Only the
+    # distinct ids are parsed, since they are usually read as text.
+    codes, vendors = pd.factorize(prepared['vendor_id'], use_na_sentinel=False)
+    vendor = pd.to_numeric(pd.Series(vendors), errors='coerce').fillna(0).to_numpy(dtype=np.int64)[codes] % VENDOR_SLOTS
+    cell = cell_ids(prepared['pickup_latitude'], prepared['pickup_longitude'], ANOMALY_CELL_DEG)
+    coarse = vendor * 24 + hour
+    return cell * (VENDOR_SLOTS * 24) + coarse, coarse
+
+
+def _metric_values(prepared: pd.DataFrame) -> np.ndarray:
+    values = np.column_stack([prepared[c].to_numpy(dtype=np.float64) for c in METRIC_COLUMNS])
+    # Log scale: durations, speeds and distances are roughly log-normal. The
+    # offsets keep zeros finite while still separating near-zero readings.
+    with np.errstate(invalid='ignore'):
+        return np.log(np.clip(values, 0.0, None) + METRIC_OFFSETS)
+
+
+class AnomalyDetector:
+    """Online per-group statistics plus the flagging rule; safe to share across threads."""
+
+    def __init__(self, state_path: Optional[str] = ANOMALY_STATE_FILE,
+                 z_threshold: float = ANOMALY_Z_THRESHOLD, min_count: int = ANOMALY_MIN_COUNT):
+        self.state_path = state_path
+        self.z_threshold = z_threshold
+        self.min_count = min_count
+        self.base_fine, self.base_coarse = _load_tables(state_path)
+        self.delta_fine, self.delta_coarse = StatTable(), StatTable()
+        self._lock = threading.Lock()
+
+    def _stats_for(self, base: StatTable, delta: StatTable, keys: np.ndarray, chunk):
+        count, mean, m2 = _combine(*_combine(*base.lookup(keys), *delta.lookup(keys)), *chunk)
+        std = np.sqrt(m2 / np.maximum(count - 1, 1)[:, None])
+        return count, mean, np.maximum(std, MIN_STD)
+
+    def process(self, prepared: pd.DataFrame):
+        """Score a prepared chunk. Returns its flagged trips and its statistics.
+
+        Each chunk is scored against the statistics including itself, so the
+        first chunk of a fresh deployment is already judged on its own data.
+        The statistics are not added here: pass them to ``merge`` once the
+        chunk has committed.
+        """
+        if prepared.empty:
+            return prepared.iloc[:0], None
+        values = _metric_values(prepared)
+        ok = np.isfinite(values).all(axis=1)
+        fine, coarse = _group_keys(prepared)
+
+        fine_u, fine_codes, *fine_acc = chunk_stats(fine[ok], values[ok])
+        coarse_u, coarse_codes, *coarse_acc = chunk_stats(coarse[ok], values[ok])
+        with self._lock:
+            f_count, f_mean, f_std = self._stats_for(self.base_fine, self.delta_fine, fine_u, fine_acc)
+            c_count, c_mean, c_std = self._stats_for(self.base_coarse, self.delta_coarse, coarse_u, coarse_acc)
+
+        use_fine = (f_count >= self.min_count)[fine_codes]
+        mean = np.where(use_fine[:, None], f_mean[fine_codes], c_mean[coarse_codes])
+        std = np.where(use_fine[:, None], f_std[fine_codes], c_std[coarse_codes])
+        enough = use_fine | (c_count >= self.min_count)[coarse_codes]
+
+        z = (values[ok] - mean) / std
+        bits = (np.abs(z) > self.z_threshold) @ np.array([FLAG_BITS[m] for m in METRICS])
+        hit = (bits > 0) & enough
+        rows = np.flatnonzero(ok)[hit]
+
+        flagged = prepared.iloc[rows][FLAGGED_COLUMNS].copy()
+        flagged['flags'] = bits[hit]
+        for j, name in enumerate(METRICS):
+            flagged[f"{name}_z"] = z[hit, j].round(3)
+        return flagged, ((fine_u, *fine_acc), (coarse_u, *coarse_acc))
+
+    def merge(self, stats) -> None:
+        """Add the statistics of a committed chunk (from ``process``) to this process's delta."""
+        (fine_u, *fine_acc), (coarse_u, *coarse_acc) = stats
+        with self._lock:
+            self.delta_fine.merge(fine_u, *fine_acc)
+            self.delta_coarse.merge(coarse_u, *coarse_acc)
+
+    def save(self) -> None:
+        """Add this process's delta to the state file and start a new delta."""
+        if not self.state_path:
+            return
+        with self._lock:
+            def add(on_disk_fine, on_disk_coarse):
+                return on_disk_fine.merged_with(self.delta_fine), on_disk_coarse.merged_with(self.delta_coarse)
+
+            self.base_fine, self.base_coarse = _locked_update(self.state_path, add)
+            self.delta_fine, self.delta_coarse = StatTable(), StatTable()
+
+
+def _load_tables(path: Optional[str]) -> Tuple[StatTable, StatTable]:
+    """(fine, coarse) tables saved at ``path``; empty when there is no file."""
+    if not path or not os.path.exists(path):
+        return StatTable(), StatTable()
+    with np.load(path) as data:
+        return tuple(
+            StatTable(data[f"{p}_keys"], data[f"{p}_count"], data[f"{p}_mean"], data[f"{p}_m2"])
+            for p in ("fine", "coarse"))
+
+
+def _locked_update(path: str, update) -> Tuple[StatTable, StatTable]:
+    """Apply ``update(fine, coarse)`` to the tables on disk under the state file lock and save them."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        fine, coarse = update(*_load_tables(path))
+        arrays = {}
+        for prefix, table in (("fine", fine), ("coarse", coarse)):
+            arrays.update({
+                f"{prefix}_keys": table.index.to_numpy(), f"{prefix}_count": table.count,
+                f"{prefix}_mean": table.mean, f"{prefix}_m2": table.m2,
+            })
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npz")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+    return fine, coarse
+
+
+_detector: Optional[AnomalyDetector] = None
+_detector_pid: Optional[int] = None
+_detector_lock = threading.Lock()
+
+
+def get_detector() -> Optional[AnomalyDetector]:
+    """Return the process-wide detector (recreated after fork), or None when disabled."""
+    global _detector, _detector_pid
+    if not ANOMALY_DETECTION:
+        return None
+    pid = os.getpid()
+    if _detector is None or _detector_pid != pid:
+        with _detector_lock:
+            if _detector is None or _detector_pid != pid:
+                _detector = AnomalyDetector()
+                _detector_pid = pid
+    return _detector
+
+
+def flag_names(flags: int) -> list:
+    return [name for name in METRICS if flags & FLAG_BITS[name]]
+
+
+def record_anomalies(cursor, prepared: pd.DataFrame):
+    """Score a prepared chunk and insert its flags. Call before the chunk's commit
+    with its inserted rows, and pass the result to merge_anomaly_stats after it.
+    """
+    detector = get_detector()
+    if detector is None or prepared.empty:
+        return None
+    flagged, stats = detector.process(prepared)
+    if flagged.empty:
+        return stats
+
+    from backend.utils.db_insert import _sql_datetimes, _trip_ids  # db_insert imports this module
+
+    rows = list(zip(
+        _trip_ids(cursor, flagged),
+        flagged['vendor_id'].astype(str).tolist(),
+        _sql_datetimes(flagged['pickup_datetime']),
+        _sql_datetimes(flagged['dropoff_datetime']),
+        flagged['pickup_cell'].astype('int64').tolist(),
+        flagged['flags'].astype(int).tolist(),
+        *(flagged[f"{m}_z"].astype(float).tolist() for m in METRICS),
+    ))
+    cursor.executemany(INSERT_ANOMALY_QUERY, rows)
+    return stats
+
+
+def merge_anomaly_stats(stats) -> None:
+    """Count a committed chunk in the statistics; ``stats`` is what record_anomalies returned."""
+    detector = get_detector()
+    if detector is not None and stats is not None:
+        detector.merge(stats)
+
+
+def save_anomaly_state() -> None:
+    """Persist statistics gathered by this process. Call when an ingest finishes."""
+    if _detector is not None and _detector_pid == os.getpid():
+        _detector.save()
+
+
+def rebuild_anomaly_state(conn, path: str = ANOMALY_STATE_FILE) -> int:
+    """Recompute the statistics from every trip, replacing the state file. Returns trips read.
+
+    Call while this process has no unsaved delta; its detector reloads the new file.
+    """
+    global _detector
+    fine, coarse = StatTable(), StatTable()
+    rows = 0
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SELECT_STATS_COLUMNS)
+        columns = [d[0] for d in cursor.description]
+        while True:
+            batch = cursor.fetchmany(REBUILD_BATCH_ROWS)
+            if not batch:
+                break
+            frame = pd.DataFrame.from_records(batch, columns=columns)
+            values = _metric_values(frame)
+            ok = np.isfinite(values).all(axis=1)
+            for table, keys in zip((fine, coarse), _group_keys(frame)):
+                uniques, _, *acc = chunk_stats(keys[ok], values[ok])
+                table.merge(uniques, *acc)
+            rows += len(batch)
+    finally:
+        cursor.close()
+    _locked_update(path, lambda *_: (fine, coarse))
+    with _detector_lock:
+        _detector = None
+    return rows
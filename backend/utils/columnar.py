@@ -0,0 +1,148 @@
+"""
+Columnar intermediate format shared by cleaning, feature engineering and insert.
+
+Files ending in .parquet are stored as Parquet with typed, downcast columns
+and pre-parsed timestamps, so later stages skip text parsing entirely. Any
+other extension is treated as CSV, which stays available for import/export;
+CSV is read with the typed readers in trip_schema. Either way, integer
+columns come back in the schema's nullable dtypes (trip_schema.int_columns).
+"""
+import os
+from typing import Iterator, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow is listed in requirements.txt
+    pa = None
+    pq = None
+
+from backend.utils.trip_schema import (
+    DATETIME_COLUMNS, DATETIME_FORMAT, int_columns, iter_csv, parse_datetimes, read_csv,
+)
+
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+ROW_GROUP_SIZE = 100000
+
+FLOAT32_COLUMNS = [
+    "pickup_longitude", "pickup_latitude", "dropoff_longitude", "dropoff_latitude",
+    "trip_distance_km", "trip_duration_min", "speed_kmh", "fare_per_km", "estimated_fare",
+]
+CATEGORY_COLUMNS = ["vendor_id", "store_and_fwd_flag"]
+
+
+def is_parquet(path: str) -> bool:
+    return path.lower().endswith(PARQUET_EXTENSIONS)
+
+
+def _require_pyarrow():
+    if pq is None:
+        raise ImportError("pyarrow is required for Parquet files (pip install pyarrow)")
+
+
+def downcast(df: pd.DataFrame) -> pd.DataFrame:
+    """Return ``df`` with compact dtypes: float32 coordinates/metrics, the
+    schema's nullable integers (int8 passenger_count), categorical vendor/flag
+    and parsed datetimes."""
+    out = df.copy()
+    for col in DATETIME_COLUMNS:
+        if col in out.columns:
+            out[col] = parse_datetimes(out[col])
+    for col in FLOAT32_COLUMNS:
+        if col in out.columns:
+            out[col] = pd.to_numeric(out[col], errors="coerce").astype("float32")
+    int_columns(out)
+    for col in CATEGORY_COLUMNS:
+        if col in out.columns:
+            out[col] = out[col].astype("category")
+    return out
+
+
+def iter_table(path: str, chunksize: int, columns: Optional[List[str]] = None,
+               start_row: int = 0) -> Iterator[pd.DataFrame]:
+    """Yield ``path`` in frames of at most ``chunksize`` rows, whatever its format.
+
+    ``start_row`` skips that many data rows first (used to resume an ingest).
+    """
+    if is_parquet(path):
+        _require_pyarrow()
+        pf = pq.ParquetFile(path)
+        # Skip whole row groups without decoding them, then trim the first one
+        groups, skip = [], start_row
+        for i in range(pf.num_row_groups):
+            n = pf.metadata.row_group(i).num_rows
+            if skip >= n and not groups:
+                skip -= n
+            else:
+                groups.append(i)
+        if not groups:
+            return
+        for batch in pf.iter_batches(batch_size=chunksize, columns=columns, row_groups=groups):
+            if skip:
+                cut = min(skip, batch.num_rows)
+                batch, skip = batch.slice(cut), skip - cut
+                if batch.num_rows == 0:
+                    continue
+            yield int_columns(batch.to_pandas())
+    else:
+        yield from iter_csv(path, chunksize, columns, start_row)
+
+
+def read_table(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    if is_parquet(path):
+        _require_pyarrow()
+        return int_columns(pq.read_table(path, columns=columns).to_pandas())
+    return read_csv(path, columns)
+
+
+class TableWriter:
+    """Append frames to a Parquet or CSV file, one row group / block per write."""
+
+    def __init__(self, path: str, row_group_size: int = ROW_GROUP_SIZE):
+        self.path = path
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._parquet = is_parquet(path)
+        self._writer = None
+        self._started = False
+        if self._parquet:
+            _require_pyarrow()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self._parquet:
+            table = pa.Table.from_pandas(downcast(df), preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema, compression="snappy")
+            self._writer.write_table(table.cast(self._writer.schema), row_group_size=self.row_group_size)
+        else:
+            df.to_csv(self.path, mode="a" if self._started else "w", header=not self._started,
+                      index=False, date_format=DATETIME_FORMAT)
+        self._started = True
+        self.rows += len(df)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_table(df: pd.DataFrame, path: str) -> None:
+    with TableWriter(path) as writer:
+        writer.write(df)
+
+
+def convert(src: str, dst: str, chunksize: int = ROW_GROUP_SIZE) -> int:
+    """Convert between CSV and Parquet (either direction). Returns rows written."""
+    with TableWriter(dst) as writer:
+        for chunk in iter_table(src, chunksize):
+            writer.write(chunk)
+    return writer.rows
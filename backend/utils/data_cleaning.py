@@ -1,64 +1,173 @@
 import pandas as pd
 import os
+import sys
+import tempfile
+from typing import Iterator, List
+
 import numpy as np
 
+# Allow running this module directly as a script
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.utils.columnar import TableWriter, iter_table
+from backend.utils.exclusions import (
+    DUPLICATE, EXCLUDED_ROWS_FILE, INVALID_DATE, LOG_FILE, MISSING_CRITICAL, ExclusionLog, reason_codes,
+)
+from backend.utils.geo_grid import haversine
+from backend.utils.trip_schema import parse_datetimes
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # Paths
 RAW_FILE = os.path.join(BASE_DIR, "data/raw/train.csv")
 CLEANED_DIR = os.path.join(BASE_DIR, "data/cleaned/")
-CLEANED_FILE = os.path.join(CLEANED_DIR, "cleaned_trips.csv")
-LOG_FILE = os.path.join(BASE_DIR, "data/logs/excluded_records.log")
+CLEANED_FILE = os.path.join(CLEANED_DIR, "cleaned_trips.parquet")
+# Duplicate-detection runs this large (in hashes) are moved to temporary files
+SPILL_ROWS = int(os.getenv("DEDUP_SPILL_ROWS", str(1 << 22)))
 
-# Load raw data
-df = pd.read_csv(RAW_FILE)
-log = open(LOG_FILE, "w")
-
-# Remove duplicates
-duplicates = df[df.duplicated()]
-if not duplicates.empty:
-    log.write("=== Removed duplicate rows ===\n")
-    log.write(duplicates.to_string(index=False) + "\n\n")
-df = df.drop_duplicates()
-
-# Remove rows with missing critical columns
 critical_cols = [
     "pickup_datetime", "dropoff_datetime",
     "pickup_longitude", "pickup_latitude",
     "dropoff_longitude", "dropoff_latitude",
     "trip_duration"
 ]
-missing_rows = df[df[critical_cols].isnull().any(axis=1)]
-if not missing_rows.empty:
-    log.write("=== Removed rows with missing critical values ===\n")
-    log.write(missing_rows.to_string(index=False) + "\n\n")
-df = df.dropna(subset=critical_cols)
-
-# Normalize timestamps and remove invalid dates
-df["pickup_datetime"] = pd.to_datetime(df["pickup_datetime"], errors="coerce")
-df["dropoff_datetime"] = pd.to_datetime(
-    df["dropoff_datetime"], errors="coerce")
-
-
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth radius in km
-    phi1, phi2 = np.radians(lat1), np.radians(lat2)
-    dphi = np.radians(lat2 - lat1)
-    dlambda = np.radians(lon2 - lon1)
-    a = np.sin(dphi/2)**2 + np.cos(phi1)*np.cos(phi2)*np.sin(dlambda/2)**2
-    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
-    return R * c
-
-
-df["trip_distance_km"] = haversine(
-    df["pickup_latitude"], df["pickup_longitude"],
-    df["dropoff_latitude"], df["dropoff_longitude"]
-)
 
-# Save cleaned data
-df.to_csv(CLEANED_FILE, index=False)
-log.close()
 
-print(
-    f"Data cleaning done. Cleaned dataset saved to {CLEANED_FILE} with {len(df)} rows.")
-print(f"Excluded rows are logged in {LOG_FILE}")
+class RowHashSet:
+    """Set of 64-bit row hashes kept as a few sorted uint64 runs.
+
+    Each chunk's new hashes become a run, and a run is merged into the one
+    before it while that one is less than twice its size (an LSM tree), so
+    there are O(log N) runs and a hash is re-merged O(log N) times instead
+    of re-sorting everything seen with every chunk.
+
+    The set needs 8 bytes per distinct row, which grows with the file. Runs
+    of ``spill_rows`` hashes or more are merged into anonymous temporary
+    files and memory-mapped, so resident memory stays around a few times
+    ``spill_rows`` hashes plus the pages of the mapped runs the OS keeps
+    cached; the temporary files still grow with the file. ``spill_rows=0``
+    keeps every run in memory.
+    """
+
+    def __init__(self, spill_rows: int = SPILL_ROWS):
+        self.spill_rows = spill_rows
+        self._runs: List[np.ndarray] = []  # sorted, largest first
+
+    def __len__(self):
+        return sum(len(run) for run in self._runs)
+
+    def check_and_add(self, hashes: np.ndarray) -> np.ndarray:
+        """Return a mask of hashes already seen (earlier or within this batch), then add the rest."""
+        # Work in sorted order: lookups with sorted keys walk each run once, and
+        # the stable sort keeps repeats in input order, so the first one stays new
+        order = np.argsort(np.asarray(hashes, dtype=np.uint64), kind="stable")
+        hashes = np.asarray(hashes, dtype=np.uint64)[order]
+        dup_sorted = np.zeros(len(hashes), dtype=bool)
+        dup_sorted[1:] = hashes[1:] == hashes[:-1]
+        for run in self._runs:
+            pos = np.searchsorted(run, hashes)
+            pos[pos == len(run)] = 0
+            dup_sorted |= run[pos] == hashes
+        dup = np.empty(len(hashes), dtype=bool)
+        dup[order] = dup_sorted
+
+        new = hashes[~dup_sorted]
+        if len(new):
+            self._runs.append(new)
+        while len(self._runs) > 1 and len(self._runs[-2]) < 2 * len(self._runs[-1]):
+            newer = self._runs.pop()
+            self._runs.append(self._merge(self._runs.pop(), newer))
+        return dup
+
+    def _merge(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        if not self.spill_rows or len(a) + len(b) < self.spill_rows:
+            # Two sorted runs: the stable (merge) sort only merges them
+            return np.sort(np.concatenate([a, b]), kind="stable")
+        f = tempfile.TemporaryFile()
+        for block in _merged_blocks(a, b, self.spill_rows):
+            block.tofile(f)
+        f.flush()
+        return np.memmap(f, dtype=np.uint64, mode="r", shape=(len(a) + len(b),))
+
+
+def _merged_blocks(a: np.ndarray, b: np.ndarray, block: int) -> Iterator[np.ndarray]:
+    """Merge two sorted arrays in pieces of at most ``2 * block`` values."""
+    i = j = 0
+    while i < len(a) and j < len(b):
+        a_end, b_end = min(i + block, len(a)), min(j + block, len(b))
+        # Take a block from the side that ends lower, and what precedes its end from the other
+        if a[a_end - 1] <= b[b_end - 1]:
+            b_end = j + int(np.searchsorted(b[j:b_end], a[a_end - 1], side="right"))
+        else:
+            a_end = i + int(np.searchsorted(a[i:a_end], b[b_end - 1], side="right"))
+        yield np.sort(np.concatenate([a[i:a_end], b[j:b_end]]), kind="stable")
+        i, j = a_end, b_end
+    for rest, k in ((a, i), (b, j)):
+        for start in range(k, len(rest), block):
+            yield np.asarray(rest[start:start + block])
+
+
+def clean_chunk(chunk: pd.DataFrame, seen: RowHashSet, exclusions: ExclusionLog = None,
+                first_row: int = 0) -> pd.DataFrame:
+    """Clean one raw chunk; ``seen`` carries duplicate state between chunks.
+
+    Every check runs over the whole chunk and the rows are filtered once.
+    Dropped rows go to ``exclusions``, numbered from ``first_row``.
+    """
+    dup = seen.check_and_add(pd.util.hash_pandas_object(chunk, index=False).to_numpy())
+    missing = chunk[critical_cols].isnull().any(axis=1).to_numpy()
+
+    # Normalize timestamps; unparseable ones become NaT
+    pickup = parse_datetimes(chunk["pickup_datetime"])
+    dropoff = parse_datetimes(chunk["dropoff_datetime"])
+    bad_dates = (pickup.isna() | dropoff.isna()).to_numpy()
+
+    codes = reason_codes((DUPLICATE, dup), (MISSING_CRITICAL, missing), (INVALID_DATE, bad_dates))
+    if exclusions is not None:
+        exclusions.record(chunk, codes, first_row)
+
+    keep = codes == 0
+    chunk = chunk[keep].copy()
+    chunk["pickup_datetime"] = pickup[keep]
+    chunk["dropoff_datetime"] = dropoff[keep]
+
+    chunk["trip_distance_km"] = haversine(
+        chunk["pickup_latitude"], chunk["pickup_longitude"],
+        chunk["dropoff_latitude"], chunk["dropoff_longitude"]
+    )
+    return chunk
+
+
+def clean(raw_path=RAW_FILE, out_path=CLEANED_FILE, chunksize=100000, log_path=LOG_FILE,
+          excluded_path=EXCLUDED_ROWS_FILE):
+    """Clean ``raw_path`` chunk by chunk, appending to ``out_path``.
+
+    Either path may be Parquet or CSV; the format follows the extension.
+    Dropped rows are listed with their reason in ``excluded_path``, and
+    counts plus a few sample rows per reason go to ``log_path``.
+
+    Duplicate detection needs 8 bytes per distinct row. Past DEDUP_SPILL_ROWS
+    rows that goes to temporary files (see RowHashSet), so resident memory
+    is about ``chunksize`` plus a few times DEDUP_SPILL_ROWS hashes, but
+    temporary disk use still grows with the file. Returns the number of rows
+    written.
+    """
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+    seen = RowHashSet()
+    first_row = 0
+    with ExclusionLog(excluded_path, log_path, stage="Cleaning") as exclusions, \
+            TableWriter(out_path) as writer:
+        for chunk in iter_table(raw_path, chunksize):
+            writer.write(clean_chunk(chunk, seen, exclusions, first_row))
+            first_row += len(chunk)
+    return writer.rows
+
+
+if __name__ == "__main__":
+    rows = clean()
+    print(
+        f"Data cleaning done. Cleaned dataset saved to {CLEANED_FILE} with {rows} rows.")
+    print(f"Excluded rows are listed in {EXCLUDED_ROWS_FILE}, with a summary in {LOG_FILE}")
@@ -1,249 +1,534 @@
 import os
-from typing import Optional, List, Tuple
-# from mysql.connector import MySQLConnection
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Optional, List, Tuple
 
 import numpy as np
 import pandas as pd
-import mysql.connector
 
-# from config.db_connection import get_db_connection
-
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-def get_db_config() -> dict:
-    return {
-        "host": os.getenv("DB_HOST", "localhost"),
-        "user": os.getenv("DB_USER", "nyc_user"),
-        "password": os.getenv("DB_PASSWORD", "nyc123!"),
-        "database": os.getenv("DB_NAME", "trip_data"),
-    }
-
-def get_db_connection() -> Optional[mysql.connector.MySQLConnection]:
-    """Return a new MySQL connection using config."""
-    try:
-        config = get_db_config()
-        conn = mysql.connector.connect(**config)
-        print("connected to DB")
-        return conn
-    except mysql.connector.Error as error:
-        print(f"Error connecting to MySQL: {error}")
-        return None
+# Allow running this module directly as a script
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.config.db_connection import DB_BACKEND, db_connection, get_db_connection
+from backend.utils.anomaly_detection import merge_anomaly_stats, record_anomalies
+from backend.utils.columnar import iter_table
+from backend.utils.data_cleaning import CLEANED_FILE
+from backend.utils.geo_grid import cell_ids, haversine
+from backend.utils.ingest_ledger import begin_file, checkpoint, finish_file
+from backend.utils.ingest_state import saving_state
+from backend.utils.response_cache import bump_data_version
+from backend.utils.rollups import apply_rollups
+from backend.utils.sketches import record_sketches
+from backend.utils.snapshot import refresh_snapshot_after_ingest
+from backend.utils.trip_schema import (
+    CONSTRAINT_REASONS, DATETIME_FORMAT, FIELDS, TRIP_COLUMNS, check_constraints, parse_datetimes,
+)
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CLEANED_DIR = os.path.join(BASE_DIR, "data/cleaned")
-CLEANED_FILE_DEFAULT = os.path.join(CLEANED_DIR, "cleaned_trips.csv")
-
-
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371
-    phi1, phi2 = np.radians(lat1), np.radians(lat2)
-    dphi = np.radians(lat2 - lat1)
-    dlambda = np.radians(lon2 - lon1)
-    a = np.sin(dphi / 2)**2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2)**2
-    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
-    return R * c
-
+CLEANED_FILE_DEFAULT = CLEANED_FILE
+
+
+# A trip already present under the uq_trip_natural key is left untouched and
+# counts as 0 affected rows.
+INSERT_TRIP_QUERY = (
+    "INSERT INTO trips (" + ", ".join(TRIP_COLUMNS) + ") "
+    "VALUES (" + ", ".join(["%s"] * len(TRIP_COLUMNS)) + ") "
+    "ON DUPLICATE KEY UPDATE trip_id = trip_id"
+)
+
+# Rows failing a trips constraint are kept here with the first failed check.
+# uq_quarantine_source makes a replayed chunk record each row only once.
+QUARANTINE_COLUMNS = [c for c in TRIP_COLUMNS if c not in ("pickup_cell", "dropoff_cell")]
+INSERT_QUARANTINE_QUERY = (
+    "INSERT INTO trips_quarantine (file_path, source_row, reason, " + ", ".join(QUARANTINE_COLUMNS) + ") "
+    "VALUES (" + ", ".join(["%s"] * (len(QUARANTINE_COLUMNS) + 3)) + ") "
+    "ON DUPLICATE KEY UPDATE quarantine_id = quarantine_id"
+)
+_REASON_NAMES = np.array(CONSTRAINT_REASONS, dtype=object)
+
+# Columns of the uq_trip_natural unique index
+NATURAL_KEY = [
+    "vendor_id", "pickup_datetime", "dropoff_datetime",
+    "pickup_latitude", "pickup_longitude", "dropoff_latitude", "dropoff_longitude",
+]
+
+# Secondary indexes from database_setup.sql that can be dropped during a bulk
+# load and rebuilt once at the end. idx_vendor_time is kept because it backs
+# the vendor foreign key.
+DEFERRABLE_INDEXES = {
+    "idx_pickup_datetime": "pickup_datetime",
+    "idx_dropoff_datetime": "dropoff_datetime",
+    "idx_passenger_count": "passenger_count",
+    "idx_speed_kmh": "speed_kmh",
+    "idx_pickup_coords": "pickup_latitude, pickup_longitude",
+    "idx_dropoff_coords": "dropoff_latitude, dropoff_longitude",
+    "idx_pickup_cell": "pickup_cell",
+    "idx_dropoff_cell": "dropoff_cell",
+}
+
+
+def _upsert_vendors(cursor, vendor_ids: pd.Series) -> None:
+    vendors = vendor_ids.dropna().unique().tolist()
+    if vendors:
+        cursor.executemany(
+            "INSERT IGNORE INTO vendors (vendor_id) VALUES (%s)", [(v,) for v in vendors])
+
+
+def _sql_datetimes(values: pd.Series):
+    """Pre-parsed (Parquet) timestamps become 'YYYY-MM-DD HH:MM:SS' strings, the
+    form both backends store (SQLite compares them as text); text passes through."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        stamps = np.datetime_as_string(values.to_numpy(dtype='datetime64[s]'), unit='s')
+        return np.char.replace(stamps, 'T', ' ').tolist()
+    return values
+
+
+def _prepared_rows(prepared: pd.DataFrame) -> List[Tuple]:
+    """Turn a frame from _compute_features_chunk into INSERT parameter tuples."""
+    columns = []
+    for col in TRIP_COLUMNS:
+        kind = FIELDS[col].kind
+        if kind == 'datetime':
+            columns.append(_sql_datetimes(prepared[col]))
+        elif kind in ('int', 'float'):
+            values = prepared[col].to_numpy(dtype=np.int64 if kind == 'int' else np.float64)
+            if col in NATURAL_KEY:
+                # The FLOAT value MySQL would store. SQLite keeps all 8 bytes, so
+                # without this the same trip read from CSV (float64) and from
+                # Parquet (float32) would get two uq_trip_natural keys.
+                values = values.astype(np.float32).astype(np.float64)
+            if kind == 'float' and FIELDS[col].nullable and np.isnan(values).any():
+                values = np.where(np.isnan(values), None, values)  # NULL, not NaN
+            columns.append(values.tolist())
+        else:
+            columns.append(prepared[col].tolist())
+    return list(zip(*columns))
+
+
+def _quarantine_values(values: pd.Series) -> list:
+    """A column of rejected rows as Python values; NaN, NaT and infinities become None."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        text = values.dt.strftime(DATETIME_FORMAT)
+        return text.astype(object).where(text.notna(), None).tolist()
+    if pd.api.types.is_numeric_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+        x = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        return np.where(np.isfinite(x), x, None).tolist()
+    text = values.astype(object)
+    return [None if pd.isna(v) else str(v)[:64] for v in text.tolist()]
+
+
+def _quarantine_invalid(cursor, prepared: pd.DataFrame, file_path: Optional[str] = None,
+                        first_row: int = 0, source_rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """Move rows that would fail a NOT NULL or CHECK constraint on trips to
+    trips_quarantine and return the rest, so one bad row never fails a batch.
+
+    ``first_row`` is the chunk's offset in ``file_path``; each quarantined row
+    records its source position and reason. Pass ``source_rows`` (one per row)
+    when earlier stages dropped rows and positions no longer line up.
+    """
+    codes = check_constraints(prepared)
+    rejected = np.flatnonzero(codes)
+    if not len(rejected):
+        return prepared
+    bad = prepared.iloc[rejected]
+    rows = list(zip(
+        [file_path] * len(rejected),
+        (rejected + first_row if source_rows is None else np.asarray(source_rows)[rejected]).tolist(),
+        _REASON_NAMES[codes[rejected]].tolist(),
+        *(_quarantine_values(bad[c]) for c in QUARANTINE_COLUMNS),
+    ))
+    cursor.executemany(INSERT_QUARANTINE_QUERY, rows)
+    # passenger_count is a nullable Int8 from the readers; the valid rows have no gaps
+    return prepared[codes == 0].astype({'passenger_count': np.int64})
+
+
+def _natural_keys(frame: pd.DataFrame) -> pd.DataFrame:
+    """NATURAL_KEY columns normalized to what MySQL stores (FLOAT coordinates)."""
+    out = pd.DataFrame({'vendor_id': frame['vendor_id'].astype(str).to_numpy()})
+    for col in ('pickup_datetime', 'dropoff_datetime'):
+        out[col] = parse_datetimes(frame[col]).to_numpy(dtype='datetime64[s]')
+    for col in NATURAL_KEY[3:]:
+        out[col] = frame[col].to_numpy(dtype=np.float32)
+    return out
 
-def insert_dataframe(df: pd.DataFrame) -> int:
-    """Insert a dataframe of trips into the database. Returns number of rows inserted."""
-    conn = get_db_connection()
-    if conn is None:
-        raise RuntimeError("Database connection failed")
 
-    try:
+def _lookup_trips(cursor, keys: pd.DataFrame, columns: List[str], lookup_batch: int = 1000) -> list:
+    """``columns`` of the trips sharing a (vendor, pickup, dropoff) prefix with ``keys``."""
+    lookup = keys[NATURAL_KEY[:3]].drop_duplicates()
+    stamps = {c: _sql_datetimes(lookup[c]) for c in ('pickup_datetime', 'dropoff_datetime')}
+    params_all = list(zip(lookup['vendor_id'], stamps['pickup_datetime'], stamps['dropoff_datetime']))
+
+    found = []
+    for i in range(0, len(params_all), lookup_batch):
+        part = params_all[i:i+lookup_batch]
+        keys_sql = ', '.join(['(%s, %s, %s)'] * len(part))
+        if DB_BACKEND == "sqlite":
+            # SQLite scans for a row-value IN list but probes the index per row of a join
+            query = (
+                f"WITH k (vendor_id, pickup_datetime, dropoff_datetime) AS (VALUES {keys_sql}) "
+                f"SELECT {', '.join('t.' + c for c in columns)} FROM k "
+                f"JOIN trips t USING (vendor_id, pickup_datetime, dropoff_datetime)")
+        else:
+            # Row-constructor IN is a range lookup on the uq_trip_natural prefix
+            query = (
+                f"SELECT {', '.join(columns)} FROM trips "
+                f"WHERE (vendor_id, pickup_datetime, dropoff_datetime) IN ({keys_sql})")
+        cursor.execute(query, [v for row in part for v in row])
+        found.extend(cursor.fetchall())
+    return found
+
+
+def _drop_existing(cursor, prepared: pd.DataFrame, lookup_batch: int = 1000) -> pd.DataFrame:
+    """Rows of ``prepared`` not yet in trips, without repeats inside the chunk."""
+    keys = _natural_keys(prepared)
+    existing = _lookup_trips(cursor, keys, NATURAL_KEY, lookup_batch)
+
+    seen = keys.duplicated().to_numpy()
+    if existing:
+        present = _natural_keys(pd.DataFrame(existing, columns=NATURAL_KEY))
+        seen |= pd.MultiIndex.from_frame(keys).isin(pd.MultiIndex.from_frame(present))
+    return prepared[~seen]
+
+
+def _trip_ids(cursor, frame: pd.DataFrame) -> list:
+    """trip_id of each row of ``frame`` (inserted trips), found by natural key; None if absent."""
+    keys = _natural_keys(frame)
+    found = pd.DataFrame(_lookup_trips(cursor, keys, NATURAL_KEY + ['trip_id']), columns=NATURAL_KEY + ['trip_id'])
+    if found.empty:
+        return [None] * len(frame)
+    # Stored keys can still repeat once normalized (e.g. 8-byte coordinates
+    # in an older SQLite file); the earliest trip wins
+    stored = _natural_keys(found).assign(trip_id=found['trip_id'].to_numpy())
+    stored = stored.sort_values('trip_id', kind='stable').drop_duplicates(NATURAL_KEY)
+    pos = pd.MultiIndex.from_frame(stored[NATURAL_KEY]).get_indexer(pd.MultiIndex.from_frame(keys))
+    ids = stored['trip_id'].to_numpy()
+    return [int(ids[p]) if p >= 0 else None for p in pos]
+
+
+def _insert_new(cursor, prepared: pd.DataFrame, load: Callable[[pd.DataFrame], int]) -> pd.DataFrame:
+    """Insert a prepared chunk with ``load`` (returns rows inserted), skipping trips
+    already in the table. Returns the rows actually inserted, which are what the
+    rollups and anomaly detector must see.
+    """
+    if prepared.empty:
+        return prepared
+    cursor.execute("SAVEPOINT trip_chunk")
+    if load(prepared) >= len(prepared):
+        return prepared
+    # Some trips were already loaded: redo the chunk without them
+    cursor.execute("ROLLBACK TO SAVEPOINT trip_chunk")
+    fresh = _drop_existing(cursor, prepared)
+    if not fresh.empty:
+        load(fresh)
+    return fresh
+
+
+def _insert_rows(cursor, prepared: pd.DataFrame, batch_size: int) -> int:
+    """executemany the chunk in batches; returns affected rows (0 for duplicates)."""
+    rows = _prepared_rows(prepared)
+    inserted = 0
+    for i in range(0, len(rows), batch_size):
+        cursor.executemany(INSERT_TRIP_QUERY, rows[i:i+batch_size])
+        inserted += max(cursor.rowcount, 0)
+    return inserted
+
+
+def insert_dataframe(df: pd.DataFrame, batch_size: int = 1000) -> int:
+    """Insert a dataframe of trips into the database. Returns number of rows inserted.
+
+    Rows that would fail a table constraint go to trips_quarantine instead.
+    """
+    prepared = _compute_features_chunk(df)
+
+    with db_connection() as conn:
         cursor = conn.cursor()
-
-        vendors = df['vendor_id'].dropna().unique()
-        for vendor in vendors:
-            cursor.execute("INSERT IGNORE INTO vendors (vendor_id) VALUES (%s)", (int(vendor),))
-            
-        insert_trip_query = (
-            "INSERT INTO trips ("
-            "vendor_id, pickup_datetime, dropoff_datetime, passenger_count, "
-            "pickup_longitude, pickup_latitude, dropoff_longitude, dropoff_latitude, "
-            "store_and_fwd_flag, trip_duration, trip_distance_km, trip_duration_min, "
-            "speed_kmh, fare_per_km"
-            ") VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-        )
-
-        rows_inserted = 0
-        for _, row in df.iterrows():
-            trip_distance = haversine(
-                row['pickup_latitude'], row['pickup_longitude'],
-                row['dropoff_latitude'], row['dropoff_longitude']
-            )
-            # print(row)
-            trip_duration_min = row['trip_duration'] / 60
-            speed_kmh = trip_distance / (trip_duration_min / 60) if trip_duration_min > 0 else 0
-            fare_per_km = row['fare_amount'] / trip_distance if trip_distance > 0 and 'fare_amount' in row else 0
-
-            cursor.execute(
-                insert_trip_query,
-                (
-                    row['vendor_id'],
-                    row['pickup_datetime'],
-                    row['dropoff_datetime'],
-                    int(row['passenger_count']),
-                    float(row['pickup_longitude']),
-                    float(row['pickup_latitude']),
-                    float(row['dropoff_longitude']),
-                    float(row['dropoff_latitude']),
-                    row.get('store_and_fwd_flag', 'N'),
-                    float(row['trip_duration']),
-                    trip_distance,
-                    trip_duration_min,
-                    speed_kmh,
-                    fare_per_km if 'fare_amount' in row else 0
-                ),
-            )
-            rows_inserted += 1
-            if _ == 1000:
-                conn.commit()
-        conn.commit()
-        return rows_inserted
-    finally:
         try:
+            with saving_state():
+                prepared = _quarantine_invalid(cursor, prepared)
+                _upsert_vendors(cursor, prepared['vendor_id'])
+                fresh = _insert_new(cursor, prepared, lambda frame: _insert_rows(cursor, frame, batch_size))
+                apply_rollups(cursor, fresh)
+                stats = record_anomalies(cursor, fresh)
+                conn.commit()
+                bump_data_version()
+                merge_anomaly_stats(stats)
+                record_sketches(fresh)
+            refresh_snapshot_after_ingest()
+            return len(fresh)
+        finally:
             cursor.close()
-        except Exception:
-            pass
-        conn.close()
 
 
-def insert_from_csv(csv_path: Optional[str] = None) -> int:
-    """Load CSV and insert into DB. CSV path defaults to cleaned file."""
+def insert_from_csv(csv_path: Optional[str] = None, force: bool = False) -> int:
+    """Load a CSV (or Parquet) file into the DB. Path defaults to the cleaned file."""
     path = csv_path or CLEANED_FILE_DEFAULT
-    df = pd.read_csv(path)
-    return insert_dataframe(df)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+    return insert_from_csv_chunked(path, force=force)
 
 
-def insert_all_from_cleaned() -> int:
-    """Insert all CSV files found in data/cleaned. Returns total rows inserted."""
+def insert_all_from_cleaned(file_workers: int = 1, chunksize: int = 50000, batch_size: int = 1000,
+                            force: bool = False, load: Optional[Callable[..., int]] = None) -> int:
+    """Insert all CSV/Parquet files found in data/cleaned. Returns total rows inserted.
+
+    ``load(path, force=force)`` loads one file; by default it is
+    insert_from_csv_chunked with ``chunksize`` and ``batch_size``. With
+    ``file_workers`` > 1 the files are loaded concurrently, one process (and
+    one pooled connection) per file, so ``load`` must be picklable (a
+    module-level function or a functools.partial of one).
+    """
     if not os.path.isdir(CLEANED_DIR):
         raise FileNotFoundError(f"Cleaned directory not found: {CLEANED_DIR}")
+    if load is None:
+        load = partial(insert_from_csv_chunked, chunksize=chunksize, batch_size=batch_size)
+
+    paths = [
+        os.path.join(CLEANED_DIR, name)
+        for name in sorted(os.listdir(CLEANED_DIR))
+        if name.lower().endswith(('.csv', '.parquet'))
+    ]
+
+    if file_workers <= 1 or len(paths) <= 1:
+        return sum(load(p, force=force) for p in paths)
 
-    total = 0
-    for name in os.listdir(CLEANED_DIR):
-        if not name.lower().endswith('.csv'):
-            continue
-        csv_path = os.path.join(CLEANED_DIR, name)
-        df = pd.read_csv(csv_path)
-        total += insert_dataframe(df)
-    return total
+    with ProcessPoolExecutor(max_workers=min(file_workers, len(paths))) as executor:
+        futures = [executor.submit(load, p, force=force) for p in paths]
+        return sum(f.result() for f in futures)
 
 
 def _compute_features_chunk(df: pd.DataFrame) -> pd.DataFrame:
     required = [
         'pickup_latitude','pickup_longitude','dropoff_latitude','dropoff_longitude',
-        'trip_duration','fare_amount','passenger_count','vendor_id',
+        'trip_duration','passenger_count','vendor_id',
         'pickup_datetime','dropoff_datetime'
     ]
     missing = [c for c in required if c not in df.columns]
     if missing:
         raise ValueError(f"Missing required columns in CSV: {missing}")
 
-    lat1 = df['pickup_latitude'].astype(float)
-    lon1 = df['pickup_longitude'].astype(float)
-    lat2 = df['dropoff_latitude'].astype(float)
-    lon2 = df['dropoff_longitude'].astype(float)
+    # One float64 view of each input column, shared by every feature below
+    lat1 = df['pickup_latitude'].to_numpy(dtype=np.float64)
+    lon1 = df['pickup_longitude'].to_numpy(dtype=np.float64)
+    lat2 = df['dropoff_latitude'].to_numpy(dtype=np.float64)
+    lon2 = df['dropoff_longitude'].to_numpy(dtype=np.float64)
+    duration = df['trip_duration'].to_numpy(dtype=np.float64)
 
     distances = haversine(lat1, lon1, lat2, lon2)
-    duration_min = df['trip_duration'].astype(float) / 60.0
+    duration_min = duration / 60.0
     with np.errstate(divide='ignore', invalid='ignore'):
         speed = np.where(duration_min > 0, distances / (duration_min / 60.0), 0.0)
-        fare_per_km = np.where(distances > 0, df['fare_amount'].astype(float) / distances, 0.0)
+        # The Kaggle trip-duration extract has no fares; fare_per_km is then 0.
+        if 'fare_amount' in df.columns:
+            fare_per_km = np.where(distances > 0, df['fare_amount'].to_numpy(dtype=np.float64) / distances, 0.0)
+        else:
+            fare_per_km = np.zeros(len(df))
+        # Missing coordinates give meaningless cells; _quarantine_invalid drops those rows
+        pickup_cell, dropoff_cell = cell_ids(lat1, lon1), cell_ids(lat2, lon2)
 
     out = pd.DataFrame({
         'vendor_id': df['vendor_id'],
         'pickup_datetime': df['pickup_datetime'],
         'dropoff_datetime': df['dropoff_datetime'],
-        'passenger_count': df['passenger_count'].astype(int),
-        'pickup_longitude': lon1.astype(float),
-        'pickup_latitude': lat1.astype(float),
-        'dropoff_longitude': lon2.astype(float),
-        'dropoff_latitude': lat2.astype(float),
+        'passenger_count': df['passenger_count'],
+        'pickup_longitude': lon1,
+        'pickup_latitude': lat1,
+        'dropoff_longitude': lon2,
+        'dropoff_latitude': lat2,
         'store_and_fwd_flag': df.get('store_and_fwd_flag', 'N'),
-        'trip_duration': df['trip_duration'].astype(float),
+        'trip_duration': duration,
         'trip_distance_km': distances,
         'trip_duration_min': duration_min,
         'speed_kmh': speed,
         'fare_per_km': fare_per_km,
+        'pickup_cell': pickup_cell,
+        'dropoff_cell': dropoff_cell,
     })
 
     # Ensure flag is single-char 'Y'/'N'
-    out['store_and_fwd_flag'] = out['store_and_fwd_flag'].fillna('N').astype(str).str.upper().str[:1]
+    out['store_and_fwd_flag'] = out['store_and_fwd_flag'].astype(object).fillna('N').astype(str).str.upper().str[:1]
     out['store_and_fwd_flag'] = out['store_and_fwd_flag'].where(out['store_and_fwd_flag'].isin(['Y','N']), 'N')
     return out
 
 
-def insert_from_csv_chunked(csv_path: str, chunksize: int = 50000, batch_size: int = 1000) -> int:
-    """Chunked CSV loader for large files. Returns total rows inserted."""
-    conn = get_db_connection()
-    if conn is None:
-        raise RuntimeError("Database connection failed")
+def insert_from_csv_chunked(csv_path: str, chunksize: int = 50000, batch_size: int = 1000,
+                            force: bool = False,
+                            on_chunk: Optional[Callable[..., bool]] = None) -> int:
+    """Chunked CSV loader for large files. Returns total rows inserted.
+
+    Progress is checkpointed in ingest_ledger with every chunk: an unchanged,
+    fully loaded file is skipped and an interrupted one resumes after its last
+    committed chunk. ``force`` reloads from the start (duplicates are still
+    skipped). Rows that would fail a table constraint go to trips_quarantine
+    (see _quarantine_invalid) and the rest of the chunk loads as usual.
 
+    ``on_chunk(cursor, offset, rows_read, rows_inserted)`` runs inside each
+    chunk's transaction with the source offset reached and this run's totals;
+    returning False stops after that chunk, leaving the file to be resumed.
+    """
     total_inserted = 0
-    try:
+    with db_connection() as conn:
         cursor = conn.cursor()
+        try:
+            offset = begin_file(cursor, csv_path, force=force)
+            conn.commit()
+            if offset is None:
+                return 0
+            start_row = offset
+
+            with saving_state():
+                for chunk in iter_table(csv_path, chunksize, start_row=offset):
+                    prepared = _quarantine_invalid(cursor, _compute_features_chunk(chunk), csv_path, offset)
+                    offset += len(chunk)
+                    _upsert_vendors(cursor, prepared['vendor_id'])
+
+                    # Batch executemany for speed
+                    fresh = _insert_new(cursor, prepared, lambda frame: _insert_rows(cursor, frame, batch_size))
+                    total_inserted += len(fresh)
+
+                    apply_rollups(cursor, fresh)
+                    stats = record_anomalies(cursor, fresh)
+                    checkpoint(cursor, csv_path, offset, len(fresh))
+                    keep_going = on_chunk is None or on_chunk(cursor, offset, offset - start_row, total_inserted)
+                    conn.commit()
+                    bump_data_version()
+                    merge_anomaly_stats(stats)
+                    record_sketches(fresh)
+                    if not keep_going:
+                        break
+                else:
+                    finish_file(cursor, csv_path)
+                    conn.commit()
+            refresh_snapshot_after_ingest()
+            return total_inserted
+        finally:
+            cursor.close()
+
+
+def _write_tsv(prepared: pd.DataFrame, path: str) -> None:
+    """Write a prepared chunk in the format LOAD DATA expects (\\N for NULL)."""
+    # trip_duration is an INT column; write it without the float suffix
+    out = prepared[TRIP_COLUMNS].assign(trip_duration=prepared['trip_duration'].round().astype('int64'))
+    out.to_csv(
+        path, sep='\t', header=False, index=False, na_rep='\\N',
+        lineterminator='\n', date_format=DATETIME_FORMAT,
+    )
 
-        insert_trip_query = (
-            "INSERT INTO trips ("
-            "vendor_id, pickup_datetime, dropoff_datetime, passenger_count, "
-            "pickup_longitude, pickup_latitude, dropoff_longitude, dropoff_latitude, "
-            "store_and_fwd_flag, trip_duration, trip_distance_km, trip_duration_min, "
-            "speed_kmh, fare_per_km"
-            ") VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+
+def _drop_deferrable_indexes(cursor) -> List[str]:
+    if DB_BACKEND == "sqlite":
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'trips'")
+    else:
+        cursor.execute(
+            "SELECT DISTINCT index_name FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = 'trips'"
         )
+    existing = {row[0] for row in cursor.fetchall()}
+    dropped = [name for name in DEFERRABLE_INDEXES if name in existing]
+    for name in dropped:
+        if DB_BACKEND == "sqlite":
+            cursor.execute(f"DROP INDEX {name}")
+        else:
+            cursor.execute(f"ALTER TABLE trips DROP INDEX {name}")
+    return dropped
+
+
+def _rebuild_indexes(cursor, names: List[str]) -> None:
+    if not names:
+        return
+    if DB_BACKEND == "sqlite":
+        for name in names:
+            cursor.execute(f"CREATE INDEX {name} ON trips ({DEFERRABLE_INDEXES[name]})")
+        return
+    # One ALTER builds all indexes in a single pass over the table
+    clauses = ", ".join(f"ADD INDEX {name} ({DEFERRABLE_INDEXES[name]})" for name in names)
+    cursor.execute(f"ALTER TABLE trips {clauses}")
+
+
+def insert_from_csv_bulk(csv_path: str, chunksize: int = 200000, defer_indexes: bool = False,
+                         force: bool = False) -> int:
+    """Bulk loader using LOAD DATA LOCAL INFILE. Returns total rows inserted.
+
+    Each chunk goes through _compute_features_chunk, is written to a temporary
+    TSV and pushed to the server in one statement. With ``defer_indexes`` the
+    secondary indexes are dropped first and rebuilt once after the last chunk;
+    the uq_trip_natural key always stays. Checkpointing and ``force`` work as
+    in insert_from_csv_chunked. Requires ``local_infile=ON`` on the MySQL server.
+
+    SQLite has no LOAD DATA; there each chunk is one executemany in a single
+    transaction, which is SQLite's fastest insert path.
+    """
+    conn = get_db_connection(allow_local_infile=True)
+    if conn is None:
+        raise RuntimeError("Database connection failed")
 
-        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
-            # Upsert vendors for this chunk
-            if 'vendor_id' in chunk.columns:
-                vendors = chunk['vendor_id'].dropna().unique().tolist()
-                for v in vendors:
-                    cursor.execute("INSERT IGNORE INTO vendors (vendor_id) VALUES (%s)", (v,))
-
-            prepared = _compute_features_chunk(chunk)
-
-            # Batch executemany for speed
-            rows = list(
-                zip(
-                    prepared['vendor_id'],
-                    prepared['pickup_datetime'],
-                    prepared['dropoff_datetime'],
-                    prepared['passenger_count'].astype(int),
-                    prepared['pickup_longitude'].astype(float),
-                    prepared['pickup_latitude'].astype(float),
-                    prepared['dropoff_longitude'].astype(float),
-                    prepared['dropoff_latitude'].astype(float),
-                    prepared['store_and_fwd_flag'],
-                    prepared['trip_duration'].astype(float),
-                    prepared['trip_distance_km'].astype(float),
-                    prepared['trip_duration_min'].astype(float),
-                    prepared['speed_kmh'].astype(float),
-                    prepared['fare_per_km'].astype(float),
-                )
-            )
-
-            if not rows:
-                continue
-
-            for i in range(0, len(rows), batch_size):
-                batch = rows[i:i+batch_size]
-                cursor.executemany(insert_trip_query, batch)
-                total_inserted += len(batch)
+    load_query = (
+        "LOAD DATA LOCAL INFILE %s INTO TABLE trips "
+        "CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' "
+        "(" + ", ".join(TRIP_COLUMNS) + ")"
+    )
 
-            conn.commit()
+    total_inserted = 0
+    dropped: List[str] = []
+    fd, tmp_path = tempfile.mkstemp(prefix="trips_", suffix=".tsv")
+    os.close(fd)
+    cursor = conn.cursor()
+
+    def load(frame: pd.DataFrame) -> int:
+        if DB_BACKEND == "sqlite":
+            return _insert_rows(cursor, frame, len(frame))
+        # LOCAL loads skip duplicate-key rows with a warning instead of failing
+        _write_tsv(frame, tmp_path)
+        cursor.execute(load_query, (tmp_path,))
+        return max(cursor.rowcount, 0)
 
+    try:
+        offset = begin_file(cursor, csv_path, force=force)
+        conn.commit()
+        if offset is None:
+            return 0
+
+        if defer_indexes:
+            cursor.execute("SET SESSION foreign_key_checks = 0")
+            dropped = _drop_deferrable_indexes(cursor)
+
+        with saving_state():
+            for chunk in iter_table(csv_path, chunksize, start_row=offset):
+                prepared = _quarantine_invalid(cursor, _compute_features_chunk(chunk), csv_path, offset)
+                offset += len(chunk)
+
+                _upsert_vendors(cursor, prepared['vendor_id'])
+                fresh = _insert_new(cursor, prepared, load)
+                total_inserted += len(fresh)
+                apply_rollups(cursor, fresh)
+                stats = record_anomalies(cursor, fresh)
+                checkpoint(cursor, csv_path, offset, len(fresh))
+                conn.commit()
+                bump_data_version()
+                merge_anomaly_stats(stats)
+                record_sketches(fresh)
+
+            finish_file(cursor, csv_path)
+            conn.commit()
+        refresh_snapshot_after_ingest()
         return total_inserted
     finally:
         try:
+            # Drop an unfinished chunk; SQLite would otherwise build the indexes inside it
+            conn.rollback()
+            _rebuild_indexes(cursor, dropped)
+            conn.commit()
+            if defer_indexes:
+                cursor.execute("SET SESSION foreign_key_checks = 1")
+        finally:
             cursor.close()
-        except Exception:
-            pass
-        conn.close()
+            conn.close()
+            os.remove(tmp_path)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,8 @@
-from typing import List, Dict, Any
+import heapq
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
 
 
 def rank_trips_by_efficiency(trips: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -54,3 +58,140 @@ def _to_float(value: Any) -> float | None:
         return None
 
 
+def score_columns(distance_km, duration_min, fare_amount=None, missing=None) -> Tuple[np.ndarray, ...]:
+    """Vectorized form of the rank_trips_by_efficiency score.
+
+    Takes whole columns and returns (valid, speed_kmh, fare_per_km, score,
+    has_fare_per_km) arrays. ``missing`` is an optional (distance, duration,
+    fare) tuple of masks for the values the scalar version sees as None;
+    without it NaN marks a missing value (a NULL in a query result). Any
+    other NaN is scored as the scalar version scores float("nan"). Rows with
+    missing distance/duration or duration <= 0 are not valid; fare_per_km
+    is only set where has_fare_per_km is.
+    """
+    distance = np.asarray(distance_km, dtype=np.float64)
+    duration = np.asarray(duration_min, dtype=np.float64)
+    if fare_amount is None:
+        fare = np.full(distance.shape, np.nan)
+    else:
+        fare = np.asarray(fare_amount, dtype=np.float64)
+    if missing is None:
+        missing = (np.isnan(distance), np.isnan(duration), np.isnan(fare))
+    distance_missing, duration_missing, fare_missing = missing
+
+    # A NaN duration is not <= 0, so the scalar version keeps it (at speed 0)
+    valid = ~distance_missing & ~duration_missing & ~(duration <= 0)
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        hours = duration / 60.0
+        speed = np.where(valid, np.where(hours > 0, distance / hours, 0.0), np.nan)
+        has_fare_per_km = ~fare_missing & (distance > 0)
+        fare_per_km = np.where(has_fare_per_km, fare / distance, np.nan)
+
+    # Same clamping as min()/max() above, including how they treat NaN
+    capped_speed = np.where(speed > 120.0, 120.0, speed)
+    capped_speed = np.where(capped_speed > 0.0, capped_speed, 0.0)
+    norm_speed = capped_speed / 120.0
+
+    capped_fare = np.where(fare_per_km > 10.0, 10.0, fare_per_km)
+    capped_fare = np.where(capped_fare > 0.5, capped_fare, 0.5)
+    priced = has_fare_per_km & ~(fare_per_km <= 0)
+    inv_fare_component = np.where(priced, (10.0 - capped_fare) / 9.5, 0.5)
+
+    score = 0.6 * norm_speed + 0.4 * inv_fare_component
+    return valid, speed, fare_per_km, score, has_fare_per_km
+
+
+def _float_column(values: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """``values`` as _to_float sees them: (floats, mask of values it maps to None)."""
+    try:
+        # Numbers and numeric strings convert directly; None becomes NaN
+        x = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        x = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(
+            dtype=np.float64, na_value=np.nan)
+    missing = np.zeros(len(x), dtype=bool)
+    # None, junk and NaN all read as NaN so far; settle those one by one
+    for i in np.flatnonzero(np.isnan(x)).tolist():
+        value = values[i]
+        value = None if value is None else _to_float(value)
+        if value is None:
+            missing[i] = True
+        else:
+            x[i] = value
+    return x, missing
+
+
+def top_k_indices(score: np.ndarray, valid: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+    """Indices of the k best valid scores, best first, ties in input order.
+
+    Uses argpartition, so selecting k of n rows costs O(n + k log k).
+    """
+    candidates = np.flatnonzero(valid)
+    if k is not None and k < len(candidates):
+        cand_scores = score[candidates]
+        if k <= 0:
+            return candidates[:0]
+        threshold = cand_scores[np.argpartition(-cand_scores, k - 1)[k - 1]]
+        above = candidates[cand_scores > threshold]
+        at = candidates[cand_scores == threshold][:k - len(above)]
+        candidates = np.concatenate([above, at])
+    # Stable sort on -score keeps equal scores in input order, as list.sort does
+    return candidates[np.argsort(-score[candidates], kind="stable")]
+
+
+def rank_trips_vectorized(trips: List[Dict[str, Any]], k: Optional[int] = None) -> List[Dict[str, Any]]:
+    """NumPy-backed rank_trips_by_efficiency that can stop at the top ``k`` trips."""
+    columns = [_float_column([trip.get(c) for trip in trips])
+               for c in ("trip_distance_km", "trip_duration_min", "fare_amount")]
+    valid, speed, fare_per_km, score, has_fare_per_km = score_columns(
+        *(x for x, _ in columns), missing=tuple(m for _, m in columns))
+
+    ranked = []
+    for i in top_k_indices(score, valid, k):
+        trip_with_score = dict(trips[i])
+        trip_with_score["speed_kmh"] = float(speed[i])
+        if has_fare_per_km[i]:
+            trip_with_score["fare_per_km"] = float(fare_per_km[i])
+        trip_with_score["efficiency_score"] = float(score[i])
+        ranked.append(trip_with_score)
+    return ranked
+
+
+def top_k_streaming(chunks: Iterable[pd.DataFrame], k: int) -> List[Dict[str, Any]]:
+    """Top ``k`` trips over an iterable of DataFrame chunks with bounded memory.
+
+    Each chunk is scored as a whole; only its own top k rows reach a min-heap
+    of size k. Chunks need trip_distance_km and trip_duration_min columns and
+    may have fare_amount; NaN in them is a NULL, scored like None. Ties keep
+    stream order.
+    """
+    heap: List[Tuple[float, int, Dict[str, Any]]] = []
+    offset = 0
+    for chunk in chunks:
+        fare = chunk["fare_amount"] if "fare_amount" in chunk.columns else None
+        valid, speed, fare_per_km, score, has_fare_per_km = score_columns(
+            chunk["trip_distance_km"], chunk["trip_duration_min"], fare)
+
+        selected = []
+        for i in top_k_indices(score, valid, k):
+            # Negated position: on equal scores the earlier row ranks higher
+            key = (float(score[i]), -(offset + int(i)))
+            if len(heap) >= k and key <= heap[0][:2]:
+                break
+            selected.append((int(i), key))
+
+        rows = chunk.iloc[[i for i, _ in selected]].to_dict("records")
+        for (i, key), row in zip(selected, rows):
+            row["speed_kmh"] = float(speed[i])
+            if has_fare_per_km[i]:
+                row["fare_per_km"] = float(fare_per_km[i])
+            row["efficiency_score"] = key[0]
+            if len(heap) < k:
+                heapq.heappush(heap, (key[0], key[1], row))
+            else:
+                heapq.heappushpop(heap, (key[0], key[1], row))
+        offset += len(chunk)
+
+    return [row for _, _, row in sorted(heap, key=lambda item: (item[0], item[1]), reverse=True)]
+
@@ -0,0 +1,129 @@
+"""
+Compact record of the rows that cleaning and feature engineering drop.
+
+Each stage computes one reason code per row in a single pass (0 keeps the
+row; a row failing several checks gets the first reason that applies) and
+hands the codes to ExclusionLog.record(). Only excluded rows are written,
+as ``source_row,id,reason`` lines in EXCLUDED_ROWS_FILE, where source_row
+is the row's position in the stage's input file. Per-reason counters and
+the first ``sample_rows`` rows of each reason, in full, go to the
+human-readable LOG_FILE when the log is closed.
+"""
+import os
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOG_FILE = os.path.join(BASE_DIR, "data/logs/excluded_records.log")
+EXCLUDED_ROWS_FILE = os.path.join(BASE_DIR, "data/logs/excluded_rows.csv")
+SAMPLE_ROWS = int(os.getenv("EXCLUSION_SAMPLE_ROWS", "5"))
+
+DUPLICATE = 1
+MISSING_CRITICAL = 2
+INVALID_DATE = 3
+UNREALISTIC_SPEED = 4
+INVALID_FARE_PER_KM = 5
+
+REASONS = {
+    DUPLICATE: "duplicate",
+    MISSING_CRITICAL: "missing_critical",
+    INVALID_DATE: "invalid_date",
+    UNREALISTIC_SPEED: "unrealistic_speed",
+    INVALID_FARE_PER_KM: "invalid_fare_per_km",
+}
+_NAMES = np.array([""] + [REASONS[code] for code in sorted(REASONS)], dtype=object)
+
+
+def reason_codes(*checks) -> np.ndarray:
+    """Combine ``(code, mask)`` checks into one int8 code per row, earliest check first."""
+    codes = np.zeros(len(checks[0][1]), dtype=np.int8)
+    for code, mask in reversed(checks):
+        codes[np.asarray(mask, dtype=bool)] = code
+    return codes
+
+
+class ExclusionLog:
+    """Writes excluded row ids and reasons; usable as a context manager.
+
+    ``append`` adds to the files of an earlier stage instead of starting
+    them afresh. ``log_path=None`` skips the human-readable log.
+    """
+
+    def __init__(self, excluded_path: str = EXCLUDED_ROWS_FILE, log_path: Optional[str] = LOG_FILE,
+                 sample_rows: int = SAMPLE_ROWS, append: bool = False, stage: str = ""):
+        os.makedirs(os.path.dirname(excluded_path) or ".", exist_ok=True)
+        new = not append or not os.path.exists(excluded_path) or os.path.getsize(excluded_path) == 0
+        self._rows = open(excluded_path, "a" if append else "w")
+        if new:
+            self._rows.write("source_row,id,reason\n")
+        self.log_path = log_path
+        self.append = append
+        self.stage = stage
+        self.sample_rows = sample_rows
+        self._counts = np.zeros(len(_NAMES), dtype=np.int64)
+        self._samples = {code: [] for code in REASONS}
+        self._sampled = dict.fromkeys(REASONS, 0)
+
+    def record(self, df: pd.DataFrame, codes: np.ndarray, first_row: int = 0) -> None:
+        """Record the rows of ``df`` with a non-zero code; ``first_row`` is df's offset in the input."""
+        excluded = np.flatnonzero(codes)
+        if not len(excluded):
+            return
+        excluded_codes = codes[excluded]
+        self._counts += np.bincount(excluded_codes, minlength=len(_NAMES))
+
+        ids = df["id"].to_numpy()[excluded] if "id" in df.columns else ""
+        pd.DataFrame({
+            "source_row": excluded + first_row,
+            "id": ids,
+            "reason": _NAMES[excluded_codes],
+        }).to_csv(self._rows, header=False, index=False)
+
+        if self.log_path is None:
+            return
+        for code in np.unique(excluded_codes).tolist():
+            need = self.sample_rows - self._sampled[code]
+            if need > 0:
+                rows = excluded[excluded_codes == code][:need]
+                self._samples[code].append(df.iloc[rows])
+                self._sampled[code] += len(rows)
+
+    def tell(self) -> int:
+        """Position in the row file, for rewind()."""
+        self._rows.flush()
+        return self._rows.tell()
+
+    def rewind(self, position: int) -> None:
+        """Forget the rows written since tell() returned ``position`` (counts and samples are kept)."""
+        self._rows.flush()
+        self._rows.truncate(position)
+        self._rows.seek(position)
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        return {REASONS[code]: int(self._counts[code]) for code in REASONS if self._counts[code]}
+
+    def close(self) -> None:
+        self._rows.close()
+        if self.log_path is None:
+            return
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        with open(self.log_path, "a" if self.append else "w") as log:
+            title = f"{self.stage} excluded rows" if self.stage else "Excluded rows"
+            log.write(f"=== {title}: {int(self._counts.sum())} (ids in {self._rows.name}) ===\n")
+            for name, count in self.counts.items():
+                log.write(f"{name}: {count}\n")
+            log.write("\n")
+            for code, frames in self._samples.items():
+                if frames:
+                    log.write(f"--- {REASONS[code]}: first {self._sampled[code]} of {self._counts[code]} ---\n")
+                    log.write(pd.concat(frames).to_string(index=False) + "\n\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
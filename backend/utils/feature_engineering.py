@@ -1,32 +1,29 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
 
+# Allow running this module directly as a script
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.utils.columnar import TableWriter, iter_table
+from backend.utils.exclusions import (
+    EXCLUDED_ROWS_FILE, INVALID_FARE_PER_KM, LOG_FILE, UNREALISTIC_SPEED, ExclusionLog, reason_codes,
+)
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # Paths
-CLEANED_FILE = os.path.join(BASE_DIR, "data/cleaned/cleaned_trips.csv")
+CLEANED_FILE = os.path.join(BASE_DIR, "data/cleaned/cleaned_trips.parquet")
 FEATURED_DIR = os.path.join(BASE_DIR, "data/cleaned/")
-FEATURED_FILE = os.path.join(FEATURED_DIR, "featured_trips.csv")
-LOG_FILE = os.path.join(BASE_DIR, "data/logs/excluded_records.log")
-
-
-os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
-
+FEATURED_FILE = os.path.join(FEATURED_DIR, "featured_trips.parquet")
 
-def log_message(title, df):
-    """Write removed rows to log file"""
-    with open(LOG_FILE, "a") as log:
-        log.write(f"=== {title} ===\n")
-        log.write(df.to_string(index=False) + "\n\n")
-
-
-def add_features(cleaned_file=CLEANED_FILE, featured_file=FEATURED_FILE):
-    """Add derived features, handle outliers, and save featured dataset"""
-
-    df = pd.read_csv(cleaned_file)
 
+def derive_features(df: pd.DataFrame) -> np.ndarray:
+    """Add the derived columns to ``df`` in place and return one exclusion code
+    per row (0 keeps it): unrealistic speeds and non-positive fares per km."""
     if "trip_duration_min" not in df.columns:
         df["trip_duration_min"] = pd.to_numeric(
             df["trip_duration"], errors="coerce") / 60
@@ -51,29 +48,39 @@ def add_features(cleaned_file=CLEANED_FILE, featured_file=FEATURED_FILE):
 
     df["estimated_fare"] = base_fare + (df["trip_distance_km"] * cost_per_km)
 
-    invalid_rows = pd.DataFrame()
-
-    invalid_speed = df[(df["speed_kmh"] <= 0) | (df["speed_kmh"] > 150)]
-    if not invalid_speed.empty:
-        log_message("Removed unrealistic speeds", invalid_speed)
-        invalid_rows = pd.concat([invalid_rows, invalid_speed])
+    # NaN speeds and fares are kept, as before
+    speed = df["speed_kmh"].to_numpy(dtype=float)
+    fare_per_km = df["fare_per_km"].to_numpy(dtype=float)
+    return reason_codes(
+        (UNREALISTIC_SPEED, (speed <= 0) | (speed > 150)),
+        (INVALID_FARE_PER_KM, fare_per_km <= 0),
+    )
 
-    invalid_fare = df[df["fare_per_km"] <= 0]
-    if not invalid_fare.empty:
-        log_message("Removed invalid fare/km", invalid_fare)
-        invalid_rows = pd.concat([invalid_rows, invalid_fare])
 
-    df = df.drop(index=invalid_rows.index)
+def add_features(cleaned_file=CLEANED_FILE, featured_file=FEATURED_FILE, log_path=LOG_FILE,
+                 excluded_path=EXCLUDED_ROWS_FILE, chunksize=100000):
+    """Add derived features, handle outliers, and save featured dataset.
 
+    The cleaned file is read and written ``chunksize`` rows at a time, so
+    memory does not grow with the file. Dropped rows are appended to the
+    exclusion files that cleaning started. Returns the number of rows written.
+    """
     os.makedirs(os.path.dirname(featured_file), exist_ok=True)
 
-    df.to_csv(featured_file, index=False)
+    first_row = 0
+    with ExclusionLog(excluded_path, log_path, append=True, stage="Feature engineering") as exclusions, \
+            TableWriter(featured_file) as writer:
+        for chunk in iter_table(cleaned_file, chunksize):
+            codes = derive_features(chunk)
+            exclusions.record(chunk, codes, first_row)
+            writer.write(chunk[codes == 0])
+            first_row += len(chunk)
 
     print(
         f"Feature engineering done. Featured dataset saved to {featured_file}")
-    print(f"Excluded rows are logged in {LOG_FILE}")
+    print(f"Excluded rows are listed in {excluded_path}, with a summary in {log_path}")
 
-    return df
+    return writer.rows
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+"""
+Fixed lat/lon grid used to index trip pickup and dropoff points.
+
+Each point maps to an integer cell id, row-major over a grid of
+GRID_CELL_DEG degree cells, so the cells of one grid row that fall inside a
+bounding box form a contiguous id range. A box or radius search therefore
+becomes a handful of ``cell BETWEEN a AND b`` index ranges plus an exact
+filter, instead of a B-tree range on latitude alone.
+"""
+import math
+from typing import List, Tuple
+
+import numpy as np
+
+GRID_CELL_DEG = 0.002  # ~220 m north-south, ~170 m east-west at NYC
+GRID_COLS = int(round(360 / GRID_CELL_DEG))
+EARTH_RADIUS_KM = 6371.0
+MAX_CELL_RANGES = 200
+
+
+def cell_ids(lat, lon, cell_deg: float = GRID_CELL_DEG) -> np.ndarray:
+    """Vectorized cell id for arrays of coordinates.
+
+    Coordinates are rounded to float32 first, the precision of the FLOAT
+    columns in MySQL, so ids agree with what a backfill computes in SQL.
+    A coarser ``cell_deg`` gives a separate, coarser grid.
+    """
+    lat = np.asarray(lat, dtype=np.float32).astype(np.float64)
+    lon = np.asarray(lon, dtype=np.float32).astype(np.float64)
+    row = np.floor((lat + 90.0) / cell_deg)
+    col = np.floor((lon + 180.0) / cell_deg)
+    return (row * int(round(360 / cell_deg)) + col).astype(np.int64)
+
+
+def cell_ranges_for_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[Tuple[int, int]]:
+    """Return inclusive (first, last) cell id ranges, one per grid row, covering the box."""
+    if min_lat > max_lat or min_lon > max_lon:
+        raise ValueError("Bounding box minimums must not exceed maximums")
+    row_lo = math.floor((min_lat + 90.0) / GRID_CELL_DEG)
+    row_hi = math.floor((max_lat + 90.0) / GRID_CELL_DEG)
+    col_lo = math.floor((min_lon + 180.0) / GRID_CELL_DEG)
+    col_hi = math.floor((max_lon + 180.0) / GRID_CELL_DEG)
+    if row_hi - row_lo + 1 > MAX_CELL_RANGES:
+        raise ValueError("Search area too large")
+    return [(row * GRID_COLS + col_lo, row * GRID_COLS + col_hi) for row in range(row_lo, row_hi + 1)]
+
+
+def bbox_for_radius(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """Bounding box (min_lat, min_lon, max_lat, max_lon) of a circle around a point."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    coslat = max(math.cos(math.radians(lat)), 1e-6)
+    dlon = min(180.0, math.degrees(radius_km / (EARTH_RADIUS_KM * coslat)))
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+def cell_range_sql(column: str, ranges: List[Tuple[int, int]]) -> Tuple[str, list]:
+    """SQL predicate (with params) matching ``column`` against cell id ranges."""
+    clause = " OR ".join(f"{column} BETWEEN %s AND %s" for _ in ranges)
+    params = [v for r in ranges for v in r]
+    return f"({clause})", params
+
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Vectorized great-circle distance in km; takes arrays, Series or scalars."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_sql(lat_col: str, lon_col: str) -> str:
+    """Great-circle distance in km between the given columns and a point passed
+    as params (lat, lat, lon)."""
+    return (
+        f"{EARTH_RADIUS_KM} * 2 * ASIN(SQRT("
+        f"POW(SIN(RADIANS({lat_col} - %s) / 2), 2) + "
+        f"COS(RADIANS(%s)) * COS(RADIANS({lat_col})) * "
+        f"POW(SIN(RADIANS({lon_col} - %s) / 2), 2)))"
+    )
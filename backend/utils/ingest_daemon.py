@@ -0,0 +1,556 @@
+"""
+Watch-folder ingest daemon: raw trip files dropped into INGEST_WATCH_DIR
+become queryable within seconds, without anyone running a loader.
+
+Upstream writes raw TLC files (CSV or Parquet, the columns of
+trip_schema.RAW_COLUMNS) into the folder. A file is ready once its writer
+closed it or renamed it into the folder, which Linux reports through
+inotify; elsewhere, or with INGEST_WATCH_MODE=poll, the folder is rescanned
+every INGEST_POLL_SECONDS and a file is ready once it has not changed for
+INGEST_SETTLE_SECONDS. Names starting with "." and other extensions (e.g.
+"trips.csv.part") are ignored, so writing under a temporary name and
+renaming is always safe.
+
+A ready file is claimed by renaming it into processing/, runs through the
+cleaning and feature filters chunk by chunk (dropped rows are listed in
+``<name>.excluded.csv``), and is inserted like any other load: quarantine,
+natural-key dedup, rollups, anomalies and sketches. Rows from one or more
+files are committed in micro-batches of about INGEST_BATCH_ROWS rows, or
+whatever has been read when INGEST_BATCH_SECONDS have passed since the
+batch's first row. Each batch commits together with the ingest_ledger
+checkpoint of every file in it. A loaded file moves to done/; one that
+cannot be read, or whose batches fail INGEST_MAX_ATTEMPTS times in a row,
+moves to failed/ with a ``<name>.error.txt`` beside it.
+
+SIGTERM and SIGINT commit the open batch and stop. Files still in
+processing/ are resumed from their ledger checkpoint on the next start
+(rows replayed after a crash are absorbed by the natural-key index).
+
+Throughput, backlog and lag are exported in the Prometheus text format on
+INGEST_DAEMON_METRICS_PORT (0 disables the endpoint).
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import signal
+import struct
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, NamedTuple, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+from backend.config.db_connection import db_connection
+from backend.utils import metrics
+from backend.utils.anomaly_detection import merge_anomaly_stats, record_anomalies
+from backend.utils.columnar import PARQUET_EXTENSIONS, iter_table
+from backend.utils.data_cleaning import RowHashSet, clean_chunk
+from backend.utils.db_insert import (
+    _compute_features_chunk, _insert_new, _insert_rows, _quarantine_invalid, _upsert_vendors,
+)
+from backend.utils.exclusions import ExclusionLog
+from backend.utils.feature_engineering import derive_features
+from backend.utils.ingest_ledger import begin_file, checkpoint, finish_file
+from backend.utils.ingest_state import saving_state
+from backend.utils.response_cache import bump_data_version
+from backend.utils.rollups import apply_rollups
+from backend.utils.sketches import record_sketches
+from backend.utils.snapshot import refresh_snapshot_after_ingest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WATCH_DIR = os.getenv("INGEST_WATCH_DIR", os.path.join(BASE_DIR, "data/incoming"))
+WATCH_MODE = os.getenv("INGEST_WATCH_MODE", "auto").lower()  # auto, inotify or poll
+BATCH_ROWS = int(os.getenv("INGEST_BATCH_ROWS", "50000"))
+BATCH_SECONDS = float(os.getenv("INGEST_BATCH_SECONDS", "2"))
+SETTLE_SECONDS = float(os.getenv("INGEST_SETTLE_SECONDS", "2"))
+POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", "1"))
+MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+METRICS_HOST = os.getenv("INGEST_DAEMON_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("INGEST_DAEMON_METRICS_PORT", "9108"))
+
+if WATCH_MODE not in ("auto", "inotify", "poll"):
+    raise ValueError(f"INGEST_WATCH_MODE must be 'auto', 'inotify' or 'poll', not {WATCH_MODE!r}")
+
+EXTENSIONS = (".csv",) + PARQUET_EXTENSIONS
+PROCESSING, DONE, FAILED = "processing", "done", "failed"
+LOCK_NAME = ".ingest_daemon.lock"
+LAG_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+FILES = metrics.Counter("ingest_daemon_files_total", "Files finished, by outcome.", ("status",))
+ROWS = metrics.Counter("ingest_daemon_rows_total",
+                       "Source rows by outcome: excluded by cleaning/features, quarantined, "
+                       "inserted, or already loaded.", ("outcome",))
+BATCH_SECONDS_HISTOGRAM = metrics.Histogram("ingest_daemon_batch_seconds",
+                                            "Time to insert and commit one micro-batch.",
+                                            metrics.LATENCY_BUCKETS)
+LAG_SECONDS = metrics.Histogram("ingest_daemon_lag_seconds",
+                                "Time from a file's last write until its last rows were committed.",
+                                LAG_BUCKETS)
+BACKLOG = metrics.Gauge("ingest_daemon_backlog_files", "Files waiting in the folder or being loaded.", ("state",))
+OLDEST_SECONDS = metrics.Gauge("ingest_daemon_oldest_pending_seconds",
+                               "Time since the last write of the oldest file not yet loaded.")
+ROWS_PER_SECOND = metrics.Gauge("ingest_daemon_rows_per_second",
+                                "Source rows per second over the last micro-batch, reading included.")
+LAST_COMMIT = metrics.Gauge("ingest_daemon_last_commit_timestamp_seconds",
+                            "Unix time of the last committed micro-batch.")
+DAEMON_METRICS = [FILES, ROWS, BATCH_SECONDS_HISTOGRAM, LAG_SECONDS, BACKLOG, OLDEST_SECONDS,
+                  ROWS_PER_SECOND, LAST_COMMIT]
+
+
+def render_metrics() -> str:
+    """The daemon's metrics followed by the DB metrics of metrics.render()."""
+    lines = []
+    for metric in DAEMON_METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n" + metrics.render()
+
+
+def _eligible(name: str) -> bool:
+    return not name.startswith(".") and name.lower().endswith(EXTENSIONS)
+
+
+def _excluded_path(path: str) -> str:
+    """Exclusion list of a claimed file; hidden while it is in processing/."""
+    return os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.excluded.csv")
+
+
+class _Inotify:
+    """Names written and closed, or moved, into one directory (Linux inotify via libc)."""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    _EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        # IN_NONBLOCK and IN_CLOEXEC share the values of the O_ flags
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout: float) -> Set[str]:
+        names = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return names
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return names
+        pos = 0
+        while pos < len(data):
+            _, _, _, length = self._EVENT.unpack_from(data, pos)
+            pos += self._EVENT.size
+            name = data[pos:pos + length].rstrip(b"\0")
+            pos += length
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class _Poll:
+    """Fallback watcher: just sleeps; the folder scan finds new files."""
+
+    def __init__(self, stop: threading.Event):
+        self.stop = stop
+
+    def wait(self, timeout: float) -> Set[str]:
+        self.stop.wait(timeout)
+        return set()
+
+    def close(self) -> None:
+        pass
+
+
+class _FileLoad:
+    """A claimed file: where reading and committing have got to, and its duplicate state."""
+
+    def __init__(self, path: str, start_row: int, chunksize: int):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.landed = os.path.getmtime(path)
+        self.chunksize = chunksize
+        self.exclusions = ExclusionLog(_excluded_path(path), log_path=None, append=True)
+        self.excluded_committed = self.exclusions.tell()
+        self.attempts = 0
+        self.rewind(start_row)
+
+    def commit(self, row: int) -> None:
+        self.committed = row
+        self.excluded_committed = self.exclusions.tell()
+        self.attempts = 0
+
+    def rewind(self, row: int) -> None:
+        """Read again from source row ``row`` (the last committed checkpoint)."""
+        self.exclusions.rewind(self.excluded_committed)
+        self.committed = row
+        self.offset = row
+        self.exhausted = False
+        # Duplicates against rows before the checkpoint are left to the natural-key index
+        self.seen = RowHashSet()
+        self.chunks = iter_table(self.path, self.chunksize, start_row=row)
+
+    def close(self) -> None:
+        self.exclusions.close()
+
+
+class _Segment(NamedTuple):
+    """Rows of one file read since the last commit; ``last`` marks the end of the file."""
+    load: _FileLoad
+    end_row: int
+    source_rows: int
+    prepared: Optional[pd.DataFrame] = None
+    positions: Optional[np.ndarray] = None
+    last: bool = False
+
+
+class IngestDaemon:
+    """Watches one folder; see the module docstring. Defaults come from the environment."""
+
+    def __init__(self, watch_dir: str = WATCH_DIR, batch_rows: int = BATCH_ROWS,
+                 batch_seconds: float = BATCH_SECONDS, settle_seconds: float = SETTLE_SECONDS,
+                 poll_seconds: float = POLL_SECONDS, watch_mode: str = WATCH_MODE,
+                 metrics_port: int = METRICS_PORT, batch_size: int = 1000):
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.dirs = {d: os.path.join(self.watch_dir, d) for d in (PROCESSING, DONE, FAILED)}
+        self.batch_rows = batch_rows
+        self.batch_seconds = batch_seconds
+        self.settle_seconds = settle_seconds
+        self.poll_seconds = poll_seconds
+        self.watch_mode = watch_mode
+        self.metrics_port = metrics_port
+        self.batch_size = batch_size
+        self.stop = threading.Event()
+
+        self.loads: List[_FileLoad] = []
+        self.batch: List[_Segment] = []
+        self.batch_started = None  # monotonic time the open batch's first rows were read
+        self.closed: Set[str] = set()  # names inotify reported as finished
+
+    # --- lifecycle -------------------------------------------------------
+
+    def request_stop(self, *_) -> None:
+        self.stop.set()
+
+    def install_signal_handlers(self) -> None:
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+
+    @contextmanager
+    def _single_instance(self):
+        for d in self.dirs.values():
+            os.makedirs(d, exist_ok=True)
+        with open(os.path.join(self.watch_dir, LOCK_NAME), "a") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise RuntimeError(f"Another ingest daemon is watching {self.watch_dir}") from None
+            yield
+
+    def _watcher(self):
+        if self.watch_mode != "poll":
+            try:
+                return _Inotify(self.watch_dir)
+            except (OSError, AttributeError) as e:
+                if self.watch_mode == "inotify":
+                    raise
+                print(f"inotify unavailable ({e}), polling every {self.poll_seconds}s")
+        return _Poll(self.stop)
+
+    def _serve_metrics(self) -> Optional[ThreadingHTTPServer]:
+        if not self.metrics_port:
+            return None
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render_metrics().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", metrics.CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((METRICS_HOST, self.metrics_port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="ingest-daemon-metrics", daemon=True).start()
+        return server
+
+    def run(self, once: bool = False) -> None:
+        """Load files until stopped; with ``once``, load what is in the folder now and return.
+
+        ``once`` takes every file present as finished, without waiting for it to settle.
+        """
+        with self._single_instance():
+            server = self._serve_metrics()
+            watcher = self._watcher()
+            failures = 0
+            print(f"Watching {self.watch_dir} ({type(watcher).__name__.strip('_').lower()})")
+            try:
+                while not self.stop.is_set():
+                    try:
+                        busy = self._step(once)
+                        failures = 0
+                    except Exception as e:  # the database is unreachable, most likely
+                        failures += 1
+                        print(f"Ingest daemon error, retrying: {e}")
+                        self.stop.wait(min(60.0, 2.0 ** failures))
+                        continue
+                    if busy:
+                        continue
+                    if once and not self.batch and not self.loads:
+                        break
+                    self.closed |= watcher.wait(self._idle_timeout(once))
+                if self.batch:
+                    self._flush()
+            finally:
+                for load in self.loads:
+                    load.close()
+                watcher.close()
+                if server is not None:
+                    server.shutdown()
+                    server.server_close()
+            print(f"Stopped; {len(self.loads)} file(s) left in {self.dirs[PROCESSING]} to resume")
+
+    def _idle_timeout(self, once: bool) -> float:
+        if not self.batch:
+            return self.poll_seconds
+        if once:
+            return 0.0
+        return max(0.0, min(self.poll_seconds, self.batch_started + self.batch_seconds - time.monotonic()))
+
+    # --- one unit of work ------------------------------------------------
+
+    def _step(self, once: bool) -> bool:
+        """Claim and register ready files, then read one chunk or commit a due
+        batch. False when there was nothing to read."""
+        self._claim_ready(once)
+        self._register_claimed()
+        load = next((l for l in self.loads if not l.exhausted), None)
+        if load is not None:
+            self._read(load)
+        if self.batch and (self._batch_source_rows() >= self.batch_rows
+                           or time.monotonic() - self.batch_started >= self.batch_seconds
+                           or (once and load is None)):
+            self._flush()
+            return True
+        return load is not None
+
+    def _batch_source_rows(self) -> int:
+        return sum(seg.source_rows for seg in self.batch)
+
+    def _claim_ready(self, once: bool) -> None:
+        """Move finished files from the folder into processing/, oldest first."""
+        now = time.time()
+        waiting = []
+        with os.scandir(self.watch_dir) as entries:
+            for entry in entries:
+                if _eligible(entry.name) and entry.is_file():
+                    waiting.append((entry.stat().st_mtime, entry.name))
+        waiting.sort()
+        self.closed &= {name for _, name in waiting}
+
+        for mtime, name in waiting:
+            if not (once or name in self.closed or now - mtime >= self.settle_seconds):
+                continue
+            target = os.path.join(self.dirs[PROCESSING], name)
+            if os.path.exists(target):
+                continue  # an earlier file of that name is still loading
+            try:
+                os.rename(os.path.join(self.watch_dir, name), target)
+            except FileNotFoundError:
+                continue
+            self.closed.discard(name)
+
+        remaining = [(m, n) for m, n in waiting if os.path.exists(os.path.join(self.watch_dir, n))]
+        BACKLOG.set(("waiting",), len(remaining))
+        BACKLOG.set(("loading",), len(self.loads))
+        landed = [m for m, _ in remaining] + [load.landed for load in self.loads]
+        OLDEST_SECONDS.set((), max(0.0, now - min(landed)) if landed else 0.0)
+
+    def _register_claimed(self) -> None:
+        """Start a ledger entry for each claimed file not being loaded yet,
+        including files left in processing/ by an earlier run."""
+        tracked = {load.path for load in self.loads}
+        claimed = sorted(
+            (entry.stat().st_mtime, entry.path)
+            for entry in os.scandir(self.dirs[PROCESSING])
+            if _eligible(entry.name) and entry.is_file() and entry.path not in tracked)
+        for _, path in claimed:
+            # Errors propagate to run(), which backs off; the file stays claimed
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    start_row = begin_file(cursor, path)
+                    conn.commit()
+                finally:
+                    cursor.close()
+            if start_row is None:
+                print(f"{os.path.basename(path)}: already loaded, skipped")
+                self._move_out(path, DONE)
+                FILES.inc(("skipped",))
+                continue
+            self.loads.append(_FileLoad(path, start_row, self.batch_rows))
+            if start_row:
+                print(f"{os.path.basename(path)}: resuming at row {start_row}")
+
+    def _read(self, load: _FileLoad) -> None:
+        """Clean, filter and prepare the next chunk of ``load`` into the open batch."""
+        try:
+            chunk = next(load.chunks, None)
+            if chunk is None:
+                load.exhausted = True
+                self._add(_Segment(load, load.offset, 0, last=True))
+                return
+            chunk = chunk.reset_index(drop=True)
+            first_row = load.offset
+            cleaned = clean_chunk(chunk, load.seen, load.exclusions, first_row)
+            codes = derive_features(cleaned)
+            if codes.any():
+                # Feature codes are per cleaned row; the log wants source positions
+                full = np.zeros(len(chunk), dtype=np.int8)
+                full[cleaned.index.to_numpy()] = codes
+                load.exclusions.record(chunk, full, first_row)
+            kept = cleaned[codes == 0]
+            prepared = _compute_features_chunk(kept)
+        except Exception as e:
+            self._fail(load, e)
+            return
+        load.offset += len(chunk)
+        ROWS.inc(("excluded",), len(chunk) - len(kept))
+        self._add(_Segment(load, load.offset, len(chunk), prepared, kept.index.to_numpy() + first_row))
+
+    def _add(self, segment: _Segment) -> None:
+        if not self.batch:
+            self.batch_started = time.monotonic()
+        self.batch.append(segment)
+
+    # --- commit ----------------------------------------------------------
+
+    def _flush(self) -> None:
+        """Insert the open batch and checkpoint its files in one transaction."""
+        batch, self.batch = self.batch, []
+        started = time.perf_counter()
+        inserted, fresh_frames, stats = 0, [], []
+        with saving_state():
+            try:
+                with db_connection() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        for seg in batch:
+                            if seg.prepared is not None:
+                                valid = _quarantine_invalid(cursor, seg.prepared, seg.load.path,
+                                                            source_rows=seg.positions)
+                                ROWS.inc(("quarantined",), len(seg.prepared) - len(valid))
+                                _upsert_vendors(cursor, valid['vendor_id'])
+                                fresh = _insert_new(cursor, valid,
+                                                    lambda frame: _insert_rows(cursor, frame, self.batch_size))
+                                apply_rollups(cursor, fresh)
+                                stats.append(record_anomalies(cursor, fresh))
+                                checkpoint(cursor, seg.load.path, seg.end_row, len(fresh))
+                                ROWS.inc(("duplicate",), len(valid) - len(fresh))
+                                inserted += len(fresh)
+                                fresh_frames.append(fresh)
+                            if seg.last:
+                                finish_file(cursor, seg.load.path)
+                        conn.commit()
+                    finally:
+                        cursor.close()
+            except Exception as e:
+                self._retry(batch, e)
+                return
+
+            bump_data_version()
+            for segment_stats in stats:
+                merge_anomaly_stats(segment_stats)
+            for fresh in fresh_frames:
+                record_sketches(fresh)
+        refresh_snapshot_after_ingest()
+
+        now = time.time()
+        elapsed = time.perf_counter() - started
+        source_rows = sum(seg.source_rows for seg in batch)
+        wall = time.monotonic() - self.batch_started if self.batch_started is not None else elapsed
+        ROWS.inc(("inserted",), inserted)
+        BATCH_SECONDS_HISTOGRAM.observe((), elapsed)
+        ROWS_PER_SECOND.set((), source_rows / wall if wall > 0 else 0.0)
+        LAST_COMMIT.set((), now)
+        print(f"Committed {source_rows} rows ({inserted} inserted) from "
+              f"{len({seg.load.path for seg in batch})} file(s) in {elapsed:.2f}s")
+
+        for seg in batch:
+            seg.load.commit(seg.end_row)
+        for seg in batch:
+            if seg.last:
+                LAG_SECONDS.observe((), max(0.0, now - seg.load.landed))
+                self._finish(seg.load, DONE)
+                FILES.inc(("loaded",))
+
+    def _retry(self, batch: List[_Segment], error: Exception) -> None:
+        """The batch rolled back: rewind its files to their checkpoints, or give up on them."""
+        print(f"Micro-batch failed, rolled back: {error}")
+        attempts = 0
+        for load in {id(seg.load): seg.load for seg in batch}.values():
+            load.attempts += 1
+            if load.attempts >= MAX_ATTEMPTS:
+                self._fail(load, error)
+            else:
+                load.rewind(load.committed)
+                attempts = max(attempts, load.attempts)
+        if attempts:
+            self.stop.wait(min(30.0, 2.0 ** attempts))
+
+    # --- moving files out ------------------------------------------------
+
+    def _fail(self, load: _FileLoad, error: Exception) -> None:
+        print(f"{load.name}: failed, moved to {FAILED}/: {error}")
+        self.batch = [seg for seg in self.batch if seg.load is not load]
+        self._finish(load, FAILED, error)
+        FILES.inc(("failed",))
+
+    def _finish(self, load: _FileLoad, folder: str, error: Optional[Exception] = None) -> None:
+        load.close()
+        self.loads.remove(load)
+        self._move_out(load.path, folder, error)
+
+    def _move_out(self, path: str, folder: str, error: Optional[Exception] = None) -> None:
+        """Move a claimed file (and its exclusion list) to done/ or failed/,
+        renaming it if an earlier file of the same name is there."""
+        directory = self.dirs[folder]
+        name = os.path.basename(path)
+        stem, ext = os.path.splitext(name)
+        target = os.path.join(directory, name)
+        if os.path.exists(target):
+            target = os.path.join(directory, f"{stem}.{time.strftime('%Y%m%dT%H%M%S')}{ext}")
+            n = 1
+            while os.path.exists(target):
+                target = os.path.join(directory, f"{stem}.{time.strftime('%Y%m%dT%H%M%S')}-{n}{ext}")
+                n += 1
+        os.replace(path, target)
+        if os.path.exists(_excluded_path(path)):
+            os.replace(_excluded_path(path), target + ".excluded.csv")
+        if error is not None:
+            with open(target + ".error.txt", "w") as f:
+                f.write("".join(traceback.format_exception(type(error), error, error.__traceback__)))
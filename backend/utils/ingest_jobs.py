@@ -0,0 +1,235 @@
+"""
+Background ingest jobs.
+
+POST /api/trips/ingest records a job in ingest_jobs and hands it to a small
+thread pool in the web process; the loader (insert_from_csv_chunked) updates
+the job row in the same transaction as each chunk, so progress is visible to
+every worker process and always matches what has been committed.
+
+Cancellation is a flag on the job row, checked after every chunk. A
+cancelled load keeps its ingest_ledger checkpoint and resumes if the file is
+submitted again.
+
+INGEST_MAX_JOBS bounds how many loads run at once across all worker
+processes (one lock file per slot under CACHE_DIR), so bulk loads cannot
+take over the connection pool and CPU the read endpoints need.
+INGEST_MAX_QUEUED bounds the jobs waiting in one process.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from backend.config.db_connection import db_cursor
+from backend.utils.columnar import is_parquet
+from backend.utils.db_insert import insert_from_csv_chunked
+
+try:
+    import fcntl
+except ImportError:  # Windows: the slot limit only applies per process
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "data/cache"))
+INGEST_MAX_JOBS = int(os.getenv("INGEST_MAX_JOBS", "1"))
+INGEST_MAX_QUEUED = int(os.getenv("INGEST_MAX_QUEUED", "8"))
+INGEST_JOB_CHUNKSIZE = int(os.getenv("INGEST_JOB_CHUNKSIZE", "20000"))
+SLOT_POLL_SECONDS = 1.0
+
+JOB_COLUMNS = [
+    "job_id", "file_path", "status", "total_rows", "rows_processed", "rows_inserted",
+    "start_row", "error", "created_at", "started_at", "finished_at", "updated_at",
+]
+
+
+class QueueFullError(RuntimeError):
+    """Raised when INGEST_MAX_QUEUED jobs are already waiting in this process."""
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def estimate_rows(path: str, sample_bytes: int = 1 << 20) -> Optional[int]:
+    """Row count for Parquet (from metadata), or an estimate for CSV from the
+    average line length of the first ``sample_bytes``."""
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        sample = f.read(sample_bytes)
+    lines = sample.count(b"\n")
+    if lines <= 1:
+        return max(lines - 1, 0)
+    if len(sample) >= size:
+        return lines - 1
+    header = sample.index(b"\n") + 1
+    return int((size - header) / ((len(sample) - header) / (lines - 1)))
+
+
+class _Slot:
+    """One of INGEST_MAX_JOBS cross-process run slots, held as a lock file."""
+
+    def __init__(self, cancelled):
+        self._cancelled = cancelled
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        while True:
+            for i in range(max(1, INGEST_MAX_JOBS)):
+                f = open(os.path.join(CACHE_DIR, f"ingest_slot_{i}.lock"), "a")
+                if fcntl is None:
+                    self._file = f
+                    return self
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    self._file = f
+                    return self
+                except BlockingIOError:
+                    f.close()
+            if self._cancelled():
+                raise JobCancelled()
+            time.sleep(SLOT_POLL_SECONDS)
+
+    def __exit__(self, *exc):
+        self._file.close()
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+_pending = 0
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=max(1, INGEST_MAX_JOBS),
+                                               thread_name_prefix="ingest-job")
+                _executor_pid = pid
+    return _executor
+
+
+def _set_status(job_id: str, status: str, error: Optional[str] = None) -> None:
+    finished = status in ("succeeded", "failed", "cancelled")
+    with db_cursor(dictionary=False) as (conn, cursor):
+        cursor.execute(
+            "UPDATE ingest_jobs SET status = %s, error = %s, "
+            "started_at = IF(%s = 'running', NOW(3), started_at), "
+            "finished_at = IF(%s, NOW(3), finished_at) WHERE job_id = %s",
+            (status, error, status, finished, job_id))
+        conn.commit()
+
+
+def _cancel_requested(job_id: str) -> bool:
+    with db_cursor(dictionary=False) as (conn, cursor):
+        cursor.execute("SELECT cancel_requested FROM ingest_jobs WHERE job_id = %s", (job_id,))
+        row = cursor.fetchone()
+        return bool(row and row[0])
+
+
+def _run(job_id: str, path: str, force: bool) -> None:
+    global _pending
+    stopped = []
+
+    def on_chunk(cursor, offset, rows_read, rows_inserted):
+        # The UPDATE reads the latest row version, so the flag check below
+        # sees a cancel committed since the previous chunk
+        cursor.execute(
+            "UPDATE ingest_jobs SET rows_processed = %s, rows_inserted = %s, "
+            "start_row = %s WHERE job_id = %s",
+            (offset, rows_inserted, offset - rows_read, job_id))
+        cursor.execute("SELECT cancel_requested FROM ingest_jobs WHERE job_id = %s", (job_id,))
+        row = cursor.fetchone()
+        if row and row[0]:
+            stopped.append(offset)
+            return False
+        return True
+
+    try:
+        with _Slot(lambda: _cancel_requested(job_id)):
+            if _cancel_requested(job_id):
+                raise JobCancelled()
+            _set_status(job_id, "running")
+            insert_from_csv_chunked(path, chunksize=INGEST_JOB_CHUNKSIZE, force=force, on_chunk=on_chunk)
+            # Only a stop in on_chunk leaves the file unfinished; a later cancel is too late
+            if stopped:
+                raise JobCancelled()
+        _set_status(job_id, "succeeded")
+    except JobCancelled:
+        _set_status(job_id, "cancelled")
+    except Exception as e:
+        _set_status(job_id, "failed", str(e))
+    finally:
+        with _executor_lock:
+            _pending -= 1
+
+
+def submit_job(path: str, force: bool = False) -> str:
+    """Queue an ingest of ``path`` and return its job id."""
+    global _pending
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+    with _executor_lock:
+        if _pending >= INGEST_MAX_QUEUED:
+            raise QueueFullError(f"{_pending} ingest jobs already queued or running")
+        _pending += 1
+
+    try:
+        job_id = uuid.uuid4().hex
+        with db_cursor(dictionary=False) as (conn, cursor):
+            cursor.execute(
+                "INSERT INTO ingest_jobs (job_id, file_path, status, total_rows) VALUES (%s, %s, 'queued', %s)",
+                (job_id, os.path.abspath(path), estimate_rows(path)))
+            conn.commit()
+        _get_executor().submit(_run, job_id, path, force)
+        return job_id
+    except Exception:
+        with _executor_lock:
+            _pending -= 1
+        raise
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """Job row plus rows_per_sec and eta_seconds derived from its progress."""
+    with db_cursor() as (conn, cursor):
+        cursor.execute(
+            "SELECT " + ", ".join(JOB_COLUMNS) + ", "
+            "TIMESTAMPDIFF(MICROSECOND, started_at, COALESCE(finished_at, NOW(3))) / 1e6 AS elapsed_s "
+            "FROM ingest_jobs WHERE job_id = %s", (job_id,))
+        job = cursor.fetchone()
+    if job is None:
+        return None
+
+    elapsed = float(job.pop("elapsed_s") or 0)
+    done = (job["rows_processed"] or 0) - (job["start_row"] or 0)
+    rate = done / elapsed if elapsed > 0 else None
+    job["elapsed_seconds"] = round(elapsed, 1)
+    job["rows_per_sec"] = round(rate, 1) if rate else None
+    job["eta_seconds"] = None
+    if job["status"] == "running" and rate and job["total_rows"]:
+        job["eta_seconds"] = round(max(job["total_rows"] - job["rows_processed"], 0) / rate, 1)
+    return job
+
+
+def cancel_job(job_id: str) -> Optional[str]:
+    """Request cancellation; returns the job's status, or None if unknown."""
+    with db_cursor(dictionary=False) as (conn, cursor):
+        cursor.execute(
+            "UPDATE ingest_jobs SET cancel_requested = 1 "
+            "WHERE job_id = %s AND status IN ('queued', 'running')", (job_id,))
+        # A job still waiting for a slot will never start; a running one stops after its chunk
+        cursor.execute(
+            "UPDATE ingest_jobs SET status = 'cancelled', finished_at = NOW(3) "
+            "WHERE job_id = %s AND status = 'queued'", (job_id,))
+        cursor.execute("SELECT status FROM ingest_jobs WHERE job_id = %s", (job_id,))
+        row = cursor.fetchone()
+        conn.commit()
+    return row[0] if row else None
@@ -0,0 +1,76 @@
+"""
+Ingest ledger: which source files have been loaded, and how far.
+
+ingest_ledger keeps one row per file with its size, SHA-256 and the number
+of source rows covered by committed chunks. Loaders update the row in the
+same transaction as each chunk, so after a crash the next run resumes at
+the last committed chunk, and a file whose size and hash are unchanged
+since a complete load is skipped. Rows that do get replayed are absorbed by
+the natural-key unique index on trips (see db_insert._insert_new).
+
+All functions take a tuple cursor; the caller commits.
+"""
+import hashlib
+import os
+from typing import Optional
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def ledger_path(path: str) -> str:
+    return os.path.abspath(path)
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def begin_file(cursor, path: str, force: bool = False) -> Optional[int]:
+    """Register ``path`` and return the source row to start from, or None when
+    the same content has already been loaded completely.
+
+    A file whose content changed since it was recorded starts again from row
+    0. ``force`` ignores earlier progress for this file.
+    """
+    key = ledger_path(path)
+    size = os.path.getsize(path)
+    digest = file_hash(path)
+
+    if not force:
+        cursor.execute(
+            "SELECT file_size, content_hash, rows_committed, status FROM ingest_ledger "
+            "WHERE file_path = %s FOR UPDATE", (key,))
+        row = cursor.fetchone()
+        if row and int(row[0]) == size and row[1] == digest:
+            return None if row[3] == "complete" else int(row[2])
+
+        # The same bytes loaded from another path (e.g. a renamed export)
+        cursor.execute(
+            "SELECT 1 FROM ingest_ledger WHERE content_hash = %s AND file_size = %s "
+            "AND status = 'complete' LIMIT 1", (digest, size))
+        if cursor.fetchone():
+            return None
+
+    cursor.execute(
+        "INSERT INTO ingest_ledger (file_path, file_size, content_hash) VALUES (%s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE file_size = VALUES(file_size), content_hash = VALUES(content_hash), "
+        "rows_committed = 0, rows_inserted = 0, status = 'loading', started_at = CURRENT_TIMESTAMP",
+        (key, size, digest))
+    return 0
+
+
+def checkpoint(cursor, path: str, rows_committed: int, rows_inserted: int) -> None:
+    """Record progress; call in the same transaction as the chunk it covers."""
+    cursor.execute(
+        "UPDATE ingest_ledger SET rows_committed = GREATEST(rows_committed, %s), "
+        "rows_inserted = rows_inserted + %s WHERE file_path = %s",
+        (rows_committed, rows_inserted, ledger_path(path)))
+
+
+def finish_file(cursor, path: str) -> None:
+    cursor.execute(
+        "UPDATE ingest_ledger SET status = 'complete' WHERE file_path = %s", (ledger_path(path),))
@@ -0,0 +1,202 @@
+"""
+Pipelined CSV ingest: one reader, a process pool for feature computation and
+N writer threads, connected by bounded queues so a slow stage applies
+backpressure instead of letting chunks pile up in memory.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+from backend.config.db_connection import db_connection
+from backend.utils.anomaly_detection import merge_anomaly_stats, record_anomalies
+from backend.utils.columnar import iter_table
+from backend.utils.db_insert import (
+    _compute_features_chunk, _insert_new, _insert_rows, _quarantine_invalid, _upsert_vendors,
+)
+from backend.utils.ingest_ledger import begin_file, checkpoint, finish_file
+from backend.utils.ingest_state import saving_state
+from backend.utils.response_cache import bump_data_version
+from backend.utils.rollups import apply_rollups
+from backend.utils.sketches import record_sketches
+from backend.utils.snapshot import refresh_snapshot_after_ingest
+
+_DONE = object()
+
+# MySQL deadlock (1213) and lock wait timeout (1205) roll the transaction
+# back; the chunk can simply run again
+RETRYABLE_ERRNOS = (1213, 1205)
+CHUNK_RETRIES = 3
+
+
+def _default_feature_workers() -> int:
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+class _Checkpoints:
+    """Source rows covered by the contiguous prefix of committed chunks.
+
+    Writers commit chunks out of order, so the ledger may only advance past a
+    chunk once every earlier chunk has committed too.
+    """
+
+    def __init__(self, start_row: int):
+        self.lock = threading.Lock()
+        self._next = 0
+        self._committed_to = start_row
+        self._done = {}
+
+    def prefix_with(self, seq: int, end_row: int) -> int:
+        """Checkpoint to record in the transaction that commits chunk ``seq``."""
+        with self.lock:
+            done = dict(self._done)
+            done[seq] = end_row
+            return self._advance(done)[1]
+
+    def mark_done(self, seq: int, end_row: int) -> None:
+        with self.lock:
+            self._done[seq] = end_row
+            self._next, self._committed_to = self._advance(self._done)
+            for finished in [k for k in self._done if k < self._next]:
+                del self._done[finished]
+
+    def _advance(self, done: dict):
+        nxt, end = self._next, self._committed_to
+        while nxt in done:
+            end = done[nxt]
+            nxt += 1
+        return nxt, end
+
+
+def _write_chunk(cursor, prepared, batch_size: int, csv_path: str, first_row: int,
+                 checkpoint_row: int):
+    """One chunk's statements, up to the commit. Returns the rows inserted and
+    their anomaly statistics, to be merged once the commit succeeds."""
+    prepared = _quarantine_invalid(cursor, prepared, csv_path, first_row)
+    _upsert_vendors(cursor, prepared['vendor_id'])
+    fresh = _insert_new(cursor, prepared, lambda frame: _insert_rows(cursor, frame, batch_size))
+    apply_rollups(cursor, fresh)
+    stats = record_anomalies(cursor, fresh)
+    checkpoint(cursor, csv_path, checkpoint_row, len(fresh))
+    return fresh, stats
+
+
+def _writer(work_q: "queue.Queue", batch_size: int, stop: threading.Event,
+            totals: list, errors: list, lock: threading.Lock,
+            csv_path: str, progress: _Checkpoints) -> None:
+    """Drain prepared chunks from ``work_q`` and insert them on one connection."""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                while True:
+                    item = work_q.get()
+                    if item is _DONE:
+                        return
+                    if stop.is_set():
+                        continue
+                    seq, first_row, end_row, item = item
+                    prepared = item.result() if isinstance(item, Future) else _compute_features_chunk(item)
+
+                    for attempt in range(CHUNK_RETRIES + 1):
+                        try:
+                            fresh, stats = _write_chunk(cursor, prepared, batch_size, csv_path, first_row,
+                                                        progress.prefix_with(seq, end_row))
+                            conn.commit()
+                            break
+                        except Exception as e:
+                            conn.rollback()
+                            if getattr(e, "errno", None) not in RETRYABLE_ERRNOS or attempt == CHUNK_RETRIES:
+                                raise
+                            time.sleep(0.05 * 2 ** attempt)
+                    progress.mark_done(seq, end_row)
+                    bump_data_version()
+                    merge_anomaly_stats(stats)
+                    record_sketches(fresh)
+
+                    with lock:
+                        totals[0] += len(fresh)
+            finally:
+                cursor.close()
+    except Exception as e:
+        with lock:
+            errors.append(e)
+        stop.set()
+        # Keep consuming so the reader never blocks on a full queue
+        while work_q.get() is not _DONE:
+            pass
+
+
+def insert_from_csv_pipelined(csv_path: str, chunksize: int = 50000, batch_size: int = 1000,
+                              feature_workers: Optional[int] = None, writers: int = 2,
+                              queue_depth: int = 4, force: bool = False) -> int:
+    """Ingest a CSV with reading, feature computation and inserts overlapping.
+
+    ``feature_workers`` processes run _compute_features_chunk (0 computes
+    features in the writer threads instead), ``writers`` threads each hold
+    their own pooled connection, and at most ``queue_depth`` chunks are in
+    flight between the reader and the writers. Checkpointing and ``force``
+    work as in insert_from_csv_chunked. Returns total rows inserted.
+    """
+    if feature_workers is None:
+        feature_workers = _default_feature_workers()
+    writers = max(1, writers)
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            start_row = begin_file(cursor, csv_path, force=force)
+            conn.commit()
+        finally:
+            cursor.close()
+    if start_row is None:
+        return 0
+    progress = _Checkpoints(start_row)
+
+    work_q: "queue.Queue" = queue.Queue(maxsize=max(1, queue_depth))
+    stop = threading.Event()
+    lock = threading.Lock()
+    totals = [0]
+    errors: list = []
+
+    with saving_state():
+        threads = [
+            threading.Thread(target=_writer, args=(work_q, batch_size, stop, totals, errors, lock, csv_path, progress),
+                             name=f"ingest-writer-{i}", daemon=True)
+            for i in range(writers)
+        ]
+        for t in threads:
+            t.start()
+
+        executor = ProcessPoolExecutor(max_workers=feature_workers) if feature_workers > 0 else None
+        try:
+            end_row = start_row
+            for seq, chunk in enumerate(iter_table(csv_path, chunksize, start_row=start_row)):
+                if stop.is_set():
+                    break
+                first_row, end_row = end_row, end_row + len(chunk)
+                item = executor.submit(_compute_features_chunk, chunk) if executor else chunk
+                # Blocks while queue_depth chunks are already waiting for a writer
+                work_q.put((seq, first_row, end_row, item))
+        finally:
+            for _ in threads:
+                work_q.put(_DONE)
+            for t in threads:
+                t.join()
+            if executor:
+                executor.shutdown(cancel_futures=True)
+
+    if errors:
+        raise errors[0]
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            finish_file(cursor, csv_path)
+            conn.commit()
+        finally:
+            cursor.close()
+    refresh_snapshot_after_ingest()
+    return totals[0]
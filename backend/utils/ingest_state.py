@@ -0,0 +1,125 @@
+"""
+Crash recovery for the ingest state kept outside the database.
+
+The sketches (sketches.py) and anomaly statistics (anomaly_detection.py)
+gather a per-process delta as chunks commit, and add it to their state
+files when a load finishes. A process that dies in between leaves its
+trips committed and checkpointed in the ledger, so a resumed load starts
+after them, but their share of the state files is gone.
+
+Loaders therefore run inside ``saving_state()``, which saves the deltas on
+the way out, even after an error, and which holds an exclusive lock on a
+per-process marker file in CACHE_DIR for as long as a delta may be
+unsaved. A marker that nobody holds was left by a process that died with
+unsaved rows. The next load to start then rebuilds both state files from
+trips, unless another process is in the middle of a load: its delta would
+be counted twice, so the rebuild waits for a later load.
+"""
+import glob
+import os
+import threading
+from contextlib import contextmanager
+
+from backend.utils.anomaly_detection import rebuild_anomaly_state, save_anomaly_state
+from backend.utils.sketches import rebuild_sketches, save_sketches
+
+try:
+    import fcntl
+except ImportError:  # Windows: crashed loads are not detected
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "data/cache"))
+MARKER_PATTERN = "ingest_state.*.pending"
+
+_holders = 0
+_marker = None
+_holders_lock = threading.Lock()
+
+
+def _try_lock(path: str):
+    """The file at ``path`` opened and exclusively locked, or None if another process holds it."""
+    f = open(path, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
+def _recover(own: str, stale: bool) -> None:
+    """Rebuild the state files if a dead process left a marker and no other load is running.
+
+    ``stale`` means ``own`` was already there: an earlier load in this process
+    (or a dead one with the same pid) failed to save its delta.
+    """
+    orphans, live = [], False
+    for path in glob.glob(os.path.join(CACHE_DIR, MARKER_PATTERN)):
+        if path == own:
+            continue
+        f = _try_lock(path)
+        if f is None:
+            live = True
+        else:
+            orphans.append((path, f))
+    try:
+        if (orphans or stale) and not live:
+            from backend.config.db_connection import db_connection
+
+            print(f"{len(orphans)} load(s) died before saving sketches and anomaly statistics; rebuilding them")
+            with db_connection() as conn:
+                rebuild_sketches(conn)
+                rebuild_anomaly_state(conn)
+            for path, _ in orphans:
+                os.unlink(path)
+    finally:
+        for _, f in orphans:
+            f.close()
+
+
+def _hold() -> None:
+    global _holders, _marker
+    with _holders_lock:
+        _holders += 1
+        if _holders > 1 or fcntl is None:
+            return
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(os.path.join(CACHE_DIR, "ingest_state.lock"), "a") as lock:
+            # Serializes recovery with markers being created, so a rebuild
+            # never runs alongside a load that has just started
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            path = os.path.join(CACHE_DIR, MARKER_PATTERN.replace("*", str(os.getpid())))
+            stale = os.path.exists(path)
+            _marker = _try_lock(path)
+            _recover(path, stale)
+
+
+def _release(saved: bool) -> None:
+    global _holders, _marker
+    with _holders_lock:
+        _holders -= 1
+        if _holders or _marker is None:
+            return
+        if saved:
+            os.unlink(_marker.name)
+        _marker.close()
+        _marker = None
+
+
+@contextmanager
+def saving_state():
+    """Wrap a load: its committed chunks reach the sketch and anomaly state files
+    when it ends, or are rebuilt from trips if the process dies first."""
+    _hold()
+    try:
+        yield
+    finally:
+        saved = False
+        try:
+            save_anomaly_state()
+            save_sketches()
+            saved = True
+        finally:
+            # A failed save leaves the marker in place, so the next start rebuilds
+            _release(saved)
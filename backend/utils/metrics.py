@@ -0,0 +1,375 @@
+"""
+Request and query metrics in the Prometheus text format.
+
+With METRICS on (the default), the Flask app times every request and
+records its response size, the connection pool hands out connections whose
+cursors time each statement and count its rows, and /metrics renders it all
+for a Prometheus scrape. Statements are labelled by their normalized SQL
+text, with literals and IN lists collapsed. Metrics live in the process,
+so every worker is scraped separately. With METRICS=0 no hook or wrapper is
+installed and /metrics does not exist.
+
+SLOW_QUERY_MS > 0 also logs statements slower than that many milliseconds,
+with the endpoint that ran them, to SLOW_QUERY_LOG.
+"""
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from flask import Response, g, has_request_context, request
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METRICS_ENABLED = os.getenv("METRICS", "1").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", os.path.join(BASE_DIR, "data/logs/slow_queries.log"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+# Statements beyond this many distinct shapes share the label "other"
+MAX_STATEMENTS = 500
+STATEMENT_MAX_LEN = 200
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set."""
+
+    def __init__(self, name: str, doc: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(k, list(v[0]), v[1]) for k, v in self._series.items()]
+        for labels, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket = _label_text(self.labels, labels, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        lines.extend(f"{self.name}{_label_text(self.labels, k)} {v}" for k, v in snapshot)
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, labels: Tuple, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        lines.extend(f"{self.name}{_label_text(self.labels, k)} {v}" for k, v in snapshot)
+        return lines
+
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds",
+                            "Time from request start until the response body was sent.",
+                            LATENCY_BUCKETS, ("endpoint", "method", "status"))
+RESPONSE_BYTES = Histogram("http_response_size_bytes", "Response body size.",
+                           SIZE_BUCKETS, ("endpoint",))
+QUERY_SECONDS = Histogram("db_query_duration_seconds",
+                          "Time spent executing a statement and fetching its rows.",
+                          LATENCY_BUCKETS, ("statement",))
+QUERY_ROWS = Counter("db_query_rows_total", "Rows fetched or affected per statement.", ("statement",))
+SLOW_QUERIES = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS.", ("statement",))
+ACQUIRE_SECONDS = Histogram("db_pool_acquire_seconds",
+                            "Time to check a connection out of the pool, including connecting.",
+                            LATENCY_BUCKETS)
+METRICS = [REQUEST_SECONDS, RESPONSE_BYTES, QUERY_SECONDS, QUERY_ROWS, SLOW_QUERIES, ACQUIRE_SECONDS]
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+# (%s, %s), (%s, %s) ... and %s, %s, ... lists of any length
+_ROW_LIST = re.compile(r"\((?:%s, ?)*%s\)(?:, ?\((?:%s, ?)*%s\))+")
+_VALUE_LIST = re.compile(r"%s(?:, ?%s)+")
+_statements: Dict[str, str] = {}
+_statements_lock = threading.Lock()
+
+
+@lru_cache(maxsize=2048)
+def _normalize(sql: str) -> str:
+    text = _WHITESPACE.sub(" ", sql).strip()
+    text = _STRING.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _ROW_LIST.sub("(...)", text)
+    text = _VALUE_LIST.sub("...", text)
+    return text.replace("%s", "?")[:STATEMENT_MAX_LEN]
+
+
+def statement_label(sql) -> str:
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode(errors="replace")
+    label = _normalize(sql)
+    if label in _statements:
+        return label
+    with _statements_lock:
+        if len(_statements) >= MAX_STATEMENTS:
+            return "other"
+        _statements[label] = label
+    return label
+
+
+_slow_log: Optional[logging.Logger] = None
+_slow_log_lock = threading.Lock()
+
+
+def _slow_query_logger() -> logging.Logger:
+    global _slow_log
+    if _slow_log is None:
+        with _slow_log_lock:
+            if _slow_log is None:
+                os.makedirs(os.path.dirname(SLOW_QUERY_LOG), exist_ok=True)
+                handler = logging.FileHandler(SLOW_QUERY_LOG)
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                log = logging.getLogger("nyc_taxi.slow_query")
+                log.addHandler(handler)
+                log.setLevel(logging.INFO)
+                log.propagate = False
+                _slow_log = log
+    return _slow_log
+
+
+def _record_query(statement: str, seconds: float, rows: int) -> None:
+    QUERY_SECONDS.observe((statement,), seconds)
+    if rows > 0:
+        QUERY_ROWS.inc((statement,), rows)
+    if SLOW_QUERY_MS > 0 and seconds * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc((statement,))
+        endpoint = request.path if has_request_context() else "-"
+        _slow_query_logger().info("%.1f ms rows=%d endpoint=%s %s", seconds * 1000, rows, endpoint, statement)
+
+
+class InstrumentedCursor:
+    """Cursor proxy timing each statement from execute until its rows are fetched.
+
+    Time spent in the caller between fetches is not counted; a statement is
+    recorded when its result is exhausted, the next statement runs, or the
+    cursor closes.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._statement = None
+        self._seconds = 0.0
+        self._rows = 0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def _finish(self) -> None:
+        if self._statement is not None:
+            _record_query(self._statement, self._seconds, self._rows)
+            self._statement = None
+
+    def _run(self, method, operation, args):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return method(operation, args)
+        finally:
+            self._statement = statement_label(operation)
+            self._seconds = time.perf_counter() - start
+            rowcount = self._cursor.rowcount
+            # SELECT rows are counted as they are fetched
+            self._rows = rowcount if rowcount > 0 and self._cursor.description is None else 0
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        return self._run(lambda op, p: self._cursor.execute(op, p, *args, **kwargs), operation, params)
+
+    def executemany(self, operation, seq_params):
+        result = self._run(self._cursor.executemany, operation, seq_params)
+        self._finish()
+        return result
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        result = method(*args)
+        self._seconds += time.perf_counter() - start
+        return result
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._fetch(self._cursor.fetchmany, size)
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors are InstrumentedCursors."""
+
+    def __init__(self, conn):
+        self.raw = conn
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.raw.cursor(*args, **kwargs))
+
+
+def instrument_connection(conn):
+    return InstrumentedConnection(conn) if METRICS_ENABLED and conn is not None else conn
+
+
+def unwrap_connection(conn):
+    return conn.raw if isinstance(conn, InstrumentedConnection) else conn
+
+
+def observe_acquire(seconds: float) -> None:
+    ACQUIRE_SECONDS.observe((), seconds)
+
+
+def _pool_lines() -> List[str]:
+    from backend.config.db_connection import get_pool_stats
+
+    stats = get_pool_stats()
+    lines = ["# HELP db_pool_connections Pooled connections by state.", "# TYPE db_pool_connections gauge"]
+    lines += [f'db_pool_connections{{state="{s}"}} {stats[s]}' for s in ("open", "idle", "in_use")]
+    lines += ["# HELP db_pool_waiters Threads waiting for a connection.", "# TYPE db_pool_waiters gauge",
+              f"db_pool_waiters {stats['waiters']}",
+              "# HELP db_pool_timeouts_total Checkouts that timed out.", "# TYPE db_pool_timeouts_total counter",
+              f"db_pool_timeouts_total {stats['timeouts']}"]
+    return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(_pool_lines())
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app) -> None:
+    """Install the request hooks and the /metrics route when METRICS is on."""
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_response(resp):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return resp
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        labels = (endpoint, request.method, str(resp.status_code))
+        size = [resp.calculate_content_length()]
+
+        if resp.is_streamed:
+            # Streamed bodies (e.g. /api/trips/export) are counted as they are sent
+            size[0] = 0
+            body = resp.response
+
+            def counted():
+                try:
+                    for chunk in body:
+                        size[0] += len(chunk)
+                        yield chunk
+                finally:
+                    if hasattr(body, "close"):
+                        body.close()
+            resp.response = counted()
+
+        def done():
+            REQUEST_SECONDS.observe(labels, time.perf_counter() - start)
+            if size[0] is not None:
+                RESPONSE_BYTES.observe((endpoint,), size[0])
+        resp.call_on_close(done)
+        return resp
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render(), mimetype=None, content_type=CONTENT_TYPE)
@@ -0,0 +1,199 @@
+"""
+Monthly RANGE partitioning of the trips table.
+
+database_setup_partitioned.sql creates trips partitioned on
+pickup_datetime, with one partition per month (pYYYYMM) and a catch-all
+pmax. Queries bounded by pickup_datetime only open the months they
+cover. A month of history is removed by dropping its partition, or by
+exchanging it into an archive table, instead of a multi-hour DELETE.
+
+MySQL requires every unique key of a partitioned table to include the
+partitioning column, and does not allow foreign keys on it. The
+partitioned trips table is therefore keyed on (trip_id, pickup_datetime)
+and has no fk_vendor; ingest still upserts vendors before trips.
+"""
+import re
+from datetime import date, datetime
+from typing import List
+
+from backend.utils.response_cache import bump_data_version
+from backend.utils.sketches import rebuild_sketches
+from backend.utils.snapshot import refresh_snapshot_after_ingest
+
+MIGRATE_BATCH_ROWS = 500000
+
+PARTITION_RE = re.compile(r"^p(\d{4})(\d{2})$")
+
+
+def month_start(d) -> date:
+    return date(d.year, d.month, 1)
+
+
+def next_month(d) -> date:
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"p{month:%Y%m}"
+
+
+def _month_definitions(first: date, last: date) -> List[str]:
+    """PARTITION clauses for each month from ``first`` through ``last``."""
+    parts = []
+    month = month_start(first)
+    while month <= last:
+        upper = next_month(month)
+        parts.append(f"PARTITION {partition_name(month)} VALUES LESS THAN ('{upper:%Y-%m-%d}')")
+        month = upper
+    return parts
+
+
+def partition_clause(first: date, last: date) -> str:
+    """PARTITION BY clause with monthly partitions from ``first`` through ``last``, then pmax."""
+    parts = _month_definitions(first, last) + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"]
+    return "PARTITION BY RANGE COLUMNS(pickup_datetime) (\n    " + ",\n    ".join(parts) + "\n)"
+
+
+def list_partitions(cursor, table: str = "trips") -> List[dict]:
+    """Partitions of ``table`` in order, with MySQL's row estimate. Empty if unpartitioned."""
+    cursor.execute(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION",
+        (table,),
+    )
+    return [
+        {"name": name, "less_than": str(bound).strip("'"), "rows": int(rows or 0)}
+        for name, bound, rows in cursor.fetchall()
+    ]
+
+
+def _months(partitions: List[dict]) -> List[date]:
+    months = []
+    for p in partitions:
+        m = PARTITION_RE.match(p["name"])
+        if m:
+            months.append(date(int(m.group(1)), int(m.group(2)), 1))
+    return months
+
+
+def ensure_partitions(conn, through: date) -> List[str]:
+    """Split pmax so every month up to ``through`` has its own partition.
+
+    Cheap while pmax is empty; rows already in pmax for those months are
+    moved. Returns the names of the partitions added.
+    """
+    cursor = conn.cursor()
+    try:
+        partitions = list_partitions(cursor)
+        if not partitions:
+            raise RuntimeError("trips is not partitioned; run scripts/partitions.py migrate first")
+        months = _months(partitions)
+        first = next_month(months[-1]) if months else month_start(datetime.now())
+        definitions = _month_definitions(first, through)
+        if not definitions:
+            return []
+        cursor.execute(
+            "ALTER TABLE trips REORGANIZE PARTITION pmax INTO (\n    "
+            + ",\n    ".join(definitions + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"]) + "\n)"
+        )
+        return [d.split()[1] for d in definitions]
+    finally:
+        cursor.close()
+
+
+def migrate_to_partitioned(conn, months_ahead: int = 3, batch_rows: int = MIGRATE_BATCH_ROWS) -> int:
+    """Copy trips into a partitioned table and swap it in. Returns rows copied.
+
+    The copy runs in trip_id batches with a commit after each, so reads
+    continue meanwhile; stop ingest for the duration, since trips loaded
+    after the last batch would be left behind in the old table. The old
+    table is kept as trips_unpartitioned until you drop it.
+    """
+    cursor = conn.cursor()
+    try:
+        if list_partitions(cursor):
+            raise RuntimeError("trips is already partitioned")
+        cursor.execute("SELECT MIN(pickup_datetime), MAX(pickup_datetime), MAX(trip_id) FROM trips")
+        first, last, max_id = cursor.fetchone()
+        today = month_start(datetime.now())
+        first = month_start(first or today)
+        last = month_start(max(last.date() if last else today, today))
+        for _ in range(months_ahead):
+            last = next_month(last)
+
+        # CREATE TABLE ... LIKE keeps the columns, indexes and CHECKs but not the foreign key
+        cursor.execute("DROP TABLE IF EXISTS trips_partitioned")
+        cursor.execute("CREATE TABLE trips_partitioned LIKE trips")
+        cursor.execute(
+            "ALTER TABLE trips_partitioned DROP PRIMARY KEY, ADD PRIMARY KEY (trip_id, pickup_datetime)")
+        cursor.execute("ALTER TABLE trips_partitioned " + partition_clause(first, last))
+
+        copied = 0
+        lo = 0
+        while lo < (max_id or 0):
+            hi = lo + batch_rows
+            cursor.execute(
+                "INSERT INTO trips_partitioned SELECT * FROM trips WHERE trip_id > %s AND trip_id <= %s",
+                (lo, hi))
+            copied += cursor.rowcount
+            conn.commit()
+            lo = hi
+
+        cursor.execute("SELECT COUNT(*) FROM trips")
+        (expected,) = cursor.fetchone()
+        if expected != copied:
+            raise RuntimeError(
+                f"trips changed during the copy ({expected} rows, {copied} copied); "
+                "stop ingest and run the migration again")
+        cursor.execute("RENAME TABLE trips TO trips_unpartitioned, trips_partitioned TO trips")
+        return copied
+    finally:
+        cursor.close()
+
+
+def drop_partitions_before(conn, before: date, archive: bool = False) -> List[str]:
+    """Remove every monthly partition wholly before ``before``.
+
+    With ``archive``, each month is first exchanged into its own
+    trips_archive_YYYYMM table, which is a metadata-only swap. Rollups and
+    anomalies for the removed range are deleted, the sketches are rebuilt
+    from the remaining trips, the snapshot (if any) is rebuilt by its
+    rollup check, and cached responses are invalidated. Neither the anomaly
+    statistics, which keep the removed months in their baseline, nor the
+    travel matrix, which is built from source files, changes. Returns the
+    partitions removed.
+    """
+    cursor = conn.cursor()
+    try:
+        partitions = list_partitions(cursor)
+        cutoff = month_start(before)
+        doomed = [p for p in partitions
+                  if PARTITION_RE.match(p["name"]) and date.fromisoformat(p["less_than"][:10]) <= cutoff]
+        if not doomed:
+            return []
+
+        for p in doomed:
+            if archive:
+                table = "trips_archive_" + p["name"][1:]
+                cursor.execute(f"CREATE TABLE {table} LIKE trips")
+                cursor.execute(f"ALTER TABLE {table} REMOVE PARTITIONING")
+                cursor.execute(f"ALTER TABLE trips EXCHANGE PARTITION {p['name']} WITH TABLE {table}")
+            cursor.execute(f"ALTER TABLE trips DROP PARTITION {p['name']}")
+
+        upper = doomed[-1]["less_than"][:10]
+        cursor.execute("DELETE FROM trip_rollup_hourly WHERE pickup_date < %s", (upper,))
+        cursor.execute("DELETE FROM trip_anomalies WHERE pickup_datetime < %s", (upper,))
+        conn.commit()
+    finally:
+        cursor.close()
+    rebuild_sketches(conn)
+    refresh_snapshot_after_ingest()
+    bump_data_version()
+    return [p["name"] for p in doomed]
+
+
+def parse_month(value: str) -> date:
+    """'2016-03' or '2016-03-15' -> date(2016, 3, 1)."""
+    return month_start(date.fromisoformat(value + "-01" if len(value) == 7 else value))
+
@@ -0,0 +1,262 @@
+"""
+Response cache for read endpoints, invalidated by a data-version counter.
+
+Ingest bumps the counter whenever it commits trips. The counter lives in a
+small file under CACHE_DIR, so every worker process and the ingest scripts
+agree on it; cache keys embed it, so entries from before an ingest are
+never served again. Entries are kept in an in-process LRU ("memory") or as
+files under CACHE_DIR shared by all workers ("file"), chosen by
+RESPONSE_CACHE; "off" disables caching.
+"""
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Optional, Tuple
+
+from flask import Response, make_response, request
+
+try:
+    import fcntl
+except ImportError:  # Windows: bumps are not serialized across processes
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "data/cache"))
+CACHE_BACKEND = os.getenv("RESPONSE_CACHE", "memory")
+CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+
+VERSION_FILE = os.path.join(CACHE_DIR, "data_version")
+RESPONSES_DIR = os.path.join(CACHE_DIR, "responses")
+
+
+class DataVersion:
+    """Monotonic counter stored in a file.
+
+    Every read opens the file (a few bytes): comparing mtimes alone would
+    miss two bumps within one tick of a coarse-timestamp filesystem.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._version = 0
+        self._modified = time.time()
+        self._lock = threading.Lock()
+
+    def get(self) -> Tuple[int, float]:
+        """Return (version, unix time of the last bump)."""
+        try:
+            with open(self.path) as f:
+                text = f.read()
+                mtime = os.fstat(f.fileno()).st_mtime
+        except FileNotFoundError:
+            return 0, self._modified
+        try:
+            version = int(text.strip() or 0)
+        except ValueError:
+            version = 0
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._modified = mtime
+            return self._version, self._modified
+
+    def _read(self) -> int:
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def bump(self) -> int:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            version = self._read() + 1
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path))
+            with os.fdopen(fd, "w") as f:
+                f.write(str(version))
+            os.replace(tmp, self.path)
+        return version
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with per-entry TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class FileCache:
+    """Cache shared by worker processes: one pickle file per entry.
+
+    A file's mtime is set to its expiry time, so expired entries (including
+    those keyed on an older data version) are removed by prune(), which
+    set() runs at most every PRUNE_SECONDS.
+    """
+
+    PRUNE_SECONDS = 60.0
+
+    def __init__(self, directory: str, ttl: float = 300.0):
+        self.directory = directory
+        self.ttl = ttl
+        self._next_prune = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".pkl")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                stored_key, value, expires = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        if stored_key != key or expires < time.time():
+            return None
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((key, value, expires), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.utime(tmp, (expires, expires))
+        os.replace(tmp, self._path(key))
+        if now >= self._next_prune:
+            self._next_prune = now + self.PRUNE_SECONDS
+            self.prune(now)
+
+    def prune(self, now: Optional[float] = None) -> None:
+        """Remove expired entries."""
+        now = time.time() if now is None else now
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.name.endswith(".pkl") and entry.stat().st_mtime < now:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def clear(self) -> None:
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+_data_version = DataVersion(VERSION_FILE)
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the configured cache backend, or None when caching is off."""
+    global _cache
+    if CACHE_BACKEND == "off":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if CACHE_BACKEND == "file":
+                    _cache = FileCache(RESPONSES_DIR, CACHE_TTL)
+                else:
+                    _cache = LRUCache(CACHE_MAX_ENTRIES, CACHE_TTL)
+    return _cache
+
+
+def get_data_version() -> Tuple[int, float]:
+    return _data_version.get()
+
+
+def bump_data_version() -> int:
+    """Invalidate every cached response. Call after committing new trips.
+
+    Entries keyed on older versions can never be hit again; the file backend
+    removes them once they expire rather than on every bump.
+    """
+    return _data_version.bump()
+
+
+def versioned_key(*parts) -> str:
+    version, _ = get_data_version()
+    return f"v{version}:" + ":".join(str(p) for p in parts)
+
+
+def cached_response(ttl: Optional[float] = None):
+    """Cache a view's 200 responses per URL and data version, with ETag/Last-Modified.
+
+    Clients revalidating with If-None-Match / If-Modified-Since get a 304.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None:
+                return view(*args, **kwargs)
+
+            version, modified = get_data_version()
+            query = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+            key = f"v{version}:{request.path}?{query}"
+
+            entry = cache.get(key)
+            status = "HIT"
+            if entry is None:
+                status = "MISS"
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+                body = resp.get_data()
+                entry = {
+                    "body": body,
+                    "mimetype": resp.mimetype,
+                    "etag": hashlib.md5(body).hexdigest(),
+                    "last_modified": modified,
+                }
+                cache.set(key, entry, ttl)
+
+            resp = Response(entry["body"], mimetype=entry["mimetype"])
+            resp.set_etag(entry["etag"])
+            resp.last_modified = datetime.fromtimestamp(int(entry["last_modified"]), tz=timezone.utc)
+            resp.headers["Cache-Control"] = "no-cache"
+            resp.headers["X-Cache"] = status
+            return resp.make_conditional(request)
+        return wrapper
+    return decorator
@@ -0,0 +1,119 @@
+"""
+Hourly rollups of the trips table.
+
+trip_rollup_hourly keeps one row per (pickup date, hour, vendor,
+passenger_count) with the trip count and the sums behind the dashboard
+averages. Ingest updates it in the same transaction as the trip rows, so
+the insights endpoints can answer from a few thousand rows instead of
+scanning trips.
+"""
+import math
+from typing import Dict, Tuple
+
+import pandas as pd
+
+from backend.utils.trip_schema import parse_datetimes
+
+ROLLUP_KEY = ["pickup_date", "pickup_hour", "vendor_id", "passenger_count"]
+ROLLUP_SUMS = ["trip_count", "sum_duration_min", "sum_speed_kmh", "sum_distance_km"]
+
+UPSERT_ROLLUP_QUERY = (
+    "INSERT INTO trip_rollup_hourly (" + ", ".join(ROLLUP_KEY + ROLLUP_SUMS) + ") "
+    "VALUES (" + ", ".join(["%s"] * (len(ROLLUP_KEY) + len(ROLLUP_SUMS))) + ") "
+    "ON DUPLICATE KEY UPDATE "
+    + ", ".join(f"{c} = {c} + VALUES({c})" for c in ROLLUP_SUMS)
+)
+
+RAW_ROLLUP_SELECT = (
+    "SELECT DATE(pickup_datetime) AS pickup_date, HOUR(pickup_datetime) AS pickup_hour, "
+    "vendor_id, passenger_count, COUNT(*) AS trip_count, "
+    "SUM(trip_duration_min) AS sum_duration_min, SUM(speed_kmh) AS sum_speed_kmh, "
+    "SUM(trip_distance_km) AS sum_distance_km "
+    "FROM trips GROUP BY pickup_date, pickup_hour, vendor_id, passenger_count"
+)
+
+
+def rollup_frame(prepared: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate a prepared chunk (see db_insert._compute_features_chunk) into rollup rows."""
+    pickup = parse_datetimes(prepared['pickup_datetime'])
+
+    # Sum the values as MySQL stores them (FLOAT) so rollups match AVG() on trips
+    frame = pd.DataFrame({
+        'pickup_date': pickup.dt.date,
+        'pickup_hour': pickup.dt.hour,
+        'vendor_id': prepared['vendor_id'].astype(str),
+        'passenger_count': prepared['passenger_count'].astype(int),
+        'sum_duration_min': prepared['trip_duration_min'].astype('float32').astype(float),
+        'sum_speed_kmh': prepared['speed_kmh'].astype('float32').astype(float),
+        'sum_distance_km': prepared['trip_distance_km'].astype('float32').astype(float),
+    }).dropna(subset=['pickup_date'])
+
+    # Sorted by key, so concurrent writers lock shared buckets in the same order
+    grouped = frame.groupby(ROLLUP_KEY, sort=True, observed=True)
+    out = grouped[['sum_duration_min', 'sum_speed_kmh', 'sum_distance_km']].sum()
+    out.insert(0, 'trip_count', grouped.size())
+    return out.reset_index()
+
+
+def apply_rollups(cursor, prepared: pd.DataFrame) -> None:
+    """Add a prepared chunk to the rollups. Call before the chunk's commit."""
+    if prepared.empty:
+        return
+    rollup = rollup_frame(prepared)
+    rows = [
+        (r.pickup_date, int(r.pickup_hour), r.vendor_id, int(r.passenger_count),
+         int(r.trip_count), float(r.sum_duration_min), float(r.sum_speed_kmh), float(r.sum_distance_km))
+        for r in rollup.itertuples(index=False)
+    ]
+    cursor.executemany(UPSERT_ROLLUP_QUERY, rows)
+
+
+def rebuild_rollups(conn) -> int:
+    """Recompute all rollups from trips in one transaction. Returns bucket count."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM trip_rollup_hourly")
+        cursor.execute(
+            "INSERT INTO trip_rollup_hourly (" + ", ".join(ROLLUP_KEY + ROLLUP_SUMS) + ") "
+            + RAW_ROLLUP_SELECT
+        )
+        buckets = cursor.rowcount
+        conn.commit()
+        return buckets
+    finally:
+        cursor.close()
+
+
+def _bucket_map(cursor, query: str) -> Dict[Tuple, Tuple]:
+    cursor.execute(query)
+    return {
+        (str(r[0]), int(r[1]), str(r[2]), int(r[3])): (int(r[4]), float(r[5]), float(r[6]), float(r[7]))
+        for r in cursor.fetchall()
+    }
+
+
+def check_rollups(conn, rel_tol: float = 1e-6, max_report: int = 20) -> dict:
+    """Compare every rollup bucket against an aggregate over trips."""
+    cursor = conn.cursor()
+    try:
+        raw = _bucket_map(cursor, RAW_ROLLUP_SELECT)
+        rolled = _bucket_map(
+            cursor, "SELECT " + ", ".join(ROLLUP_KEY + ROLLUP_SUMS) + " FROM trip_rollup_hourly")
+    finally:
+        cursor.close()
+
+    mismatches = []
+    for key in raw.keys() | rolled.keys():
+        expected = raw.get(key, (0, 0.0, 0.0, 0.0))
+        actual = rolled.get(key, (0, 0.0, 0.0, 0.0))
+        same = expected[0] == actual[0] and all(
+            math.isclose(e, a, rel_tol=rel_tol, abs_tol=1e-6) for e, a in zip(expected[1:], actual[1:]))
+        if not same:
+            mismatches.append({"bucket": list(key), "trips": list(expected), "rollup": list(actual)})
+
+    return {
+        "ok": not mismatches,
+        "buckets_checked": len(raw.keys() | rolled.keys()),
+        "mismatched_buckets": len(mismatches),
+        "mismatches": mismatches[:max_report],
+    }
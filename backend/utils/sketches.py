@@ -0,0 +1,302 @@
+"""
+Mergeable quantile and distinct-count sketches of ingested trips.
+
+For every (vendor, pickup hour) ingest keeps:
+
+* a log-bucketed histogram per metric (duration, speed, distance) in the
+  style of DDSketch. Bucket k holds values in (GAMMA^(k-1), GAMMA^k], so
+  any quantile is known to within RELATIVE_ERROR of its true value, and
+  sketches merge by adding counts;
+* a HyperLogLog of pickup grid cells (2^HLL_PRECISION one-byte
+  registers, merged by element-wise max), estimating how many distinct
+  cells trips started in with a standard error of 1.04 / sqrt(registers).
+
+Like the anomaly statistics, a process only adds its own delta to
+SKETCH_STATE_FILE when an ingest finishes, under a lock, so concurrent
+loads merge instead of overwriting each other. Readers reload the file
+when it changes.
+"""
+import math
+import os
+import tempfile
+import threading
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from backend.utils.trip_schema import parse_datetimes
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are not serialized across processes
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SKETCHES = os.getenv("SKETCHES", "1") not in ("0", "false", "off")
+SKETCH_STATE_FILE = os.getenv(
+    "SKETCH_STATE_FILE", os.path.join(os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "data/cache")), "sketches.npz"))
+SKETCH_BATCH_ROWS = 100000
+
+# Changing these invalidates saved state; rebuild with scripts/sketches.py
+RELATIVE_ERROR = 0.01
+GAMMA = (1 + RELATIVE_ERROR) / (1 - RELATIVE_ERROR)
+LOG_GAMMA = math.log(GAMMA)
+MIN_VALUE = 1e-2  # values below share the first bucket (minutes, km/h, km)
+MAX_VALUE = 1e4   # values above share the last bucket
+KEY_MIN = math.ceil(math.log(MIN_VALUE) / LOG_GAMMA)
+KEY_MAX = math.ceil(math.log(MAX_VALUE) / LOG_GAMMA)
+BUCKETS = KEY_MAX - KEY_MIN + 3  # underflow, keys KEY_MIN..KEY_MAX, overflow
+
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_STD_ERROR = 1.04 / math.sqrt(HLL_REGISTERS)
+_HLL_ALPHA = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+
+METRICS = {
+    "duration": ("trip_duration_min", "min"),
+    "speed": ("speed_kmh", "km/h"),
+    "distance": ("trip_distance_km", "km"),
+}
+HOURS = 24
+
+SELECT_SKETCH_COLUMNS = (
+    "SELECT vendor_id, pickup_datetime, trip_duration_min, speed_kmh, trip_distance_km, pickup_cell FROM trips"
+)
+
+
+def bucket_index(values: np.ndarray) -> np.ndarray:
+    """Histogram bucket of each value (NaN must be filtered out first)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        keys = np.ceil(np.log(values) / LOG_GAMMA)
+    index = np.where(values < MIN_VALUE, 0, np.clip(keys, KEY_MIN, KEY_MAX + 1) - KEY_MIN + 1)
+    return index.astype(np.int64)
+
+
+def bucket_bounds(index: int):
+    """(lower, upper) edges of a bucket; the outer buckets are open-ended."""
+    if index == 0:
+        return 0.0, MIN_VALUE
+    if index == BUCKETS - 1:
+        return MAX_VALUE, math.inf
+    key = index - 1 + KEY_MIN
+    return GAMMA ** (key - 1), GAMMA ** key
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    z = x.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    x = x.copy()
+    n = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(shift))
+        n[big] += shift
+        x[big] >>= np.uint64(shift)
+    return n + (x > 0)
+
+
+def hll_estimate(registers: np.ndarray) -> float:
+    """HyperLogLog cardinality of one register array, with the small-range correction."""
+    raw = _HLL_ALPHA * HLL_REGISTERS ** 2 / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if raw <= 2.5 * HLL_REGISTERS and zeros:
+        return HLL_REGISTERS * math.log(HLL_REGISTERS / zeros)
+    return float(raw)
+
+
+class Sketches:
+    """Per (vendor, pickup hour) metric histograms and pickup-cell HyperLogLogs."""
+
+    def __init__(self, vendors: Sequence[str] = (), counts=None, registers=None):
+        self.vendors: List[str] = list(vendors)
+        v = len(self.vendors)
+        self.counts = np.zeros((v, HOURS, len(METRICS), BUCKETS), dtype=np.int64) \
+            if counts is None else np.asarray(counts, dtype=np.int64)
+        self.registers = np.zeros((v, HOURS, HLL_REGISTERS), dtype=np.uint8) \
+            if registers is None else np.asarray(registers, dtype=np.uint8)
+
+    @classmethod
+    def load(cls, path: str) -> "Sketches":
+        if not path or not os.path.exists(path):
+            return cls()
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["vendors"].tolist(), data["counts"], data["registers"])
+
+    def save(self, path: str) -> None:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npz")
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(f, vendors=np.array(self.vendors, dtype=str),
+                                counts=self.counts, registers=self.registers)
+        os.replace(tmp, path)
+
+    @property
+    def empty(self) -> bool:
+        return not self.vendors
+
+    def _vendor_codes(self, vendor_ids: pd.Series) -> np.ndarray:
+        vendor_ids = vendor_ids.astype(str)
+        new = [v for v in pd.unique(vendor_ids) if v not in self.vendors]
+        if new:
+            self.vendors.extend(new)
+            self.counts = np.concatenate(
+                [self.counts, np.zeros((len(new),) + self.counts.shape[1:], dtype=np.int64)])
+            self.registers = np.concatenate(
+                [self.registers, np.zeros((len(new),) + self.registers.shape[1:], dtype=np.uint8)])
+        return pd.Categorical(vendor_ids, categories=self.vendors).codes.astype(np.int64)
+
+    def update(self, prepared: pd.DataFrame) -> None:
+        """Add a prepared chunk (see db_insert._compute_features_chunk)."""
+        if prepared.empty:
+            return
+        pickup = parse_datetimes(prepared["pickup_datetime"])
+        hour = pickup.dt.hour.to_numpy(dtype=np.float64)
+        valid = ~np.isnan(hour)
+        group = self._vendor_codes(prepared["vendor_id"]) * HOURS + np.nan_to_num(hour).astype(np.int64)
+
+        flat_counts = self.counts.reshape(-1)
+        for j, (column, _) in enumerate(METRICS.values()):
+            values = prepared[column].to_numpy(dtype=np.float64)
+            ok = valid & ~np.isnan(values)
+            flat = (group[ok] * len(METRICS) + j) * BUCKETS + bucket_index(values[ok])
+            flat_counts += np.bincount(flat, minlength=len(flat_counts))
+
+        cells = pd.to_numeric(prepared["pickup_cell"], errors="coerce").to_numpy(dtype=np.float64)
+        ok = valid & ~np.isnan(cells)
+        hashed = _splitmix64(cells[ok].astype(np.int64))
+        register = (hashed >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+        rest = hashed & np.uint64((1 << (64 - HLL_PRECISION)) - 1)
+        rank = (64 - HLL_PRECISION) - _bit_length(rest) + 1
+        np.maximum.at(self.registers.reshape(-1), group[ok] * HLL_REGISTERS + register, rank.astype(np.uint8))
+
+    def merge(self, other: "Sketches") -> None:
+        if other.empty:
+            return
+        codes = self._vendor_codes(pd.Series(other.vendors))
+        self.counts[codes] += other.counts
+        self.registers[codes] = np.maximum(self.registers[codes], other.registers)
+
+    def _select(self, array: np.ndarray, hour: Optional[int], vendor: Optional[str]) -> np.ndarray:
+        """Rows of ``array`` for one vendor and/or hour, flattened over (vendor, hour)."""
+        if vendor is not None:
+            array = array[[self.vendors.index(vendor)]] if vendor in self.vendors else array[:0]
+        if hour is not None:
+            array = array[:, [hour]]
+        return array.reshape((-1,) + array.shape[2:])
+
+    def quantiles(self, metric: str, qs: Sequence[float], hour: Optional[int] = None,
+                  vendor: Optional[str] = None) -> dict:
+        """Each q-quantile with the bucket edges that contain the exact value."""
+        j = list(METRICS).index(metric)
+        counts = self._select(self.counts, hour, vendor)[:, j].sum(axis=0)
+        total = int(counts.sum())
+        result = {"count": total, "quantiles": []}
+        if not total:
+            return result
+        cumulative = np.cumsum(counts)
+        for q in qs:
+            # The exact q-quantile is the value of rank floor(q * (n - 1)), counting from 0
+            index = int(np.searchsorted(cumulative, math.floor(q * (total - 1)), side="right"))
+            lower, upper = bucket_bounds(index)
+            value = 2 * upper / (GAMMA + 1) if 0 < index < BUCKETS - 1 else (lower if index else upper)
+            result["quantiles"].append({
+                "q": q, "value": value, "lower": lower, "upper": None if math.isinf(upper) else upper,
+            })
+        return result
+
+    def distinct_cells(self, hour: Optional[int] = None, vendor: Optional[str] = None) -> dict:
+        registers = self._select(self.registers, hour, vendor)
+        merged = registers.max(axis=0) if len(registers) else np.zeros(HLL_REGISTERS, dtype=np.uint8)
+        estimate = hll_estimate(merged)
+        return {
+            "estimate": round(estimate),
+            # ~95% interval
+            "lower": round(estimate * (1 - 2 * HLL_STD_ERROR)),
+            "upper": round(estimate * (1 + 2 * HLL_STD_ERROR)),
+        }
+
+
+def _locked_update(path: str, update) -> Sketches:
+    """Apply ``update`` to the sketches on disk under the state file lock and save them."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        sketches = update(Sketches.load(path))
+        sketches.save(path)
+    return sketches
+
+
+_delta: Optional[Sketches] = None
+_delta_pid: Optional[int] = None
+_delta_lock = threading.Lock()
+
+
+def record_sketches(prepared: pd.DataFrame) -> None:
+    """Add a prepared chunk's trips to this process's sketches. Call with the chunk's new rows."""
+    global _delta, _delta_pid
+    if not SKETCHES or prepared.empty:
+        return
+    with _delta_lock:
+        if _delta is None or _delta_pid != os.getpid():
+            _delta, _delta_pid = Sketches(), os.getpid()
+        _delta.update(prepared)
+
+
+def save_sketches() -> None:
+    """Merge this process's sketches into the state file. Call when an ingest finishes."""
+    global _delta
+    with _delta_lock:
+        if _delta is None or _delta_pid != os.getpid() or _delta.empty:
+            return
+        delta, _delta = _delta, Sketches()
+
+        def add(on_disk):
+            on_disk.merge(delta)
+            return on_disk
+
+        _locked_update(SKETCH_STATE_FILE, add)
+
+
+def rebuild_sketches(conn, path: str = SKETCH_STATE_FILE) -> int:
+    """Recompute the sketches from every trip, replacing the state file. Returns trips read."""
+    sketches = Sketches()
+    rows = 0
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SELECT_SKETCH_COLUMNS)
+        columns = [d[0] for d in cursor.description]
+        while True:
+            batch = cursor.fetchmany(SKETCH_BATCH_ROWS)
+            if not batch:
+                break
+            sketches.update(pd.DataFrame.from_records(batch, columns=columns))
+            rows += len(batch)
+    finally:
+        cursor.close()
+    _locked_update(path, lambda _: sketches)
+    return rows
+
+
+_loaded: Optional[Sketches] = None
+_loaded_key = None
+_loaded_lock = threading.Lock()
+
+
+def get_sketches() -> Sketches:
+    """The saved sketches, reloaded whenever the state file changes."""
+    global _loaded, _loaded_key
+    try:
+        st = os.stat(SKETCH_STATE_FILE)
+        key = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        key = None
+    with _loaded_lock:
+        if _loaded is None or key != _loaded_key:
+            _loaded = Sketches.load(SKETCH_STATE_FILE) if key else Sketches()
+            _loaded_key = key
+        return _loaded
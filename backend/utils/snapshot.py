@@ -0,0 +1,375 @@
+"""
+Memory-mapped columnar snapshot of the trips table.
+
+A snapshot is one fixed-width binary file per column (timestamps as int64
+seconds, coordinates and metrics as float32, vendor and passenger count as
+int8) plus meta.json with the row count. Workers np.memmap the files
+read-only, so every process shares one page-cached copy, and answer
+filters, group-bys and aggregates with NumPy in blocks of AGG_BLOCK_ROWS.
+
+``scripts/snapshot.py build`` writes a new generation under SNAPSHOT_DIR
+and switches CURRENT to it. Once one exists, every ingest calls
+refresh_snapshot() when it finishes, which appends trips with a higher
+trip_id than the snapshot has seen. If the row count then disagrees with
+trip_rollup_hourly (e.g. concurrent loads committed ids out of order), the
+snapshot is rebuilt. Readers notice a new generation or an append by
+stat()ing CURRENT and meta.json, and remap. Both bump the data version, since
+ingest bumps it per chunk, before the snapshot has caught up, and responses
+cached in between would otherwise keep the old numbers under the new version.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from backend.utils.response_cache import bump_data_version
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds and refreshes are not serialized across processes
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "data/cache"))
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(CACHE_DIR, "snapshot"))
+SNAPSHOT_BATCH_ROWS = int(os.getenv("SNAPSHOT_BATCH_ROWS", "200000"))
+AGG_BLOCK_ROWS = 1 << 23
+
+# name: (dtype, trips column)
+COLUMNS = {
+    "trip_id": ("int64", "trip_id"),
+    "pickup_ts": ("int64", "pickup_datetime"),
+    "dropoff_ts": ("int64", "dropoff_datetime"),
+    "vendor": ("int8", "vendor_id"),
+    "passenger_count": ("int8", "passenger_count"),
+    "pickup_latitude": ("float32", "pickup_latitude"),
+    "pickup_longitude": ("float32", "pickup_longitude"),
+    "dropoff_latitude": ("float32", "dropoff_latitude"),
+    "dropoff_longitude": ("float32", "dropoff_longitude"),
+    "trip_duration_min": ("float32", "trip_duration_min"),
+    "trip_distance_km": ("float32", "trip_distance_km"),
+    "speed_kmh": ("float32", "speed_kmh"),
+    "fare_per_km": ("float32", "fare_per_km"),
+}
+SELECT_BATCH_QUERY = (
+    "SELECT " + ", ".join(sql for _, sql in COLUMNS.values()) + " FROM trips "
+    "WHERE trip_id > %s ORDER BY trip_id LIMIT %s"
+)
+GROUP_KEYS = ("hour", "weekday", "date", "vendor", "passenger_count")
+
+
+def _current_path() -> str:
+    return os.path.join(SNAPSHOT_DIR, "CURRENT")
+
+
+def _current_generation() -> Optional[str]:
+    try:
+        with open(_current_path()) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(SNAPSHOT_DIR, name) if name else None
+
+
+def _replace_file(path: str, text: str) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _add_counts(total: np.ndarray, part: np.ndarray) -> np.ndarray:
+    """Sum two bincount results of different lengths."""
+    if len(part) > len(total):
+        total, part = part, total
+    total[:len(part)] += part
+    return total
+
+
+def frame_columns(df: pd.DataFrame, vendors: List[str]) -> Dict[str, np.ndarray]:
+    """Convert trips rows to snapshot arrays; new vendor ids are appended to ``vendors``."""
+    vendor_ids = df["vendor_id"].astype(str)
+    vendors.extend(v for v in pd.unique(vendor_ids) if v not in vendors)
+    out = {
+        "vendor": pd.Categorical(vendor_ids, categories=vendors).codes.astype(np.int8),
+    }
+    for name in ("pickup_ts", "dropoff_ts"):
+        values = pd.to_datetime(df[COLUMNS[name][1]])
+        out[name] = values.to_numpy(dtype="datetime64[s]").view(np.int64)
+    for name, (dtype, column) in COLUMNS.items():
+        if name not in out:
+            out[name] = pd.to_numeric(df[column]).to_numpy(dtype=dtype, na_value=np.nan) \
+                if dtype == "float32" else df[column].to_numpy(dtype=dtype)
+    return out
+
+
+class _Writer:
+    """Appends rows to one generation directory; commit() publishes them to readers."""
+
+    def __init__(self, path: str):
+        self.path = path
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.meta = {"rows": 0, "max_trip_id": 0, "vendors": [], "created": time.time()}
+        self.files = {}
+        for name, (dtype, _) in COLUMNS.items():
+            f = open(os.path.join(path, f"{name}.bin"), "ab")
+            # Drop anything an interrupted append left past the published rows
+            f.truncate(self.meta["rows"] * np.dtype(dtype).itemsize)
+            self.files[name] = f
+        self.rows = self.meta["rows"]
+        self.max_trip_id = self.meta["max_trip_id"]
+
+    def append(self, df: pd.DataFrame) -> None:
+        if df.empty:
+            return
+        arrays = frame_columns(df, self.meta["vendors"])
+        for name, f in self.files.items():
+            f.write(arrays[name].tobytes())
+        self.rows += len(df)
+        self.max_trip_id = max(self.max_trip_id, int(arrays["trip_id"].max()))
+
+    def commit(self) -> None:
+        for f in self.files.values():
+            f.flush()
+            os.fsync(f.fileno())
+        self.meta.update(rows=self.rows, max_trip_id=self.max_trip_id, updated=time.time())
+        _replace_file(os.path.join(self.path, "meta.json"), json.dumps(self.meta))
+
+    def close(self) -> None:
+        for f in self.files.values():
+            f.close()
+
+
+def _lock():
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    lock = open(os.path.join(SNAPSHOT_DIR, "lock"), "a")
+    if fcntl is not None:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+
+def _trip_batches(cursor, after_trip_id: int) -> Iterator[pd.DataFrame]:
+    """Trips with trip_id > ``after_trip_id`` in keyset batches of SNAPSHOT_BATCH_ROWS."""
+    names = [sql for _, sql in COLUMNS.values()]
+    while True:
+        cursor.execute(SELECT_BATCH_QUERY, (after_trip_id, SNAPSHOT_BATCH_ROWS))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        after_trip_id = rows[-1][0]
+        yield pd.DataFrame.from_records(rows, columns=names)
+
+
+def write_generation(frames: Iterator[pd.DataFrame]) -> str:
+    """Write trips frames (trips table columns) as a new generation and make it current."""
+    with _lock():
+        return _write_generation_locked(frames)
+
+
+def _write_generation_locked(frames: Iterator[pd.DataFrame]) -> str:
+    name = f"gen-{time.time_ns()}"
+    writer = _Writer(os.path.join(SNAPSHOT_DIR, name))
+    try:
+        for df in frames:
+            writer.append(df)
+        writer.commit()
+    finally:
+        writer.close()
+    _replace_file(_current_path(), name)
+    # Responses cached while the old generation was current must not outlive it
+    bump_data_version()
+    for old in os.listdir(SNAPSHOT_DIR):
+        # Readers that still map an old generation keep its (unlinked) files
+        if old.startswith("gen-") and old != name:
+            shutil.rmtree(os.path.join(SNAPSHOT_DIR, old), ignore_errors=True)
+    return os.path.join(SNAPSHOT_DIR, name)
+
+
+def build_snapshot(cursor) -> int:
+    """Snapshot the whole trips table into a new generation. Returns its row count."""
+    with _lock():
+        path = _write_generation_locked(_trip_batches(cursor, 0))
+    return Snapshot(path).rows
+
+
+def refresh_snapshot(cursor) -> Optional[int]:
+    """Append trips added since the last build or refresh; None when there is no snapshot.
+
+    Rebuilds instead when the result disagrees with trip_rollup_hourly.
+    """
+    with _lock():
+        path = _current_generation()
+        if path is None:
+            return None
+        writer = _Writer(path)
+        try:
+            for df in _trip_batches(cursor, writer.max_trip_id):
+                writer.append(df)
+            writer.commit()
+        finally:
+            writer.close()
+        bump_data_version()
+
+        cursor.execute("SELECT CAST(COALESCE(SUM(trip_count), 0) AS SIGNED) FROM trip_rollup_hourly")
+        expected = int(cursor.fetchone()[0])
+        if writer.rows == expected:
+            return writer.rows
+    print(f"Snapshot has {writer.rows} trips but the rollups count {expected}; rebuilding")
+    return build_snapshot(cursor)
+
+
+def refresh_snapshot_after_ingest() -> None:
+    """Ingest hook: refresh the snapshot if one has been built. Never raises."""
+    if not os.path.exists(_current_path()):
+        return
+    from backend.config.db_connection import db_cursor
+
+    try:
+        with db_cursor(dictionary=False) as (conn, cursor):
+            refresh_snapshot(cursor)
+    except Exception as e:
+        print(f"Snapshot refresh failed, run scripts/snapshot.py refresh: {e}")
+
+
+class Snapshot:
+    """Read-only view of one generation, columns memory-mapped."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.rows = self.meta["rows"]
+        self.vendors = self.meta["vendors"]
+        self.columns = {}
+        for name, (dtype, _) in COLUMNS.items():
+            file = os.path.join(path, f"{name}.bin")
+            self.columns[name] = (np.memmap(file, dtype=dtype, mode="r", shape=(self.rows,))
+                                  if self.rows else np.empty(0, dtype=dtype))
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def _blocks(self) -> Iterator[slice]:
+        for start in range(0, self.rows, AGG_BLOCK_ROWS):
+            yield slice(start, min(start + AGG_BLOCK_ROWS, self.rows))
+
+    def mask(self, block: slice, start: Optional[datetime] = None, end: Optional[datetime] = None,
+             vendor: Optional[str] = None, passenger_count: Optional[int] = None) -> Optional[np.ndarray]:
+        """Rows of ``block`` matching the filters (pickup in [start, end)), or None for all."""
+        mask = None
+
+        def both(m):
+            return m if mask is None else mask & m
+
+        ts = self.columns["pickup_ts"][block]
+        if start is not None:
+            mask = both(ts >= np.datetime64(start, "s").astype(np.int64))
+        if end is not None:
+            mask = both(ts < np.datetime64(end, "s").astype(np.int64))
+        if vendor is not None:
+            code = self.vendors.index(vendor) if vendor in self.vendors else -1
+            mask = both(self.columns["vendor"][block] == code)
+        if passenger_count is not None:
+            mask = both(self.columns["passenger_count"][block] == passenger_count)
+        return mask
+
+    def _keys(self, key: str, block: slice) -> np.ndarray:
+        if key in ("hour", "weekday", "date"):
+            ts = self.columns["pickup_ts"][block]
+            if key == "hour":
+                return ts // 3600 % 24
+            days = ts // 86400
+            return (days + 3) % 7 if key == "weekday" else days  # 1970-01-01 was a Thursday
+        return self.columns[key][block].astype(np.int64)
+
+    def group_by(self, key: str, values=(), **filters) -> List[dict]:
+        """Trip count and the mean of each of ``values`` per ``key`` (one of GROUP_KEYS)."""
+        if key not in GROUP_KEYS:
+            raise ValueError(f"key must be one of {', '.join(GROUP_KEYS)}")
+        counts = np.zeros(0)
+        sums = {v: np.zeros(0) for v in values}
+        for block in self._blocks():
+            keys = self._keys(key, block)
+            mask = self.mask(block, **filters)
+            if mask is not None:
+                keys = keys[mask]
+            counts = _add_counts(counts, np.bincount(keys).astype(float))
+            for v in values:
+                col = self.columns[v][block]
+                weights = (col[mask] if mask is not None else col).astype(np.float64)
+                sums[v] = _add_counts(sums[v], np.bincount(keys, weights=weights))
+
+        out = []
+        for k in np.flatnonzero(counts):
+            if key == "date":
+                label = str(np.datetime64(int(k), "D"))
+            elif key == "vendor":
+                label = self.vendors[k]
+            else:
+                label = int(k)
+            row = {key: label, "trip_count": int(counts[k])}
+            row.update({f"avg_{v}": float(sums[v][k] / counts[k]) for v in values})
+            out.append(row)
+        return out
+
+    def stats(self) -> dict:
+        """Same fields as /api/insights/stats computes from the rollups."""
+        total = 0
+        sums = {"trip_duration_min": 0.0, "speed_kmh": 0.0, "trip_distance_km": 0.0}
+        passengers = np.zeros(0)
+        for block in self._blocks():
+            total += block.stop - block.start
+            for name in sums:
+                sums[name] += float(np.add.reduce(self.columns[name][block], dtype=np.float64))
+            passengers = _add_counts(
+                passengers, np.bincount(self.columns["passenger_count"][block]).astype(float))
+
+        def avg(name):
+            return sums[name] / total if total else None
+
+        return {
+            "total_trips": total,
+            "avg_duration_min": avg("trip_duration_min"),
+            "avg_speed_kmh": avg("speed_kmh"),
+            "avg_distance_km": avg("trip_distance_km"),
+            "most_common_passenger_count": int(np.argmax(passengers)) if total else None,
+        }
+
+    def hourly(self) -> List[dict]:
+        """Same rows as /api/insights/hourly-pattern: hour and trip_count, by hour."""
+        return self.group_by("hour")
+
+
+_snapshot: Optional[Snapshot] = None
+_snapshot_key = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> Optional[Snapshot]:
+    """The current generation, remapped after a rebuild or refresh; None if never built."""
+    global _snapshot, _snapshot_key
+    path = _current_generation()
+    if path is None:
+        return None
+    try:
+        key = (path, os.stat(os.path.join(path, "meta.json")).st_mtime_ns)
+    except FileNotFoundError:
+        return None
+    if key != _snapshot_key:
+        with _snapshot_lock:
+            if key != _snapshot_key:
+                _snapshot = Snapshot(path)
+                _snapshot_key = key
+    return _snapshot
@@ -0,0 +1,237 @@
+"""
+Zone-to-zone travel-time matrix for ETA lookups.
+
+Pickups and dropoffs inside ETA_BBOX are mapped to ZONE_DEG degree zones.
+For every (origin zone, destination zone, pickup hour of week) seen in
+the featured data, the matrix holds the trip count, median duration and
+median speed. It is built in one vectorized pass: sort the trips by key
+(and value), then read each group's median at its midpoint.
+
+The matrix is saved as a few flat NumPy arrays with the keys sorted, and
+each worker loads it once. A lookup is a searchsorted over the keys. When
+a cell has fewer than ETA_MIN_TRIPS trips, the estimate pools the
+neighbouring zones at both ends and the adjacent hours. Failing that, it
+uses the median speed for that hour of the week over all trips.
+"""
+import math
+import os
+import tempfile
+import threading
+from datetime import datetime
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from backend.utils.columnar import iter_table
+from backend.utils.geo_grid import haversine
+from backend.utils.trip_schema import parse_datetimes
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ETA_MATRIX_FILE = os.getenv(
+    "ETA_MATRIX_FILE", os.path.join(os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "data/cache")), "eta_matrix.npz"))
+ETA_MIN_TRIPS = int(os.getenv("ETA_MIN_TRIPS", "5"))
+
+# Changing these invalidates a saved matrix; rebuild with scripts/eta_matrix.py
+ZONE_DEG = 0.01  # ~1.1 km x 0.85 km at NYC
+ETA_BBOX = (40.49, -74.27, 40.93, -73.68)  # min_lat, min_lon, max_lat, max_lon: the five boroughs
+ZONE_ROWS = int(math.ceil((ETA_BBOX[2] - ETA_BBOX[0]) / ZONE_DEG))
+ZONE_COLS = int(math.ceil((ETA_BBOX[3] - ETA_BBOX[1]) / ZONE_DEG))
+ZONES = ZONE_ROWS * ZONE_COLS
+HOURS_OF_WEEK = 168
+
+_ADJACENT_HOURS = np.array([-1, 0, 1])
+
+
+def zone_ids(lat, lon) -> np.ndarray:
+    """Zone of each point, or -1 outside ETA_BBOX."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    row = np.floor((lat - ETA_BBOX[0]) / ZONE_DEG)
+    col = np.floor((lon - ETA_BBOX[1]) / ZONE_DEG)
+    inside = (row >= 0) & (row < ZONE_ROWS) & (col >= 0) & (col < ZONE_COLS)
+    return np.where(inside, row * ZONE_COLS + col, -1).astype(np.int64)
+
+
+def _zone(lat: float, lon: float) -> int:
+    """zone_ids for a single point."""
+    row = math.floor((lat - ETA_BBOX[0]) / ZONE_DEG)
+    col = math.floor((lon - ETA_BBOX[1]) / ZONE_DEG)
+    return row * ZONE_COLS + col if 0 <= row < ZONE_ROWS and 0 <= col < ZONE_COLS else -1
+
+
+def _around(zone: int) -> np.ndarray:
+    """The zone and its (up to eight) neighbours."""
+    row, col = divmod(zone, ZONE_COLS)
+    return np.array([r * ZONE_COLS + c
+                     for r in (row - 1, row, row + 1) if 0 <= r < ZONE_ROWS
+                     for c in (col - 1, col, col + 1) if 0 <= c < ZONE_COLS])
+
+
+def hour_of_week(pickup: pd.Series) -> np.ndarray:
+    """Monday 00:00-00:59 is 0, Sunday 23:00-23:59 is 167."""
+    return (pickup.dt.weekday * 24 + pickup.dt.hour).to_numpy(dtype=np.int64)
+
+
+def od_key(origin, destination, how):
+    return (origin * ZONES + destination) * HOURS_OF_WEEK + how
+
+
+def group_medians(keys: np.ndarray, *values: np.ndarray):
+    """(unique keys, counts, median of each values array) per key, by sorting."""
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    counts = np.diff(np.r_[starts, len(keys)])
+    lo = starts + (counts - 1) // 2
+    hi = starts + counts // 2
+    medians = []
+    for v in values:
+        # Within each key group, order by value; the median sits at the group midpoint
+        by_value = v[np.lexsort((v, keys))]
+        medians.append(((by_value[lo] + by_value[hi]) / 2).astype(np.float32))
+    return (sorted_keys[starts], counts.astype(np.int64), *medians)
+
+
+class TravelMatrix:
+    """Sorted OD keys with per-key trip counts and median duration/speed."""
+
+    def __init__(self, keys, counts, median_duration, median_speed, hourly_count, hourly_speed):
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.median_duration = np.asarray(median_duration, dtype=np.float32)
+        self.median_speed = np.asarray(median_speed, dtype=np.float32)
+        self.hourly_count = np.asarray(hourly_count, dtype=np.int64)
+        self.hourly_speed = np.asarray(hourly_speed, dtype=np.float32)
+
+    @classmethod
+    def build(cls, frames: Iterable[pd.DataFrame]) -> "TravelMatrix":
+        """One pass over featured trips (pickup/dropoff coordinates and time, duration, speed)."""
+        keys, durations, speeds = [], [], []
+        for df in frames:
+            pickup = parse_datetimes(df["pickup_datetime"])
+            origin = zone_ids(df["pickup_latitude"], df["pickup_longitude"])
+            destination = zone_ids(df["dropoff_latitude"], df["dropoff_longitude"])
+            duration = df["trip_duration_min"].to_numpy(dtype=np.float32)
+            speed = df["speed_kmh"].to_numpy(dtype=np.float32)
+            ok = (origin >= 0) & (destination >= 0) & pickup.notna().to_numpy() \
+                & np.isfinite(duration) & np.isfinite(speed)
+            keys.append(od_key(origin[ok], destination[ok], hour_of_week(pickup[ok])))
+            durations.append(duration[ok])
+            speeds.append(speed[ok])
+
+        keys = np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+        durations = np.concatenate(durations) if durations else np.empty(0, dtype=np.float32)
+        speeds = np.concatenate(speeds) if speeds else np.empty(0, dtype=np.float32)
+        if not len(keys):
+            empty = np.empty(0)
+            return cls(empty, empty, empty, empty, np.zeros(HOURS_OF_WEEK), np.full(HOURS_OF_WEEK, np.nan))
+
+        od = group_medians(keys, durations, speeds)
+        how, how_counts, how_speed = group_medians(keys % HOURS_OF_WEEK, speeds)
+        hourly_count = np.zeros(HOURS_OF_WEEK, dtype=np.int64)
+        hourly_speed = np.full(HOURS_OF_WEEK, np.nan, dtype=np.float32)
+        hourly_count[how] = how_counts
+        hourly_speed[how] = how_speed
+        return cls(*od, hourly_count, hourly_speed)
+
+    @classmethod
+    def load(cls, path: str) -> "TravelMatrix":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["keys"], data["counts"], data["median_duration"], data["median_speed"],
+                       data["hourly_count"], data["hourly_speed"])
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".npz")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, keys=self.keys, counts=self.counts, median_duration=self.median_duration,
+                     median_speed=self.median_speed, hourly_count=self.hourly_count,
+                     hourly_speed=self.hourly_speed)
+        os.replace(tmp, path)
+
+    def _find(self, keys: np.ndarray) -> np.ndarray:
+        """Position of each key, or -1."""
+        if not len(self.keys):
+            return np.full(len(keys), -1)
+        pos = np.searchsorted(self.keys, keys)
+        pos[pos == len(self.keys)] = 0
+        return np.where(self.keys[pos] == keys, pos, -1)
+
+    def eta(self, from_lat: float, from_lon: float, to_lat: float, to_lon: float, at: datetime) -> dict:
+        """Estimated trip duration in minutes, with where the estimate came from.
+
+        There is no ``eta_min`` when either point lies outside ETA_BBOX or
+        the matrix has no trips at that hour of the week.
+        """
+        origin, destination = _zone(from_lat, from_lon), _zone(to_lat, to_lon)
+        how = at.weekday() * 24 + at.hour
+        distance_km = float(haversine(from_lat, from_lon, to_lat, to_lon))
+        result = {"distance_km": round(distance_km, 3), "hour_of_week": how,
+                  "from_zone": origin if origin >= 0 else None, "to_zone": destination if destination >= 0 else None}
+
+        if origin < 0 or destination < 0:
+            return result
+
+        pos = self._find(np.array([od_key(origin, destination, how)]))[0]
+        if pos >= 0 and self.counts[pos] >= ETA_MIN_TRIPS:
+            result.update(eta_min=float(self.median_duration[pos]), source="exact",
+                          trips=int(self.counts[pos]), median_speed_kmh=float(self.median_speed[pos]))
+            return result
+
+        pooled = self._neighbourhood(origin, destination, how)
+        if pooled is not None:
+            trips, speed = pooled
+            result.update(eta_min=distance_km / speed * 60, source="neighbours",
+                          trips=trips, median_speed_kmh=speed)
+            return result
+
+        speed = float(self.hourly_speed[how])
+        if not self.hourly_count[how] or not speed > 0:
+            return result
+        result.update(eta_min=distance_km / speed * 60, source="hour_of_week",
+                      trips=int(self.hourly_count[how]), median_speed_kmh=speed)
+        return result
+
+    def _neighbourhood(self, origin: int, destination: int, how: int):
+        """(trips, count-weighted median speed) over adjacent zones and hours, if enough trips."""
+        hours = (how + _ADJACENT_HOURS) % HOURS_OF_WEEK
+        keys = od_key(_around(origin)[:, None, None], _around(destination)[None, :, None], hours)
+        pos = self._find(keys.ravel())
+        pos = pos[pos >= 0]
+        counts = self.counts[pos]
+        trips = int(counts.sum())
+        if trips < ETA_MIN_TRIPS:
+            return None
+        speed = float(self.median_speed[pos] @ counts) / trips
+        return (trips, speed) if speed > 0 else None
+
+
+def build_matrix_file(input_path: str, output_path: str = ETA_MATRIX_FILE, chunksize: int = 500000) -> TravelMatrix:
+    """Build the matrix from a featured CSV/Parquet file and save it."""
+    columns = ["pickup_datetime", "pickup_latitude", "pickup_longitude",
+               "dropoff_latitude", "dropoff_longitude", "trip_duration_min", "speed_kmh"]
+    matrix = TravelMatrix.build(df[columns] for df in iter_table(input_path, chunksize))
+    matrix.save(output_path)
+    return matrix
+
+
+_matrix: Optional[TravelMatrix] = None
+_matrix_key = None
+_matrix_lock = threading.Lock()
+
+
+def get_travel_matrix() -> Optional[TravelMatrix]:
+    """The saved matrix, loaded once per worker and again when the file changes; None if not built."""
+    global _matrix, _matrix_key
+    try:
+        st = os.stat(ETA_MATRIX_FILE)
+    except FileNotFoundError:
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    if key != _matrix_key:
+        with _matrix_lock:
+            if key != _matrix_key:
+                _matrix = TravelMatrix.load(ETA_MATRIX_FILE)
+                _matrix_key = key
+    return _matrix
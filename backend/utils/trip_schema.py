@@ -0,0 +1,236 @@
+"""
+Canonical trip schema shared by cleaning, feature engineering and insert.
+
+FIELDS declares each trip column once: its kind, whether the trips table
+allows NULL, and the range or value list of its CHECK constraint in
+database/database_setup.sql. The CSV readers take their dtypes from it, so
+coordinates and metrics come out of the parser as float64 and later stages
+use them without casting again.
+
+Datetimes are read as text and parsed with the explicit DATETIME_FORMAT by
+parse_datetimes, so an unparseable value becomes NaT for the cleaning stage
+to exclude instead of failing the read. Integer columns are parsed as
+float64 (raw files have gaps and stray decimals, featured CSVs write
+trip_duration as a float) and then converted by int_columns to the
+nullable dtype their Field declares, so every block of every file and
+format comes out with the same dtypes whatever its values.
+
+CSV_ENGINE picks the CSV parser: "pyarrow" (the default when pyarrow is
+installed, about twice as fast) or "c", the pandas parser.
+
+check_constraints applies the same NOT NULL and CHECK rules to a prepared
+chunk in a few vectorized passes, so ingest can set invalid rows aside
+before they reach the database.
+"""
+import os
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pragma: no cover - pyarrow is listed in requirements.txt
+    pa = None
+    pa_csv = None
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+CSV_ENGINE = os.getenv("CSV_ENGINE", "pyarrow" if pa_csv is not None else "c").lower()
+if CSV_ENGINE not in ("pyarrow", "c"):
+    raise ValueError(f"CSV_ENGINE must be 'pyarrow' or 'c', not {CSV_ENGINE!r}")
+
+
+class Field(NamedTuple):
+    kind: str  # "string", "datetime", "int" or "float"
+    nullable: bool = True
+    low: Optional[float] = None
+    high: Optional[float] = None
+    low_inclusive: bool = True
+    allowed: Optional[Tuple[str, ...]] = None
+    max_length: Optional[int] = None
+    int_dtype: str = "Int64"  # pandas nullable dtype of an "int" column
+
+
+_LONGITUDE = Field("float", nullable=False, low=-180, high=180)
+_LATITUDE = Field("float", nullable=False, low=-90, high=90)
+
+FIELDS: Dict[str, Field] = {
+    "id": Field("string"),
+    "vendor_id": Field("string", nullable=False, max_length=10),
+    "pickup_datetime": Field("datetime", nullable=False),
+    "dropoff_datetime": Field("datetime", nullable=False),
+    "passenger_count": Field("int", nullable=False, low=1, int_dtype="Int8"),
+    "pickup_longitude": _LONGITUDE,
+    "pickup_latitude": _LATITUDE,
+    "dropoff_longitude": _LONGITUDE,
+    "dropoff_latitude": _LATITUDE,
+    "store_and_fwd_flag": Field("string", allowed=("Y", "N"), max_length=1),
+    "trip_duration": Field("int", nullable=False, low=0, low_inclusive=False),
+    "trip_distance_km": Field("float", nullable=False, low=0),
+    "trip_duration_min": Field("float", nullable=False, low=0, low_inclusive=False),
+    "speed_kmh": Field("float", nullable=False),
+    "fare_per_km": Field("float", low=0),
+    "estimated_fare": Field("float"),
+    "fare_amount": Field("float"),
+    "pickup_cell": Field("int"),
+    "dropoff_cell": Field("int"),
+}
+
+# Columns of the raw TLC extract (the Kaggle train.csv)
+RAW_COLUMNS = [
+    "id", "vendor_id", "pickup_datetime", "dropoff_datetime", "passenger_count",
+    "pickup_longitude", "pickup_latitude", "dropoff_longitude", "dropoff_latitude",
+    "store_and_fwd_flag", "trip_duration",
+]
+
+# Columns of the trips table, in INSERT order
+TRIP_COLUMNS = [
+    "vendor_id", "pickup_datetime", "dropoff_datetime", "passenger_count",
+    "pickup_longitude", "pickup_latitude", "dropoff_longitude", "dropoff_latitude",
+    "store_and_fwd_flag", "trip_duration", "trip_distance_km", "trip_duration_min",
+    "speed_kmh", "fare_per_km", "pickup_cell", "dropoff_cell",
+]
+
+DATETIME_COLUMNS = [c for c, f in FIELDS.items() if f.kind == "datetime"]
+
+
+def _bounded(field: Field) -> bool:
+    return field.low is not None or field.high is not None or bool(field.allowed) or bool(field.max_length)
+
+
+# Reason names for check_constraints codes; code 0 is a valid row
+CONSTRAINT_REASONS = [""] + [
+    name for col in TRIP_COLUMNS for name, applies in (
+        (f"{col}_missing", not FIELDS[col].nullable),
+        (f"{col}_out_of_range", _bounded(FIELDS[col])),
+    ) if applies
+]
+
+
+def parse_datetimes(values: pd.Series) -> pd.Series:
+    """``values`` as datetime64; text is parsed with DATETIME_FORMAT and bad values become NaT."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    return pd.to_datetime(values, format=DATETIME_FORMAT, errors="coerce")
+
+
+def _violations(field: Field, values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """(missing, out of range) masks for one column, judged as the database would."""
+    if field.kind in ("int", "float"):
+        x = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        if field.kind == "float":
+            with np.errstate(over="ignore"):
+                x = x.astype(np.float32)  # FLOAT columns check the stored single-precision value
+        missing = np.isnan(x)
+        bad = np.isinf(x)
+        if not _bounded(field) and not field.nullable:
+            # NaN and infinities cannot be stored at all
+            missing, bad = missing | bad, np.zeros(len(x), dtype=bool)
+        if field.low is not None:
+            bad |= x < field.low if field.low_inclusive else x <= field.low
+        if field.high is not None:
+            bad |= x > field.high
+        return missing, bad
+    if field.kind == "datetime":
+        return parse_datetimes(values).isna().to_numpy(), np.zeros(len(values), dtype=bool)
+    # Strings repeat a lot (vendor, flag): check each distinct value once
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    ok = np.ones(len(uniques) + 1, dtype=bool)  # the extra slot is for code -1 (missing)
+    if field.allowed:
+        ok[:-1] &= uniques.isin(field.allowed).to_numpy()
+    if field.max_length:
+        ok[:-1] &= uniques.astype(str).str.len().to_numpy() <= field.max_length
+    return codes < 0, ~ok[codes]
+
+
+def check_constraints(frame: pd.DataFrame) -> np.ndarray:
+    """int8 code per row: 0 if it passes every NOT NULL and CHECK constraint on
+    trips, else the index in CONSTRAINT_REASONS of the first one it fails."""
+    codes = np.zeros(len(frame), dtype=np.int8)
+    code = len(CONSTRAINT_REASONS)
+    # Walk the constraints backwards so the first failure wins
+    for col in reversed(TRIP_COLUMNS):
+        field = FIELDS[col]
+        missing, bad = _violations(field, frame[col])
+        if _bounded(field):
+            code -= 1
+            codes[bad] = code
+        if not field.nullable:
+            code -= 1
+            codes[missing] = code
+    return codes
+
+
+def int_columns(frame: pd.DataFrame) -> pd.DataFrame:
+    """``frame`` (modified in place) with each known "int" column in its nullable dtype.
+
+    Values that are not whole numbers in the dtype's range, such as a
+    passenger count of 1.5, become <NA>, so check_constraints reports them
+    as missing instead of the read failing.
+    """
+    for col in frame.columns:
+        field = FIELDS.get(col)
+        if field is None or field.kind != "int" or frame[col].dtype == field.int_dtype:
+            continue
+        x = pd.to_numeric(frame[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        info = np.iinfo(field.int_dtype.lower())
+        ok = (x == np.round(x)) & (x >= info.min) & (x <= info.max)
+        frame[col] = pd.arrays.IntegerArray(np.where(ok, x, 0).astype(info.dtype), ~ok)
+    return frame
+
+
+def csv_dtypes(columns=None) -> Dict[str, str]:
+    """pandas read_csv dtypes for the known columns; see int_columns for the integers."""
+    kinds = {"string": "object", "datetime": "object", "float": "float64", "int": "float64"}
+    return {c: kinds[f.kind] for c, f in FIELDS.items() if columns is None or c in columns}
+
+
+def _arrow_options(columns, start_row: int):
+    types = {"string": pa.string(), "datetime": pa.string(), "float": pa.float64(), "int": pa.float64()}
+    convert = pa_csv.ConvertOptions(
+        column_types={c: types[f.kind] for c, f in FIELDS.items()},
+        include_columns=list(columns) if columns is not None else None,
+        strings_can_be_null=True,
+    )
+    return pa_csv.ReadOptions(skip_rows_after_names=start_row), convert
+
+
+def iter_csv(path: str, chunksize: int, columns: Optional[List[str]] = None,
+             start_row: int = 0) -> Iterator[pd.DataFrame]:
+    """Yield a CSV file in typed frames of ``chunksize`` rows (the last may be shorter).
+
+    ``start_row`` skips that many data rows first.
+    """
+    if CSV_ENGINE == "c":
+        skiprows = range(1, start_row + 1) if start_row else None
+        for chunk in pd.read_csv(path, chunksize=chunksize, usecols=columns, skiprows=skiprows,
+                                 dtype=csv_dtypes(columns)):
+            yield int_columns(chunk)
+        return
+
+    read, convert = _arrow_options(columns, start_row)
+    # The reader batches by bytes; regroup into chunksize-row frames
+    pending, rows = [], 0
+    with pa_csv.open_csv(path, read_options=read, convert_options=convert) as reader:
+        for batch in reader:
+            pending.append(batch)
+            rows += batch.num_rows
+            if rows < chunksize:
+                continue
+            table = pa.Table.from_batches(pending)
+            for start in range(0, rows - chunksize + 1, chunksize):
+                yield int_columns(table.slice(start, chunksize).to_pandas())
+            used = rows - rows % chunksize
+            pending, rows = table.slice(used).to_batches(), rows - used
+    if rows:
+        yield int_columns(pa.Table.from_batches(pending).to_pandas())
+
+
+def read_csv(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """A whole CSV file as one typed frame."""
+    if CSV_ENGINE == "c":
+        return int_columns(pd.read_csv(path, usecols=columns, dtype=csv_dtypes(columns)))
+    read, convert = _arrow_options(columns, 0)
+    return int_columns(pa_csv.read_csv(path, read_options=read, convert_options=convert).to_pandas())
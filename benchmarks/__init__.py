@@ -0,0 +1,8 @@
+"""
+Reproducible performance benchmarks.
+
+``benchmarks.generator`` writes synthetic trips in the raw TLC schema that
+data_cleaning.py reads; ``python3 -m benchmarks.run`` times every pipeline
+stage, ingest path and API endpoint on them and compares the results with a
+stored JSON baseline.
+"""
@@ -0,0 +1,176 @@
+"""
+Deterministic synthetic NYC taxi trips in the raw TLC schema (the Kaggle
+train.csv that data_cleaning.py reads).
+
+Trips are generated in blocks of BLOCK_ROWS, each from its own seeded RNG,
+so row i is the same for a given seed whatever the total size: the 1e5-row
+dataset is a prefix of the 1e8-row one, and blocks can be produced lazily
+without holding the dataset in memory.
+
+Pickups cluster around Manhattan, Brooklyn and the airports, weighted by
+hour-of-day demand; durations follow road distance over an hourly traffic
+speed. Dirty rows are mixed in at configurable rates: exact duplicates,
+missing critical values, and invalid rows (unparseable dates, zero-distance
+trips, impossible speeds and stuck meters).
+"""
+import os
+import sys
+import argparse
+from typing import Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Allow running this module directly as a script
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.utils.columnar import TableWriter
+from backend.utils.data_cleaning import critical_cols
+from backend.utils.geo_grid import haversine
+from backend.utils.trip_schema import RAW_COLUMNS
+
+BLOCK_ROWS = 100000
+START = np.datetime64("2016-01-01T00:00:00")
+DAYS = 182
+
+# lat, lon, spread (degrees), share of pickups
+CLUSTERS = np.array([
+    [40.758, -73.985, 0.012, 0.38],  # Midtown
+    [40.773, -73.958, 0.010, 0.16],  # Upper East Side
+    [40.787, -73.975, 0.010, 0.10],  # Upper West Side
+    [40.712, -74.006, 0.010, 0.18],  # Downtown
+    [40.690, -73.975, 0.020, 0.08],  # Brooklyn
+    [40.645, -73.785, 0.004, 0.05],  # JFK
+    [40.774, -73.872, 0.003, 0.05],  # LaGuardia
+])
+LOCAL_TRIP_SHARE = 0.8
+HOURLY_DEMAND = np.array([
+    37, 27, 20, 15, 11, 10, 22, 38, 45, 45, 44, 46,
+    48, 48, 50, 49, 45, 51, 60, 60, 56, 54, 53, 47,
+], dtype=float)
+HOURLY_SPEED_KMH = np.array([
+    22, 24, 25, 26, 27, 25, 20, 15, 13, 13, 14, 14,
+    14, 14, 14, 14, 14, 13, 13, 14, 16, 18, 19, 21,
+], dtype=float)
+ROAD_FACTOR = 1.3  # street grid distance over great-circle distance
+PASSENGER_SHARE = np.array([0.0001, 0.709, 0.144, 0.041, 0.019, 0.053, 0.033])
+VENDOR_2_SHARE = 0.535
+STORE_AND_FWD_SHARE = 0.0055
+
+DUPLICATE_RATE = 0.002
+MISSING_RATE = 0.001
+INVALID_RATE = 0.002
+
+
+def sample_points(rng: np.random.Generator, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Latitudes and longitudes drawn from the pickup clusters."""
+    which = rng.choice(len(CLUSTERS), size=n, p=CLUSTERS[:, 3] / CLUSTERS[:, 3].sum())
+    spread = CLUSTERS[which, 2]
+    return (CLUSTERS[which, 0] + rng.normal(0, 1, n) * spread,
+            CLUSTERS[which, 1] + rng.normal(0, 1, n) * spread * 1.3)
+
+
+def _timestamps(values: np.ndarray) -> np.ndarray:
+    return np.char.replace(np.datetime_as_string(values, unit="s"), "T", " ").astype(object)
+
+
+def generate_block(block: int, seed: int = 0, duplicate_rate: float = DUPLICATE_RATE,
+                   missing_rate: float = MISSING_RATE, invalid_rate: float = INVALID_RATE) -> pd.DataFrame:
+    """The ``block``-th BLOCK_ROWS trips for ``seed``."""
+    rng = np.random.default_rng([seed, block])
+    n = BLOCK_ROWS
+
+    hour = rng.choice(24, size=n, p=HOURLY_DEMAND / HOURLY_DEMAND.sum())
+    offset = rng.integers(0, DAYS, n) * 86400 + hour * 3600 + rng.integers(0, 3600, n)
+    pickup = START + offset.astype("timedelta64[s]")
+
+    plat, plon = sample_points(rng, n)
+    dlat, dlon = sample_points(rng, n)
+    local = rng.random(n) < LOCAL_TRIP_SHARE
+    dlat = np.where(local, plat + rng.normal(0, 0.018, n), dlat)
+    dlon = np.where(local, plon + rng.normal(0, 0.022, n), dlon)
+
+    road_km = haversine(plat, plon, dlat, dlon) * ROAD_FACTOR + 0.2
+    speed = HOURLY_SPEED_KMH[hour] * rng.lognormal(0, 0.25, n)
+    duration = np.maximum(np.rint(road_km / speed * 3600 + rng.gamma(2.0, 60.0, n)), 1).astype(np.int64)
+
+    # Invalid rows the cleaning and feature stages must drop
+    invalid = np.flatnonzero(rng.random(n) < invalid_rate)
+    kind = rng.integers(0, 4, len(invalid))
+    zero_distance = invalid[kind == 1]
+    dlat[zero_distance] = plat[zero_distance]
+    dlon[zero_distance] = plon[zero_distance]
+    duration[invalid[kind == 2]] = rng.integers(1, 5, (kind == 2).sum())  # > 150 km/h
+    duration[invalid[kind == 3]] += 86400  # meter left running
+    dropoff = pickup + duration.astype("timedelta64[s]")
+
+    df = pd.DataFrame({
+        "id": "id" + pd.Series(np.arange(block * n, (block + 1) * n)).astype(str).str.zfill(7),
+        "vendor_id": np.where(rng.random(n) < VENDOR_2_SHARE, 2, 1),
+        "pickup_datetime": _timestamps(pickup),
+        "dropoff_datetime": _timestamps(dropoff),
+        "passenger_count": rng.choice(len(PASSENGER_SHARE), size=n, p=PASSENGER_SHARE / PASSENGER_SHARE.sum()),
+        "pickup_longitude": plon,
+        "pickup_latitude": plat,
+        "dropoff_longitude": dlon,
+        "dropoff_latitude": dlat,
+        "store_and_fwd_flag": np.where(rng.random(n) < STORE_AND_FWD_SHARE, "Y", "N"),
+        "trip_duration": pd.array(duration, dtype="Int64"),
+    })
+    bad_dates = invalid[kind == 0]
+    df.loc[bad_dates, "pickup_datetime"] = "2016-02-30 25:61:00"
+
+    # Missing critical values, one column per affected row
+    missing = np.flatnonzero(rng.random(n) < missing_rate)
+    columns = rng.integers(0, len(critical_cols), len(missing))
+    for i, col in enumerate(critical_cols):
+        df.loc[missing[columns == i], col] = None
+
+    # Exact copies (id included) of earlier rows in the block
+    dup = np.flatnonzero(rng.random(n) < duplicate_rate)
+    dup = dup[dup > 0]
+    source = np.arange(n)
+    source[dup] = rng.integers(0, dup)
+    return df.take(source).reset_index(drop=True)
+
+
+def iter_trips(n: int, seed: int = 0, **rates) -> Iterator[pd.DataFrame]:
+    """Yield the first ``n`` trips for ``seed`` in blocks of BLOCK_ROWS."""
+    for block in range(-(-n // BLOCK_ROWS)):
+        df = generate_block(block, seed, **rates)
+        yield df.iloc[:n - block * BLOCK_ROWS] if (block + 1) * BLOCK_ROWS > n else df
+
+
+def generate_trips(n: int, seed: int = 0, **rates) -> pd.DataFrame:
+    """The first ``n`` trips for ``seed`` as one frame."""
+    blocks = list(iter_trips(n, seed, **rates))
+    return pd.concat(blocks, ignore_index=True) if blocks else generate_block(0, seed, **rates).iloc[:0]
+
+
+def write_trips(path: str, n: int, seed: int = 0, **rates) -> int:
+    """Write ``n`` trips to ``path`` (CSV or Parquet, by extension). Returns rows written."""
+    with TableWriter(path) as writer:
+        for df in iter_trips(n, seed, **rates):
+            writer.write(df)
+    return writer.rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic raw NYC taxi trips")
+    parser.add_argument("path", help="Output .csv or .parquet file")
+    parser.add_argument("--rows", type=lambda s: int(float(s)), default=1000000, help="e.g. 1e6")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicate-rate", dest="duplicate_rate", type=float, default=DUPLICATE_RATE)
+    parser.add_argument("--missing-rate", dest="missing_rate", type=float, default=MISSING_RATE)
+    parser.add_argument("--invalid-rate", dest="invalid_rate", type=float, default=INVALID_RATE)
+    args = parser.parse_args()
+
+    rows = write_trips(args.path, args.rows, args.seed, duplicate_rate=args.duplicate_rate,
+                       missing_rate=args.missing_rate, invalid_rate=args.invalid_rate)
+    print(f"Wrote {rows} trips to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Benchmark suite over the synthetic trips from benchmarks.generator.
+
+    python3 -m benchmarks.run --rows 1e6 --output results.json
+    python3 -m benchmarks.run --baseline benchmarks/baseline.json
+    python3 -m benchmarks.run --db --rows 1e5      # ingest paths and API endpoints too
+    python3 -m benchmarks.run --db --backend sqlite --rows 1e5
+
+Without ``--db`` only the in-process stages run: generation, data_cleaning,
+feature_engineering.add_features, _compute_features_chunk, the efficiency
+rankings and the anomaly detector. ``--db`` adds every ingest path (each on
+its own seed, so none of them hits rows another already loaded) and the
+Flask endpoints through the test client, against the database configured in
+.env; point DB_NAME at a scratch database, since the rows stay there.
+``--backend sqlite`` runs the same benchmarks, under the same names, on a
+fresh embedded SQLite file in the temporary directory instead.
+
+Results are written as JSON. With ``--baseline`` every benchmark is compared
+with the same one in a stored result file, and the exit status is 1 when
+one is slower by more than ``--tolerance``.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+# Allow running this module directly as a script
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from benchmarks.generator import write_trips
+
+CHUNKSIZE = 50000
+TOP_K = 100
+# The dict-based reference ranking needs ~1 KB per trip
+REFERENCE_LIMIT = 1000000
+
+# name, URL; {trip_id} is filled in from the database
+ENDPOINTS = [
+    ("trips_page", "/api/trips/?limit=100"),
+    ("trips_deep_offset", "/api/trips/?limit=100&offset=50000&count=none"),
+    ("trips_cursor", "/api/trips/?cursor=&limit=100&sort=pickup_datetime&count=none"),
+    ("trips_count_approx", "/api/trips/?limit=100&count=approx"),
+    ("trip_by_id", "/api/trips/{trip_id}"),
+    ("trips_near", "/api/trips/near?lat=40.758&lon=-73.985&radius_km=0.5"),
+    ("trips_bbox", "/api/trips/bbox?min_lat=40.75&min_lon=-73.99&max_lat=40.76&max_lon=-73.98"),
+    ("trips_efficient", "/api/trips/efficient?k=100"),
+    ("trips_export_csv", "/api/trips/export?format=csv&start=2016-01-01&end=2016-01-08"),
+    ("insights_stats", "/api/insights/stats"),
+    ("insights_hourly", "/api/insights/hourly-pattern"),
+    ("insights_anomalies", "/api/insights/anomalies?limit=100"),
+]
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def timed(fn, repeat=1):
+    """Best wall time of ``repeat`` calls, and the last result."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with redirect_stdout(sys.stderr):
+            result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def row_result(seconds, rows):
+    return {"seconds": round(seconds, 4), "rows": int(rows),
+            "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None}
+
+
+def run_pipeline(ctx, rows, seed, repeat):
+    """Generation, cleaning, features, ranking, anomaly detection and sketches, all in process."""
+    from backend.utils import feature_engineering
+    from backend.utils.anomaly_detection import AnomalyDetector
+    from backend.utils.columnar import iter_table, read_table
+    from backend.utils.data_cleaning import clean
+    from backend.utils.db_insert import _compute_features_chunk
+    from backend.utils.efficiency_algorithm import (
+        rank_trips_by_efficiency, rank_trips_vectorized, top_k_streaming,
+    )
+    from backend.utils.sketches import Sketches
+
+    tmp = ctx["tmp"]
+    raw = os.path.join(tmp, "raw.csv")
+    cleaned = os.path.join(tmp, "cleaned.parquet")
+    featured = os.path.join(tmp, "featured.parquet")
+    log_path = os.path.join(tmp, "excluded.log")
+    excluded_path = os.path.join(tmp, "excluded_rows.csv")
+    results = {}
+
+    s, n = timed(lambda: write_trips(raw, rows, seed), repeat)
+    results["generate_csv"] = row_result(s, n)
+    s, n = timed(lambda: clean(raw, cleaned, CHUNKSIZE, log_path, excluded_path), repeat)
+    results["data_cleaning"] = row_result(s, rows)
+    results["data_cleaning"]["rows_out"] = n
+    s, kept = timed(lambda: feature_engineering.add_features(cleaned, featured, log_path, excluded_path,
+                                                             CHUNKSIZE), repeat)
+    results["add_features"] = row_result(s, n)
+    results["add_features"]["rows_out"] = kept
+    df = read_table(featured)
+
+    chunks = list(iter_table(cleaned, CHUNKSIZE))
+    s, prepared = timed(lambda: [_compute_features_chunk(c) for c in chunks], repeat)
+    results["compute_features_chunk"] = row_result(s, n)
+
+    def detect():
+        detector = AnomalyDetector(state_path=None)
+        total = 0
+        for p in prepared:
+            flagged, stats = detector.process(p)
+            detector.merge(stats)
+            total += len(flagged)
+        return total
+
+    s, flagged = timed(detect, repeat)
+    results["anomaly_detector"] = row_result(s, n)
+    results["anomaly_detector"]["flagged"] = flagged
+
+    def sketch():
+        sketches = Sketches()
+        for p in prepared:
+            sketches.update(p)
+
+    s, _ = timed(sketch, repeat)
+    results["sketches"] = row_result(s, n)
+
+    ranked = df.iloc[:REFERENCE_LIMIT]
+    trips = [{"trip_id": i, "trip_distance_km": d, "trip_duration_min": m, "fare_amount": None}
+             for i, d, m in zip(range(len(ranked)), ranked["trip_distance_km"].tolist(),
+                                ranked["trip_duration_min"].tolist())]
+    s, _ = timed(lambda: rank_trips_by_efficiency(trips), repeat)
+    results["rank_trips_by_efficiency"] = row_result(s, len(trips))
+    s, _ = timed(lambda: rank_trips_vectorized(trips, TOP_K), repeat)
+    results["rank_trips_vectorized"] = row_result(s, len(trips))
+    frames = [df.iloc[i:i + CHUNKSIZE] for i in range(0, len(df), CHUNKSIZE)]
+    s, _ = timed(lambda: top_k_streaming(iter(frames), TOP_K), repeat)
+    results["top_k_streaming"] = row_result(s, len(df))
+
+    return results
+
+
+def run_ingest(ctx, rows, seed):
+    """Every ingest path, each loading its own freshly cleaned file."""
+    from backend.utils.columnar import read_table
+    from backend.utils.data_cleaning import clean
+    from backend.utils.db_insert import (
+        insert_dataframe, insert_from_csv_bulk, insert_from_csv_chunked,
+    )
+    from backend.utils.ingest_jobs import get_job, submit_job
+    from backend.utils.ingest_pipeline import insert_from_csv_pipelined
+
+    def submit_and_wait(path):
+        job_id = submit_job(path, force=True)
+        while True:
+            job = get_job(job_id)
+            if job["status"] in ("succeeded", "failed", "cancelled"):
+                if job["status"] != "succeeded":
+                    raise RuntimeError(f"ingest job {job_id} {job['status']}: {job['error']}")
+                return job["rows_inserted"]
+            time.sleep(0.1)
+
+    paths = {
+        "ingest_dataframe": lambda p: insert_dataframe(read_table(p)),
+        "ingest_chunked": lambda p: insert_from_csv_chunked(p, force=True),
+        "ingest_bulk": lambda p: insert_from_csv_bulk(p, force=True),
+        "ingest_pipelined": lambda p: insert_from_csv_pipelined(p, force=True),
+        "ingest_job": submit_and_wait,
+    }
+    results = {}
+    for offset, (name, load) in enumerate(paths.items(), start=1):
+        raw = os.path.join(ctx["tmp"], f"{name}_raw.csv")
+        path = os.path.join(ctx["tmp"], f"{name}.parquet")
+        write_trips(raw, rows, seed + offset)
+        with redirect_stdout(sys.stderr):
+            n = clean(raw, path, CHUNKSIZE, os.path.join(ctx["tmp"], "excluded.log"),
+                      os.path.join(ctx["tmp"], "excluded_rows.csv"))
+        log(f"  {name}: {n} rows")
+        s, inserted = timed(lambda: load(path))
+        results[name] = row_result(s, n)
+        results[name]["rows_inserted"] = inserted
+    return results
+
+
+def run_endpoints(requests):
+    """Latency and response size of each endpoint through the Flask test client."""
+    from app import create_app
+    from backend.config.db_connection import db_cursor
+
+    with db_cursor() as (conn, cursor):
+        cursor.execute("SELECT MAX(trip_id) AS trip_id FROM trips")
+        trip_id = cursor.fetchone()["trip_id"] or 1
+
+    client = create_app().test_client()
+    results = {}
+    for name, url in ENDPOINTS:
+        url = url.format(trip_id=trip_id)
+        client.get(url).close()  # warm the pool and any lazy state
+        latencies = []
+        size = 0
+        for _ in range(requests):
+            start = time.perf_counter()
+            resp = client.get(url)
+            size = len(resp.get_data())
+            latencies.append(time.perf_counter() - start)
+            resp.close()
+        if resp.status_code != 200:
+            raise RuntimeError(f"{url} returned {resp.status_code}: {resp.get_data(as_text=True)[:200]}")
+        ms = np.array(latencies) * 1000
+        results[f"endpoint_{name}"] = {
+            "seconds": round(float(np.median(ms)) / 1000, 6),
+            "p50_ms": round(float(np.median(ms)), 2),
+            "p95_ms": round(float(np.percentile(ms, 95)), 2),
+            "bytes": size,
+            "url": url,
+        }
+    return results
+
+
+def environment(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "rows": args.rows,
+        "seed": args.seed,
+        "db": args.db,
+        "backend": args.backend,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Per-benchmark time ratio against the baseline; returns the names that regressed."""
+    if baseline["meta"]["rows"] != results["meta"]["rows"]:
+        log(f"warning: baseline has {baseline['meta']['rows']} rows, this run "
+            f"{results['meta']['rows']}; timings are not comparable")
+    if baseline["meta"].get("backend", "mysql") != results["meta"]["backend"]:
+        log(f"comparing the {results['meta']['backend']} backend against a "
+            f"{baseline['meta'].get('backend', 'mysql')} baseline")
+    regressed = []
+    log(f"\n{'benchmark':34} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, current in results["results"].items():
+        before = baseline["results"].get(name)
+        if not before or not before.get("seconds"):
+            continue
+        ratio = current["seconds"] / before["seconds"]
+        mark = ""
+        if ratio > 1 + tolerance:
+            regressed.append(name)
+            mark = "  REGRESSION"
+        log(f"{name:34} {before['seconds']:10.4f} {current['seconds']:10.4f} {ratio:7.2f}{mark}")
+        current["baseline_ratio"] = round(ratio, 3)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the synthetic-data benchmark suite")
+    parser.add_argument("--rows", type=lambda s: int(float(s)), default=100000, help="e.g. 1e5 to 1e8")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="Best of N for the in-process stages")
+    parser.add_argument("--db", action="store_true", help="Also run ingest paths and API endpoints")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"], default=os.getenv("DB_BACKEND", "mysql"),
+                        help="Storage backend for --db (sqlite uses a scratch file)")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per endpoint with --db")
+    parser.add_argument("--output", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="Result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="nyc-bench-") as tmp:
+        # Keep the anomaly state and data-version counter away from the real cache,
+        # and measure the endpoints' queries rather than cache hits
+        os.environ["CACHE_DIR"] = os.path.join(tmp, "cache")
+        os.environ.setdefault("RESPONSE_CACHE", "off")
+        os.environ["DB_BACKEND"] = args.backend
+        if args.backend == "sqlite":
+            os.environ["SQLITE_PATH"] = os.path.join(tmp, "trips.sqlite3")
+        ctx = {"tmp": tmp}
+
+        log(f"pipeline stages on {args.rows} rows")
+        results = run_pipeline(ctx, args.rows, args.seed, args.repeat)
+        if args.db:
+            log("ingest paths")
+            results.update(run_ingest(ctx, args.rows, args.seed))
+            log("endpoints")
+            results.update(run_endpoints(args.requests))
+
+    report = {"meta": environment(args), "results": results}
+    regressed = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressed = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressed
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        log(f"results written to {args.output}")
+    else:
+        print(text)
+    if regressed:
+        log(f"{len(regressed)} benchmark(s) slower than the baseline by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
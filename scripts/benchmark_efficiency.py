@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Allow running from project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.utils.efficiency_algorithm import (
+    rank_trips_by_efficiency, rank_trips_vectorized, score_columns, top_k_indices, top_k_streaming,
+)
+
+
+def synthetic_columns(n, seed=0):
+    rng = np.random.default_rng(seed)
+    distance = rng.gamma(2.0, 1.7, n)
+    duration = rng.gamma(2.0, 7.0, n)
+    fare = 2.5 + distance * rng.uniform(1.5, 5.0, n)
+    # Edge cases the scorer special-cases: missing fares, zero distance, bad durations
+    fare[rng.random(n) < 0.1] = np.nan
+    distance[rng.random(n) < 0.01] = 0.0
+    duration[rng.random(n) < 0.01] = 0.0
+    # Rounding creates exact score ties, which must keep input order
+    return pd.DataFrame({
+        "trip_id": np.arange(n),
+        "trip_distance_km": distance.round(2),
+        "trip_duration_min": duration.round(1),
+        "fare_amount": fare.round(2),
+    })
+
+
+def as_dicts(df):
+    records = df.to_dict("records")
+    for r in records:
+        if np.isnan(r["fare_amount"]):
+            r["fare_amount"] = None
+    return records
+
+
+def check_parity(n, k):
+    df = synthetic_columns(n, seed=42)
+    trips = as_dicts(df)
+    reference = rank_trips_by_efficiency(trips)
+
+    full = rank_trips_vectorized(trips)
+    assert [t["trip_id"] for t in full] == [t["trip_id"] for t in reference], "full ranking order differs"
+    for a, b in zip(full, reference):
+        assert a.keys() == b.keys(), f"keys differ for trip {a['trip_id']}"
+        assert np.isclose(a["efficiency_score"], b["efficiency_score"], rtol=1e-12, atol=0)
+
+    top = rank_trips_vectorized(trips, k)
+    assert [t["trip_id"] for t in top] == [t["trip_id"] for t in reference[:k]], "top-k differs"
+
+    chunks = (df.iloc[i:i + 7919] for i in range(0, n, 7919))
+    streamed = top_k_streaming(chunks, k)
+    assert [t["trip_id"] for t in streamed] == [t["trip_id"] for t in reference[:k]], "streaming top-k differs"
+    print(f"parity ok: {n} trips, full ranking, top-{k} and streaming top-{k} match the reference")
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def benchmark(n, k, reference_limit):
+    df = synthetic_columns(n)
+    print(f"\n{n:,} trips, k={k}")
+
+    if n <= reference_limit:
+        trips = as_dicts(df)
+        ref_s = timed(lambda: rank_trips_by_efficiency(trips))
+        print(f"  rank_trips_by_efficiency (list of dicts, full sort): {ref_s:8.2f}s")
+        del trips
+    else:
+        print(f"  rank_trips_by_efficiency: skipped above {reference_limit:,} rows (--reference-limit)")
+
+    def columnar():
+        valid, _, _, score, _ = score_columns(df["trip_distance_km"], df["trip_duration_min"], df["fare_amount"])
+        top_k_indices(score, valid, k)
+
+    print(f"  score_columns + top_k_indices (columns):             {timed(columnar):8.2f}s")
+    chunks = (df.iloc[i:i + 50000] for i in range(0, n, 50000))
+    print(f"  top_k_streaming (50k-row chunks):                    {timed(lambda: top_k_streaming(chunks, k)):8.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity check and benchmark for efficiency ranking")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000000, 10000000])
+    parser.add_argument("-k", type=int, default=100)
+    parser.add_argument("--parity-rows", dest="parity_rows", type=int, default=200000)
+    parser.add_argument("--reference-limit", dest="reference_limit", type=int, default=1000000,
+                        help="Largest size to run the dict-based reference on (it needs ~1 KB per trip)")
+    args = parser.parse_args()
+
+    check_parity(args.parity_rows, args.k)
+    for n in args.sizes:
+        benchmark(n, args.k, args.reference_limit)
+
+
+if __name__ == "__main__":
+    main()
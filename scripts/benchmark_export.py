@@ -0,0 +1,128 @@
+import os
+import sys
+import time
+import argparse
+import resource
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Allow running from project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.utils.trip_export import EXPORT_BATCH_ROWS, encode_batches, gzip_stream
+
+COLUMNS = [
+    "trip_id", "vendor_id", "pickup_datetime", "dropoff_datetime", "passenger_count",
+    "pickup_longitude", "pickup_latitude", "dropoff_longitude", "dropoff_latitude",
+    "store_and_fwd_flag", "trip_duration", "trip_distance_km", "trip_duration_min",
+    "speed_kmh", "fare_per_km", "pickup_cell", "dropoff_cell",
+]
+
+
+def rss_mb():
+    """Current resident set size (Linux), falling back to the peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def synthetic_batches(n, batch_rows=EXPORT_BATCH_ROWS, seed=0):
+    """Row tuples shaped like a fetchmany() on trips, generated batch by batch."""
+    rng = np.random.default_rng(seed)
+    base = datetime(2016, 1, 1)
+    for start in range(0, n, batch_rows):
+        m = min(batch_rows, n - start)
+        secs = rng.integers(0, 182 * 86400, m).tolist()
+        dur = (rng.gamma(2.0, 420.0, m).astype(int) + 60).tolist()
+        coords = rng.normal([-73.97, 40.75, -73.97, 40.75], 0.03, (m, 4)).astype(np.float32).astype(float).tolist()
+        metrics = rng.gamma(2.0, 2.0, (m, 4)).astype(np.float32).astype(float).tolist()
+        yield [
+            (start + i + 1, "1", base + timedelta(seconds=secs[i]),
+             base + timedelta(seconds=secs[i] + dur[i]), 1,
+             *coords[i], "N", dur[i], *metrics[i], 1000, 1000)
+            for i in range(m)
+        ]
+
+
+def offline(n, fmt, compress):
+    """Encode n synthetic rows the way /api/trips/export does, sampling RSS per batch."""
+    samples = []
+    generating = [0.0]
+
+    def batches():
+        source = synthetic_batches(n)
+        while True:
+            start = time.perf_counter()
+            batch = next(source, None)
+            generating[0] += time.perf_counter() - start
+            if batch is None:
+                return
+            samples.append(rss_mb())
+            yield batch
+
+    stream = encode_batches(batches(), COLUMNS, fmt)
+    if compress:
+        stream = gzip_stream(stream)
+
+    start = time.perf_counter()
+    out_bytes = sum(len(chunk) for chunk in stream)
+    elapsed = time.perf_counter() - start
+    # Row generation stands in for the database fetch; report encoding on its own
+    print(f"synthetic row generation: {generating[0]:.1f}s (excluded below)")
+    report(n, out_bytes, elapsed - generating[0], samples)
+
+
+def against_db(query, limit_rows):
+    """Stream /api/trips/export from the configured database through the test client."""
+    from app import create_app
+
+    client = create_app().test_client()
+    resp = client.get(f"/api/trips/export?{query}", buffered=False)
+    if resp.status_code != 200:
+        print(resp.get_data(as_text=True))
+        sys.exit(1)
+
+    samples, out_bytes, lines = [], 0, 0
+    start = time.perf_counter()
+    for chunk in resp.response:
+        out_bytes += len(chunk)
+        lines += chunk.count(b"\n")
+        samples.append(rss_mb())
+        if limit_rows and lines >= limit_rows:
+            break
+    elapsed = time.perf_counter() - start
+    resp.close()
+    report(lines, out_bytes, elapsed, samples)
+
+
+def report(rows, out_bytes, elapsed, samples):
+    print(f"rows: {rows:,}  output: {out_bytes / 1e6:,.1f} MB  time: {elapsed:.1f}s")
+    print(f"throughput: {rows / elapsed:,.0f} rows/sec, {out_bytes / 1e6 / elapsed:,.1f} MB/s")
+    if samples:
+        first, last = samples[0], samples[-1]
+        print(f"RSS: {first:,.0f} MB after first batch, {max(samples):,.0f} MB peak, {last:,.0f} MB at end")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming trip export (RSS and throughput)")
+    parser.add_argument("--rows", type=int, default=10000000, help="Synthetic rows (offline mode)")
+    parser.add_argument("--format", dest="fmt", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--db", action="store_true", help="Stream /api/trips/export from the configured database")
+    parser.add_argument("--query", default="format=ndjson", help="--db: export query string")
+    parser.add_argument("--max-rows", dest="max_rows", type=int, default=0, help="--db: stop after this many rows")
+    args = parser.parse_args()
+
+    if args.db:
+        against_db(args.query, args.max_rows)
+    else:
+        offline(args.rows, args.fmt, args.gzip)
+
+
+if __name__ == "__main__":
+    main()
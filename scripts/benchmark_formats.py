@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import pandas as pd
+
+# Allow running from project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.utils.columnar import DATETIME_FORMAT, read_table, write_table
+from benchmarks.generator import generate_trips
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CSV and Parquet intermediates")
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    # Clean rows only: the CSV reader below parses dates strictly
+    df = generate_trips(args.rows, duplicate_rate=0, missing_rate=0, invalid_rate=0)
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "trips.csv")
+        parquet_path = os.path.join(tmp, "trips.parquet")
+        df.to_csv(csv_path, index=False)
+        write_table(df, parquet_path)
+
+        def read_csv():
+            out = read_table(csv_path)
+            for col in ("pickup_datetime", "dropoff_datetime"):
+                out[col] = pd.to_datetime(out[col], format=DATETIME_FORMAT)
+
+        csv_s = timed(read_csv)
+        parquet_s = timed(lambda: read_table(parquet_path))
+        csv_mb = os.path.getsize(csv_path) / 1e6
+        parquet_mb = os.path.getsize(parquet_path) / 1e6
+
+    print(f"rows: {args.rows}")
+    print(f"csv:     {csv_mb:8.1f} MB  parse {csv_s:6.2f}s")
+    print(f"parquet: {parquet_mb:8.1f} MB  parse {parquet_s:6.2f}s")
+    print(f"savings: {csv_mb / parquet_mb:.1f}x smaller, {csv_s / parquet_s:.1f}x faster to load")
+
+
+if __name__ == "__main__":
+    main()
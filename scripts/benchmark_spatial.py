@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+# Allow running from project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from benchmarks.generator import sample_points
+from backend.utils.geo_grid import (
+    bbox_for_radius, cell_ids, cell_range_sql, cell_ranges_for_bbox, haversine_sql,
+)
+
+
+def synthetic_points(n, seed=0):
+    """Pickups from the benchmark generator's Manhattan, Brooklyn and airport clusters."""
+    lat, lon = sample_points(np.random.default_rng(seed), n)
+    return lat.astype(np.float32), lon.astype(np.float32)
+
+
+def offline(n, queries, radius_km):
+    """Count index entries each strategy has to walk, using sorted arrays as the B-trees."""
+    lat, lon = synthetic_points(n)
+    lat_sorted = np.sort(lat)
+    cells_sorted = np.sort(cell_ids(lat, lon))
+
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, n, queries)
+    latlon_rows = cell_rows = 0
+    latlon_s = cell_s = 0.0
+    for i in picks:
+        min_lat, min_lon, max_lat, max_lon = bbox_for_radius(float(lat[i]), float(lon[i]), radius_km)
+
+        start = time.perf_counter()
+        # idx_pickup_coords can only range-scan on its first column
+        latlon_rows += np.searchsorted(lat_sorted, max_lat, "right") - np.searchsorted(lat_sorted, min_lat, "left")
+        latlon_s += time.perf_counter() - start
+
+        start = time.perf_counter()
+        for lo, hi in cell_ranges_for_bbox(min_lat, min_lon, max_lat, max_lon):
+            cell_rows += np.searchsorted(cells_sorted, hi, "right") - np.searchsorted(cells_sorted, lo, "left")
+        cell_s += time.perf_counter() - start
+
+    print(f"points: {n}, queries: {queries}, radius: {radius_km} km")
+    print(f"lat/lon range scan: {latlon_rows / queries:12,.0f} index entries per query")
+    print(f"grid cell ranges:   {cell_rows / queries:12,.0f} index entries per query")
+    print(f"reduction: {latlon_rows / max(cell_rows, 1):.1f}x fewer entries examined")
+
+
+def against_db(queries, radius_km):
+    """Time the grid query against the plain lat/lon range query on the configured database."""
+    from backend.config.db_connection import db_cursor
+
+    with db_cursor() as (conn, cursor):
+        cursor.execute("SELECT pickup_latitude, pickup_longitude FROM trips ORDER BY RAND() LIMIT %s", (queries,))
+        points = [(r["pickup_latitude"], r["pickup_longitude"]) for r in cursor.fetchall()]
+
+        dist = haversine_sql("pickup_latitude", "pickup_longitude")
+        timings = {"latlon": 0.0, "grid": 0.0}
+        for plat, plon in points:
+            min_lat, min_lon, max_lat, max_lon = bbox_for_radius(plat, plon, radius_km)
+            box = [min_lat, max_lat, min_lon, max_lon]
+
+            start = time.perf_counter()
+            cursor.execute(
+                f"SELECT trip_id FROM trips WHERE pickup_latitude BETWEEN %s AND %s "
+                f"AND pickup_longitude BETWEEN %s AND %s AND {dist} <= %s",
+                box + [plat, plat, plon, radius_km])
+            cursor.fetchall()
+            timings["latlon"] += time.perf_counter() - start
+
+            clause, params = cell_range_sql("pickup_cell", cell_ranges_for_bbox(min_lat, min_lon, max_lat, max_lon))
+            start = time.perf_counter()
+            cursor.execute(
+                f"SELECT trip_id FROM trips WHERE {clause} AND pickup_latitude BETWEEN %s AND %s "
+                f"AND pickup_longitude BETWEEN %s AND %s AND {dist} <= %s",
+                params + box + [plat, plat, plon, radius_km])
+            cursor.fetchall()
+            timings["grid"] += time.perf_counter() - start
+
+    n = max(len(points), 1)
+    print(f"queries: {len(points)}, radius: {radius_km} km")
+    print(f"lat/lon range scan: {timings['latlon'] / n * 1000:8.2f} ms/query")
+    print(f"grid cell ranges:   {timings['grid'] / n * 1000:8.2f} ms/query")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark grid-cell spatial search against lat/lon range scans")
+    parser.add_argument("--rows", type=int, default=2000000, help="Synthetic points (offline mode)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--radius-km", dest="radius_km", type=float, default=0.5)
+    parser.add_argument("--db", action="store_true", help="Run the SQL queries against the configured database")
+    args = parser.parse_args()
+
+    if args.db:
+        against_db(args.queries, args.radius_km)
+    else:
+        offline(args.rows, args.queries, args.radius_km)
+
+
+if __name__ == "__main__":
+    main()
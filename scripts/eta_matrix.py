@@ -0,0 +1,43 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+# Allow running from project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.utils.feature_engineering import FEATURED_FILE
+from backend.utils.travel_matrix import ETA_MATRIX_FILE, TravelMatrix, build_matrix_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the zone-to-zone travel-time matrix behind /api/insights/eta")
+    parser.add_argument("command", choices=["build", "info"],
+                        help="build: compute the matrix from featured trips; info: summarize the saved matrix")
+    parser.add_argument("--input", default=FEATURED_FILE, help="Featured trips (CSV or Parquet)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        matrix = build_matrix_file(args.input)
+        print(f"Built {ETA_MATRIX_FILE}: {len(matrix.keys)} cells from {int(matrix.counts.sum())} trips "
+              f"in {time.perf_counter() - start:.1f}s")
+        return
+
+    matrix = TravelMatrix.load(ETA_MATRIX_FILE)
+    print(json.dumps({
+        "path": ETA_MATRIX_FILE,
+        "bytes": os.path.getsize(ETA_MATRIX_FILE),
+        "cells": len(matrix.keys),
+        "trips": int(matrix.counts.sum()),
+        "median_trips_per_cell": float(np.median(matrix.counts)) if len(matrix.counts) else 0,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,75 @@
 import os
 import sys
+import time
 import argparse
+from functools import partial
 
 # Allow running from project root
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if PROJECT_ROOT not in sys.path:
     sys.path.append(PROJECT_ROOT)
 
-from backend.utils.db_insert import insert_from_csv_chunked, insert_all_from_cleaned
+from backend.utils.db_insert import insert_from_csv_chunked, insert_from_csv_bulk, insert_all_from_cleaned
+from backend.utils.ingest_pipeline import insert_from_csv_pipelined
+
+
+def report(inserted, elapsed, mode, source):
+    rate = inserted / elapsed if elapsed > 0 else 0.0
+    print(f"Inserted {inserted} rows from {source} in {elapsed:.1f}s "
+          f"({rate:,.0f} rows/sec, mode={mode})")
+
+
+def file_loader(args):
+    """The loader for ``--mode``, taking (path, force=...) like insert_from_csv_chunked."""
+    if args.mode == "bulk":
+        return partial(insert_from_csv_bulk, chunksize=args.chunksize, defer_indexes=args.defer_indexes)
+    if args.mode == "pipelined":
+        return partial(insert_from_csv_pipelined, chunksize=args.chunksize, batch_size=args.batch_size,
+                       feature_workers=args.feature_workers, writers=args.writers,
+                       queue_depth=args.queue_depth)
+    return partial(insert_from_csv_chunked, chunksize=args.chunksize, batch_size=args.batch_size)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Ingest CSV data into the trips database (chunked)")
     parser.add_argument("csv_path", nargs="?", help="Path to CSV file (omit with --all-cleaned)")
+    parser.add_argument("--mode", choices=["executemany", "bulk", "pipelined"], default="executemany",
+                        help="executemany batches (default), LOAD DATA LOCAL INFILE bulk load, "
+                             "or pipelined reader/feature-worker/writer stages")
     parser.add_argument("--chunksize", type=int, default=50000, help="Pandas chunksize")
     parser.add_argument("--batch-size", dest="batch_size", type=int, default=1000, help="DB insert batch size")
-    parser.add_argument("--all-cleaned", action="store_true", help="Ingest all CSV files under backend/data/cleaned")
+    parser.add_argument("--defer-indexes", dest="defer_indexes", action="store_true",
+                        help="Bulk mode: drop secondary indexes during the load and rebuild them at the end")
+    parser.add_argument("--feature-workers", dest="feature_workers", type=int, default=None,
+                        help="Pipelined mode: processes computing features (default: CPUs - 1, 0 = inline)")
+    parser.add_argument("--writers", type=int, default=2, help="Pipelined mode: DB writer threads")
+    parser.add_argument("--queue-depth", dest="queue_depth", type=int, default=4,
+                        help="Pipelined mode: max chunks in flight between reader and writers")
+    parser.add_argument("--file-workers", dest="file_workers", type=int, default=1,
+                        help="--all-cleaned: number of files loaded concurrently")
+    parser.add_argument("--all-cleaned", action="store_true",
+                        help="Ingest all CSV/Parquet files under backend/data/cleaned, each with --mode")
+    parser.add_argument("--force", action="store_true",
+                        help="Reload files the ingest ledger marks as loaded (existing trips are still skipped)")
     args = parser.parse_args()
+    if args.defer_indexes and args.all_cleaned and args.file_workers > 1:
+        # Each file would drop and rebuild the indexes under the others' loads
+        parser.error("--defer-indexes cannot be combined with --file-workers > 1")
 
+    load = file_loader(args)
     if args.all_cleaned:
-        inserted = insert_all_from_cleaned()
-        print(f"Inserted {inserted} rows from backend/data/cleaned")
+        start = time.perf_counter()
+        inserted = insert_all_from_cleaned(file_workers=args.file_workers, force=args.force, load=load)
+        report(inserted, time.perf_counter() - start, args.mode, "backend/data/cleaned")
         return
 
     if not args.csv_path or not os.path.isfile(args.csv_path):
         print("Provide a valid CSV path or use --all-cleaned")
         sys.exit(1)
 
-    inserted = insert_from_csv_chunked(args.csv_path, chunksize=args.chunksize, batch_size=args.batch_size)
-    print(f"Inserted {inserted} rows from {args.csv_path}")
+    start = time.perf_counter()
+    inserted = load(args.csv_path, force=args.force)
+    report(inserted, time.perf_counter() - start, args.mode, args.csv_path)
 
 
 if __name__ == "__main__":
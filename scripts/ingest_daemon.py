@@ -0,0 +1,47 @@
+import os
+import sys
+import argparse
+
+# Allow running from project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.utils import ingest_daemon
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Watch a folder and load raw trip files dropped into it in micro-batches")
+    parser.add_argument("--watch-dir", dest="watch_dir", default=ingest_daemon.WATCH_DIR,
+                        help="Folder to watch (INGEST_WATCH_DIR); processing/, done/ and failed/ live inside it")
+    parser.add_argument("--batch-rows", dest="batch_rows", type=int, default=ingest_daemon.BATCH_ROWS,
+                        help="Commit once about this many source rows are read (INGEST_BATCH_ROWS)")
+    parser.add_argument("--batch-seconds", dest="batch_seconds", type=float, default=ingest_daemon.BATCH_SECONDS,
+                        help="Commit at most this long after a batch's first rows were read (INGEST_BATCH_SECONDS)")
+    parser.add_argument("--settle-seconds", dest="settle_seconds", type=float,
+                        default=ingest_daemon.SETTLE_SECONDS,
+                        help="Polling: a file is ready once unchanged this long (INGEST_SETTLE_SECONDS)")
+    parser.add_argument("--watch-mode", dest="watch_mode", choices=["auto", "inotify", "poll"],
+                        default=ingest_daemon.WATCH_MODE, help="inotify, polling, or inotify when available")
+    parser.add_argument("--metrics-port", dest="metrics_port", type=int, default=ingest_daemon.METRICS_PORT,
+                        help="Port for GET /metrics (INGEST_DAEMON_METRICS_PORT), 0 to disable")
+    parser.add_argument("--batch-size", dest="batch_size", type=int, default=1000, help="DB insert batch size")
+    parser.add_argument("--once", action="store_true",
+                        help="Load the files in the folder now, without waiting for them to settle, and exit")
+    args = parser.parse_args()
+
+    daemon = ingest_daemon.IngestDaemon(
+        watch_dir=args.watch_dir, batch_rows=args.batch_rows, batch_seconds=args.batch_seconds,
+        settle_seconds=args.settle_seconds, watch_mode=args.watch_mode, metrics_port=args.metrics_port,
+        batch_size=args.batch_size)
+    daemon.install_signal_handlers()
+    try:
+        daemon.run(once=args.once)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+
+# Allow running from project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.config.db_connection import DB_BACKEND, db_connection
+from backend.utils.partitions import (
+    drop_partitions_before, ensure_partitions, list_partitions, migrate_to_partitioned,
+    month_start, next_month, parse_month,
+)
+
+
+def _months_ahead(n):
+    month = month_start(datetime.now())
+    for _ in range(n):
+        month = next_month(month)
+    return month
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage monthly partitions of the trips table")
+    parser.add_argument("command", choices=["migrate", "list", "ensure", "drop"],
+                        help="migrate: copy trips into a partitioned table (stop ingest first); "
+                             "list: show partitions; "
+                             "ensure: add partitions for the coming months; "
+                             "drop: remove months before --before")
+    parser.add_argument("--months-ahead", dest="months_ahead", type=int, default=3,
+                        help="Future months to create partitions for (migrate, ensure)")
+    parser.add_argument("--before", type=parse_month, help="YYYY-MM; drop partitions for earlier months")
+    parser.add_argument("--archive", action="store_true",
+                        help="Keep dropped months as trips_archive_YYYYMM tables")
+    args = parser.parse_args()
+    if DB_BACKEND != "mysql":
+        parser.error("partitioning is only available with DB_BACKEND=mysql")
+
+    with db_connection() as conn:
+        if args.command == "migrate":
+            rows = migrate_to_partitioned(conn, args.months_ahead)
+            print(f"Copied {rows} trips into the partitioned table; the old one is trips_unpartitioned")
+        elif args.command == "ensure":
+            added = ensure_partitions(conn, _months_ahead(args.months_ahead))
+            print(f"Added partitions: {', '.join(added) or 'none'}")
+        elif args.command == "drop":
+            if args.before is None:
+                parser.error("drop requires --before YYYY-MM")
+            dropped = drop_partitions_before(conn, args.before, args.archive)
+            print(f"{'Archived' if args.archive else 'Dropped'} partitions: {', '.join(dropped) or 'none'}")
+        else:
+            cursor = conn.cursor()
+            try:
+                partitions = list_partitions(cursor)
+            finally:
+                cursor.close()
+            if not partitions:
+                print("trips is not partitioned")
+            print(json.dumps(partitions, indent=2))
+
+
+if __name__ == "__main__":
+    main()
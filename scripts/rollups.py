@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+import argparse
+
+# Allow running from project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.config.db_connection import db_connection
+from backend.utils.response_cache import bump_data_version
+from backend.utils.rollups import rebuild_rollups, check_rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the trip_rollup_hourly summary table")
+    parser.add_argument("command", choices=["rebuild", "check"],
+                        help="rebuild: recompute rollups from trips (backfill); "
+                             "check: compare rollups against trips")
+    args = parser.parse_args()
+
+    with db_connection() as conn:
+        if args.command == "rebuild":
+            buckets = rebuild_rollups(conn)
+            # Cached insight responses were built from the old rollups
+            bump_data_version()
+            print(f"Rebuilt trip_rollup_hourly with {buckets} buckets")
+            return
+
+        report = check_rollups(conn)
+    print(json.dumps(report, indent=2, default=str))
+    if not report["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import os
+import sys
+import json
+import argparse
+
+# Allow running from project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.utils.sketches import SKETCH_STATE_FILE, Sketches, rebuild_sketches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the percentile and distinct-count sketches")
+    parser.add_argument("command", choices=["rebuild", "info"],
+                        help="rebuild: recompute the sketches from trips (backfill); "
+                             "info: summarize the saved sketches")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        from backend.config.db_connection import db_connection
+
+        with db_connection() as conn:
+            rows = rebuild_sketches(conn)
+        print(f"Rebuilt {SKETCH_STATE_FILE} from {rows} trips")
+        return
+
+    sketches = Sketches.load(SKETCH_STATE_FILE)
+    print(json.dumps({
+        "path": SKETCH_STATE_FILE,
+        "bytes": os.path.getsize(SKETCH_STATE_FILE) if os.path.exists(SKETCH_STATE_FILE) else 0,
+        "vendors": sketches.vendors,
+        "trips": int(sketches.counts[:, :, 0].sum()),
+        "distinct_pickup_cells": sketches.distinct_cells()["estimate"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
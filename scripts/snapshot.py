@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+# Allow running from project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.config.db_connection import db_cursor
+from backend.utils.snapshot import SNAPSHOT_DIR, build_snapshot, get_snapshot, refresh_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the memory-mapped trips snapshot")
+    parser.add_argument("command", choices=["build", "refresh", "info"],
+                        help="build: snapshot the whole trips table; "
+                             "refresh: append trips added since the last build; "
+                             "info: show the current snapshot")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        snapshot = get_snapshot()
+        if snapshot is None:
+            print(f"No snapshot in {SNAPSHOT_DIR}")
+            sys.exit(1)
+        size = sum(col.nbytes for col in snapshot.columns.values())
+        print(json.dumps({"path": snapshot.path, "bytes": size, **snapshot.meta}, indent=2))
+        return
+
+    start = time.perf_counter()
+    with db_cursor(dictionary=False) as (conn, cursor):
+        if args.command == "build":
+            rows = build_snapshot(cursor)
+        else:
+            rows = refresh_snapshot(cursor)
+    if rows is None:
+        print(f"No snapshot in {SNAPSHOT_DIR}; run build first")
+        sys.exit(1)
+    print(f"Snapshot has {rows} trips ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Allow running from project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+# The backend reads these at import time; keep the tests off MySQL and off
+# the checkout's data/ directory
+_SCRATCH = tempfile.mkdtemp(prefix="nyc_taxi_tests_")
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", os.path.join(_SCRATCH, "trip_data.sqlite3"))
+os.environ.setdefault("CACHE_DIR", os.path.join(_SCRATCH, "cache"))
+os.environ.setdefault("RESPONSE_CACHE", "off")
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """A fresh, empty SQLite database behind db_connection() for one test."""
+    from backend.config import db_connection, sqlite_backend
+
+    if db_connection.DB_BACKEND != "sqlite":
+        pytest.skip("DB_BACKEND is not sqlite")
+    monkeypatch.setattr(sqlite_backend, "SQLITE_PATH", str(tmp_path / "trip_data.sqlite3"))
+    monkeypatch.setattr(db_connection, "_pool", None)
+    yield sqlite_backend.SQLITE_PATH
+    if db_connection._pool is not None:
+        db_connection._pool.close()
+
+
+@pytest.fixture
+def client(sqlite_db):
+    """Flask test client over the sqlite_db database."""
+    from app import create_app
+
+    return create_app().test_client()
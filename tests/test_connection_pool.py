@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from backend.config.db_connection import ConnectionPool, PoolTimeoutError
+from backend.utils.metrics import unwrap_connection
+
+
+@pytest.fixture
+def make_pool(sqlite_db):
+    """ConnectionPool over the test database; the SQLite connect needs no server."""
+    pools = []
+
+    def make(**options):
+        options = dict({"timeout": 5.0, "recycle": 3600.0, "pre_ping": True}, **options)
+        pools.append(ConnectionPool(db_config={"database": sqlite_db}, **options))
+        return pools[-1]
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def test_acquire_times_out_when_every_connection_is_in_use(make_pool):
+    pool = make_pool(size=1, max_overflow=0, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+
+    # A release wakes a waiter
+    threading.Timer(0.05, pool.release, (conn,)).start()
+    pool.timeout = 5.0
+    pool.release(pool.acquire())
+    assert pool.stats()["in_use"] == 0
+
+
+def test_overflow_connections_close_on_release(make_pool):
+    pool = make_pool(size=1, max_overflow=1)
+    first, second = pool.acquire(), pool.acquire()
+    assert pool.stats()["open"] == 2
+    pool.release(first)
+    pool.release(second)
+    stats = pool.stats()
+    assert (stats["open"], stats["idle"], stats["in_use"]) == (1, 1, 0)
+
+
+def test_old_connections_are_recycled(make_pool):
+    pool = make_pool(size=1, max_overflow=0, recycle=0)
+    first = unwrap_connection(pool.acquire())
+    pool.release(first)
+    second = unwrap_connection(pool.acquire())
+    assert second is not first
+    assert pool.stats()["recycled"] == 1
+    pool.release(second)
+
+
+def test_pre_ping_replaces_dead_connections(make_pool):
+    pool = make_pool(size=1, max_overflow=0)
+    first = unwrap_connection(pool.acquire())
+    pool.release(first)
+    first.close()  # as if the server had dropped it while idle
+    second = unwrap_connection(pool.acquire())
+    assert second is not first and second.is_connected()
+    assert pool.stats()["failed_pings"] == 1
+    pool.release(second)
+
+
+def test_counters_stay_exact_under_contention(make_pool):
+    pool = make_pool(size=4, max_overflow=0, recycle=0)
+    rounds, threads = 50, 8
+
+    def borrow():
+        for _ in range(rounds):
+            pool.release(pool.acquire())
+
+    workers = [threading.Thread(target=borrow) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    stats = pool.stats()
+    assert stats["checkouts"] == rounds * threads
+    assert stats["open"] <= 4 and stats["in_use"] == 0
+    # With recycle=0 every checkout but the first on each slot replaces an idle connection
+    assert stats["recycled"] == stats["checkouts"] - stats["open"]
@@ -0,0 +1,37 @@
+from backend.utils.columnar import convert, write_table
+from trip_data import count, raw_trips
+
+
+def test_same_trips_from_parquet_then_csv_insert_nothing(sqlite_db, tmp_path):
+    from backend.utils.db_insert import insert_from_csv_chunked
+
+    parquet, csv = str(tmp_path / "trips.parquet"), str(tmp_path / "trips.csv")
+    write_table(raw_trips(), parquet)  # float32 coordinates
+    convert(parquet, csv)  # the same values as decimal text, read back as float64
+
+    assert insert_from_csv_chunked(parquet, chunksize=20) == 50
+    assert insert_from_csv_chunked(csv, chunksize=20) == 0
+    assert count("trips") == 50
+
+
+def test_trip_ids_take_the_earliest_of_keys_that_repeat_once_normalized(sqlite_db):
+    from backend.config.db_connection import db_cursor
+    from backend.utils.db_insert import (
+        INSERT_TRIP_QUERY, _compute_features_chunk, _prepared_rows, _trip_ids,
+    )
+    from backend.utils.trip_schema import TRIP_COLUMNS
+
+    prepared = _compute_features_chunk(raw_trips(2))
+    rows = _prepared_rows(prepared)
+    # The first trip again, a hair off in float64 (as rows loaded before the
+    # float32 rounding were stored)
+    col = TRIP_COLUMNS.index("pickup_latitude")
+    twin = rows[0][:col] + (rows[0][col] + 1e-12,) + rows[0][col + 1:]
+    with db_cursor(dictionary=False) as (conn, cursor):
+        cursor.execute("INSERT INTO vendors (vendor_id) VALUES ('1'), ('2')")
+        cursor.executemany(INSERT_TRIP_QUERY, [rows[0], twin, rows[1]])
+        conn.commit()
+        cursor.execute("SELECT trip_id FROM trips ORDER BY trip_id")
+        first, _, second = [r[0] for r in cursor.fetchall()]
+
+        assert _trip_ids(cursor, prepared) == [first, second]
@@ -0,0 +1,105 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.utils.efficiency_algorithm import (
+    rank_trips_by_efficiency, rank_trips_vectorized, top_k_streaming,
+)
+
+NAN = float("nan")
+
+# Values the scorer special-cases: None, NaN, strings, zero, negative, infinite
+DISTANCES = [None, NAN, "nan", "abc", "3.5", 0, 0.0, -2.0, 4.2, 1e-9, float("inf")]
+DURATIONS = [None, NAN, "x", "12", 0, -5.0, 1e-320, 15.0, 30.0]
+FARES = [None, NAN, "bad", "20", 0, -3.0, 12.5, 1e6]
+
+
+def edge_trips():
+    trips = []
+    for d in DISTANCES:
+        for t in DURATIONS:
+            for f in FARES:
+                trips.append({"trip_id": len(trips), "trip_distance_km": d,
+                              "trip_duration_min": t, "fare_amount": f})
+    # Missing keys read as None
+    trips.append({"trip_id": len(trips), "trip_duration_min": 10})
+    trips.append({"trip_id": len(trips), "trip_distance_km": 2.0, "trip_duration_min": 10})
+    return trips
+
+
+def same(a, b):
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    if isinstance(a, float) and isinstance(b, float):
+        return a == b or math.isclose(a, b, rel_tol=1e-12, abs_tol=0)
+    return a == b
+
+
+def assert_same_ranking(actual, expected):
+    assert [t["trip_id"] for t in actual] == [t["trip_id"] for t in expected]
+    for a, e in zip(actual, expected):
+        assert a.keys() == e.keys(), a["trip_id"]
+        for key in e:
+            assert same(a[key], e[key]), (a["trip_id"], key, a[key], e[key])
+
+
+def test_nan_distance_is_scored_like_the_reference():
+    trips = [{"trip_id": 1, "trip_distance_km": NAN, "trip_duration_min": 10}]
+    reference = rank_trips_by_efficiency(trips)
+    assert [t["efficiency_score"] for t in reference] == [pytest.approx(0.2)]
+    assert_same_ranking(rank_trips_vectorized(trips), reference)
+
+
+def test_vectorized_matches_reference_on_edge_cases():
+    trips = edge_trips()
+    assert_same_ranking(rank_trips_vectorized(trips), rank_trips_by_efficiency(trips))
+
+
+@pytest.mark.parametrize("k", [1, 7, 100, 10000])
+def test_vectorized_top_k_is_the_reference_prefix(k):
+    trips = edge_trips()
+    assert_same_ranking(rank_trips_vectorized(trips, k), rank_trips_by_efficiency(trips)[:k])
+
+
+def numeric_frame(n, seed):
+    rng = np.random.default_rng(seed)
+    distance = rng.gamma(2.0, 1.7, n).round(1)
+    duration = rng.gamma(2.0, 7.0, n).round(0)
+    fare = (2.5 + distance * rng.uniform(1.5, 5.0, n)).round(0)
+    distance[rng.random(n) < 0.05] = 0.0
+    distance[rng.random(n) < 0.05] = -1.0
+    distance[rng.random(n) < 0.05] = np.nan
+    duration[rng.random(n) < 0.05] = 0.0
+    duration[rng.random(n) < 0.05] = -3.0
+    duration[rng.random(n) < 0.05] = np.nan
+    fare[rng.random(n) < 0.1] = np.nan
+    fare[rng.random(n) < 0.05] = 0.0
+    fare[rng.random(n) < 0.05] = -4.0
+    return pd.DataFrame({"trip_id": np.arange(n), "trip_distance_km": distance,
+                         "trip_duration_min": duration, "fare_amount": fare})
+
+
+def as_reference_input(df):
+    # NaN in a chunk is a NULL, which the reference sees as None
+    return [{k: (None if isinstance(v, float) and math.isnan(v) else v) for k, v in row.items()}
+            for row in df.to_dict("records")]
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 3, 64, 5000])
+@pytest.mark.parametrize("k", [1, 10, 250])
+def test_streaming_top_k_matches_reference(chunk_rows, k):
+    df = numeric_frame(2000, seed=chunk_rows)
+    reference = rank_trips_by_efficiency(as_reference_input(df))[:k]
+    streamed = top_k_streaming((df.iloc[i:i + chunk_rows] for i in range(0, len(df), chunk_rows)), k)
+
+    assert [int(t["trip_id"]) for t in streamed] == [t["trip_id"] for t in reference]
+    for s, r in zip(streamed, reference):
+        assert s["efficiency_score"] == pytest.approx(r["efficiency_score"], rel=1e-12, abs=0)
+        assert ("fare_per_km" in s) == ("fare_per_km" in r)
+
+
+def test_vectorized_matches_reference_on_numeric_data_with_ties():
+    trips = as_reference_input(numeric_frame(3000, seed=7))
+    assert_same_ranking(rank_trips_vectorized(trips), rank_trips_by_efficiency(trips))
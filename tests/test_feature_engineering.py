@@ -0,0 +1,25 @@
+import pandas as pd
+
+from backend.utils.columnar import read_table, write_table
+from backend.utils.data_cleaning import RowHashSet, clean_chunk
+from backend.utils.feature_engineering import add_features
+from trip_data import raw_trips
+
+
+def test_chunked_features_match_a_single_chunk(tmp_path):
+    raw = raw_trips(60)
+    raw.loc[[5, 41], "trip_duration"] = 1  # unrealistic speeds, dropped
+    cleaned = str(tmp_path / "cleaned.parquet")
+    write_table(clean_chunk(raw, RowHashSet()), cleaned)
+
+    outputs = []
+    for chunksize in (1000, 7):
+        featured = str(tmp_path / f"featured_{chunksize}.parquet")
+        excluded = str(tmp_path / f"excluded_{chunksize}.csv")
+        assert add_features(cleaned, featured, None, excluded, chunksize=chunksize) == 58
+        outputs.append((read_table(featured), pd.read_csv(excluded)))
+
+    (whole, whole_excluded), (chunked, chunked_excluded) = outputs
+    pd.testing.assert_frame_equal(chunked, whole)
+    pd.testing.assert_frame_equal(chunked_excluded, whole_excluded)
+    assert whole_excluded["source_row"].tolist() == [5, 41]
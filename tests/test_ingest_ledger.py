@@ -0,0 +1,83 @@
+import shutil
+
+import pytest
+
+from backend.utils.columnar import write_table
+from trip_data import count, query, raw_trips
+
+
+@pytest.fixture
+def trips_csv(sqlite_db, tmp_path):
+    path = str(tmp_path / "trips.csv")
+    write_table(raw_trips(50), path)
+    return path
+
+
+def ledger(path):
+    from backend.utils.ingest_ledger import ledger_path
+
+    return query("SELECT rows_committed, rows_inserted, status FROM ingest_ledger WHERE file_path = %s",
+                 (ledger_path(path),))[0]
+
+
+def run(step, *args, **kwargs):
+    """Call a ledger function with a tuple cursor and commit, as the loaders do."""
+    from backend.config.db_connection import db_cursor
+
+    with db_cursor(dictionary=False) as (conn, cursor):
+        result = step(cursor, *args, **kwargs)
+        conn.commit()
+    return result
+
+
+def test_begin_file_skips_resumes_and_forces(trips_csv, tmp_path):
+    from backend.utils.ingest_ledger import begin_file, checkpoint, finish_file
+
+    assert run(begin_file, trips_csv) == 0
+    run(checkpoint, trips_csv, 20, 20)
+    assert run(begin_file, trips_csv) == 20  # interrupted: resume
+
+    run(finish_file, trips_csv)
+    assert run(begin_file, trips_csv) is None  # complete and unchanged: skip
+    copy = str(tmp_path / "renamed.csv")
+    shutil.copyfile(trips_csv, copy)
+    assert run(begin_file, copy) is None  # same content under another path
+
+    assert run(begin_file, trips_csv, force=True) == 0
+    assert ledger(trips_csv) == (0, 0, "loading")
+
+    run(finish_file, trips_csv)
+    write_table(raw_trips(60), trips_csv)  # content changed: start over
+    assert run(begin_file, trips_csv) == 0
+
+
+def test_checkpoint_never_moves_back(trips_csv):
+    from backend.utils.ingest_ledger import begin_file, checkpoint
+
+    run(begin_file, trips_csv)
+    run(checkpoint, trips_csv, 40, 40)
+    run(checkpoint, trips_csv, 20, 5)  # a late writer finishing an earlier chunk
+    assert ledger(trips_csv) == (40, 45, "loading")
+
+
+def test_interrupted_load_resumes_after_its_last_chunk(trips_csv):
+    from backend.utils.db_insert import insert_from_csv_chunked
+
+    assert insert_from_csv_chunked(trips_csv, chunksize=20, on_chunk=lambda *args: False) == 20
+    assert count("trips") == 20
+    assert ledger(trips_csv) == (20, 20, "loading")
+
+    assert insert_from_csv_chunked(trips_csv, chunksize=20) == 30
+    assert count("trips") == 50
+    assert ledger(trips_csv) == (50, 50, "complete")
+
+
+def test_replaying_a_complete_file_inserts_nothing(trips_csv):
+    from backend.utils.db_insert import insert_from_csv_chunked
+
+    assert insert_from_csv_chunked(trips_csv, chunksize=20) == 50
+    assert insert_from_csv_chunked(trips_csv, chunksize=20) == 0
+    # Forced: every chunk is read again and every trip is already there
+    assert insert_from_csv_chunked(trips_csv, chunksize=20, force=True) == 0
+    assert count("trips") == 50
+    assert ledger(trips_csv) == (50, 0, "complete")
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from backend.utils import ingest_state
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    """ingest_state with its markers in tmp_path and the saves and rebuilds recorded."""
+    calls = []
+    monkeypatch.setattr(ingest_state, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(ingest_state, "save_anomaly_state", lambda: calls.append("save_anomaly_state"))
+    monkeypatch.setattr(ingest_state, "save_sketches", lambda: calls.append("save_sketches"))
+    monkeypatch.setattr(ingest_state, "_recover", lambda own, stale: calls.append(("recover", stale)))
+    return tmp_path, calls
+
+
+def markers(path):
+    return sorted(p for p in os.listdir(path) if p.endswith(".pending"))
+
+
+@pytest.mark.skipif(ingest_state.fcntl is None, reason="needs fcntl")
+def test_failed_load_still_saves_and_releases_the_marker(state):
+    path, calls = state
+    with pytest.raises(RuntimeError):
+        with ingest_state.saving_state():
+            assert markers(path)
+            raise RuntimeError("load failed")
+    assert calls == [("recover", False), "save_anomaly_state", "save_sketches"]
+    assert markers(path) == []
+    assert ingest_state._holders == 0 and ingest_state._marker is None
+
+
+@pytest.mark.skipif(ingest_state.fcntl is None, reason="needs fcntl")
+def test_failed_save_keeps_the_marker_for_the_next_load(state, monkeypatch):
+    path, calls = state
+
+    def fail():
+        raise OSError("disk full")
+
+    monkeypatch.setattr(ingest_state, "save_sketches", fail)
+    with pytest.raises(OSError):
+        with ingest_state.saving_state():
+            pass
+    assert markers(path) and ingest_state._holders == 0
+
+    monkeypatch.setattr(ingest_state, "save_sketches", lambda: calls.append("save_sketches"))
+    with ingest_state.saving_state():
+        pass
+    assert calls[-3:] == [("recover", True), "save_anomaly_state", "save_sketches"]
+    assert markers(path) == []
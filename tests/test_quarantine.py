@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+from backend.utils.columnar import write_table
+from backend.utils.trip_schema import CONSTRAINT_REASONS
+from trip_data import count, query, raw_trips
+
+# One (column, value) per check_constraints reason, each breaking only that column
+CASES = {
+    "vendor_id_missing": ("vendor_id", None),
+    "vendor_id_out_of_range": ("vendor_id", "x" * 11),
+    "pickup_datetime_missing": ("pickup_datetime", pd.NaT),
+    "dropoff_datetime_missing": ("dropoff_datetime", pd.NaT),
+    "passenger_count_missing": ("passenger_count", pd.NA),
+    "passenger_count_out_of_range": ("passenger_count", 0),
+    "pickup_longitude_missing": ("pickup_longitude", np.nan),
+    "pickup_longitude_out_of_range": ("pickup_longitude", 200.0),
+    "pickup_latitude_missing": ("pickup_latitude", np.nan),
+    "pickup_latitude_out_of_range": ("pickup_latitude", 95.0),
+    "dropoff_longitude_missing": ("dropoff_longitude", np.nan),
+    "dropoff_longitude_out_of_range": ("dropoff_longitude", -200.0),
+    "dropoff_latitude_missing": ("dropoff_latitude", np.nan),
+    "dropoff_latitude_out_of_range": ("dropoff_latitude", -95.0),
+    "store_and_fwd_flag_out_of_range": ("store_and_fwd_flag", "X"),
+    "trip_duration_missing": ("trip_duration", np.nan),
+    "trip_duration_out_of_range": ("trip_duration", 0.0),
+    "trip_distance_km_missing": ("trip_distance_km", np.nan),
+    "trip_distance_km_out_of_range": ("trip_distance_km", -1.0),
+    "trip_duration_min_missing": ("trip_duration_min", np.nan),
+    "trip_duration_min_out_of_range": ("trip_duration_min", 0.0),
+    "speed_kmh_missing": ("speed_kmh", np.nan),
+    "fare_per_km_out_of_range": ("fare_per_km", -0.5),
+}
+
+
+def quarantined():
+    return query("SELECT source_row, reason, file_path FROM trips_quarantine ORDER BY source_row")
+
+
+def test_cases_cover_every_constraint():
+    assert sorted(CASES) == sorted(CONSTRAINT_REASONS[1:])
+
+
+def test_each_broken_constraint_is_quarantined_and_the_rest_insert(sqlite_db):
+    from backend.config.db_connection import db_cursor
+    from backend.utils.db_insert import (
+        _compute_features_chunk, _insert_new, _insert_rows, _quarantine_invalid, _upsert_vendors,
+    )
+
+    valid = 10
+    prepared = _compute_features_chunk(raw_trips(len(CASES) + valid))
+    prepared = prepared.astype({"passenger_count": "Int8", "vendor_id": object})
+    for row, (col, value) in enumerate(CASES.values()):
+        prepared.loc[row, col] = value
+
+    with db_cursor(dictionary=False) as (conn, cursor):
+        rest = _quarantine_invalid(cursor, prepared, "dirty.csv", first_row=1000)
+        _upsert_vendors(cursor, rest["vendor_id"])
+        fresh = _insert_new(cursor, rest, lambda frame: _insert_rows(cursor, frame, 4))
+        conn.commit()
+
+    assert len(fresh) == valid
+    assert count("trips") == valid
+    assert quarantined() == [(1000 + row, reason, "dirty.csv") for row, reason in enumerate(CASES)]
+
+
+def test_load_quarantines_dirty_rows_once_and_loads_the_others(sqlite_db, tmp_path):
+    from backend.utils.db_insert import insert_from_csv_chunked
+
+    raw = raw_trips(40)
+    raw.loc[3, "passenger_count"] = 0
+    raw.loc[17, "pickup_latitude"] = np.nan
+    raw.loc[25, "trip_duration"] = 0
+    raw.loc[38, "dropoff_longitude"] = 181.0
+    path = str(tmp_path / "dirty.csv")
+    write_table(raw, path)
+
+    assert insert_from_csv_chunked(path, chunksize=16) == 36
+    expected = [
+        (3, "passenger_count_out_of_range", path),
+        (17, "pickup_latitude_missing", path),
+        (25, "trip_duration_out_of_range", path),
+        (38, "dropoff_longitude_out_of_range", path),
+    ]
+    assert quarantined() == expected
+
+    # A forced replay neither inserts nor quarantines anything again
+    assert insert_from_csv_chunked(path, chunksize=16, force=True) == 0
+    assert count("trips") == 36
+    assert quarantined() == expected
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pytest
+
+from backend.config.sqlite_backend import SQLiteConnection, translate
+
+LOCAL_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+
+# One case per rewrite listed in the sqlite_backend docstring
+TRANSLATIONS = [
+    ("INSERT IGNORE INTO vendors (vendor_id) VALUES (%s)",
+     "INSERT OR IGNORE INTO vendors (vendor_id) VALUES (?)"),
+    ("INSERT INTO trips (a, b) VALUES (%s, %s) ON DUPLICATE KEY UPDATE trip_id = trip_id",
+     "INSERT INTO trips (a, b) VALUES (?, ?) ON CONFLICT DO NOTHING"),
+    ("INSERT INTO r (k, n) VALUES (%s, %s) ON DUPLICATE KEY UPDATE n = n + VALUES(n), m = VALUES(m)",
+     "INSERT INTO r (k, n) VALUES (?, ?) ON CONFLICT DO UPDATE SET n = n + excluded.n, m = excluded.m"),
+    ("SELECT HOUR(pickup_datetime) AS h FROM trips GROUP BY HOUR(pickup_datetime)",
+     "SELECT CAST(substr(pickup_datetime, 12, 2) AS INTEGER) AS h FROM trips "
+     "GROUP BY CAST(substr(pickup_datetime, 12, 2) AS INTEGER)"),
+    ("SELECT CAST(x AS SIGNED) FROM t", "SELECT CAST(x AS INTEGER) FROM t"),
+    ("UPDATE l SET r = GREATEST(r, %s)", "UPDATE l SET r = MAX(r, ?)"),
+    ("SELECT IF(a > 0, 1, 0) FROM t", "SELECT IIF(a > 0, 1, 0) FROM t"),
+    ("UPDATE j SET t = NOW(3)", f"UPDATE j SET t = {LOCAL_NOW}"),
+    ("UPDATE j SET t = CURRENT_TIMESTAMP", f"UPDATE j SET t = {LOCAL_NOW}"),
+    ("SELECT TIMESTAMPDIFF(SECOND, a, b) FROM t",
+     "SELECT ((julianday(b) - julianday(a)) * 86400) FROM t"),
+    ("SELECT TIMESTAMPDIFF(MICROSECOND, a, b) FROM t",
+     "SELECT ((julianday(b) - julianday(a)) * 86400000000) FROM t"),
+    ("SELECT * FROM l WHERE p = %s FOR UPDATE", "SELECT * FROM l WHERE p = ?"),
+    ("SET SESSION foreign_key_checks = 0", "PRAGMA foreign_keys = 0"),
+    ("SET SESSION net_write_timeout = 600", None),
+]
+
+
+@pytest.mark.parametrize("mysql, sqlite", TRANSLATIONS)
+def test_translate(mysql, sqlite):
+    assert translate(mysql) == sqlite
+
+
+def test_translated_statements_run_on_sqlite(tmp_path):
+    conn = SQLiteConnection(str(tmp_path / "t.db"))
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE r (k INTEGER PRIMARY KEY, n INTEGER, at DATETIME)")
+    for n in (2, 3):
+        cursor.execute("INSERT INTO r (k, n) VALUES (%s, %s) ON DUPLICATE KEY UPDATE n = n + VALUES(n)", (1, n))
+    cursor.execute("INSERT IGNORE INTO r (k, n) VALUES (%s, %s)", (1, 100))
+    cursor.execute("UPDATE r SET n = GREATEST(n, %s), at = %s", (4, datetime(2016, 3, 1, 8, 30)))
+    cursor.execute("SELECT n, HOUR(at), IF(n > 4, 'big', 'small'), "
+                   "TIMESTAMPDIFF(SECOND, at, '2016-03-01 09:00:00') FROM r")
+    # julianday() arithmetic is exact to about a millisecond
+    assert cursor.fetchall() == [(5, 8, "big", pytest.approx(1800.0, abs=1e-3))]
+    conn.close()
@@ -0,0 +1,35 @@
+"""Small trip datasets and table helpers shared by the database tests."""
+import numpy as np
+import pandas as pd
+
+
+def raw_trips(n: int = 50, seed: int = 7) -> pd.DataFrame:
+    """Kaggle-style raw trips with full-precision coordinates and distinct natural keys."""
+    rng = np.random.default_rng(seed)
+    pickup = pd.Timestamp("2016-03-01 08:00:00") + pd.to_timedelta(np.arange(n) * 97, unit="s")
+    duration = rng.integers(120, 3600, n)
+    return pd.DataFrame({
+        "id": [f"id{i:07d}" for i in range(n)],
+        "vendor_id": rng.integers(1, 3, n),
+        "pickup_datetime": pickup,
+        "dropoff_datetime": pickup + pd.to_timedelta(duration, unit="s"),
+        "passenger_count": rng.integers(1, 7, n),
+        "pickup_longitude": -73.98 + rng.random(n) * 0.1,
+        "pickup_latitude": 40.70 + rng.random(n) * 0.1,
+        "dropoff_longitude": -73.98 + rng.random(n) * 0.1,
+        "dropoff_latitude": 40.70 + rng.random(n) * 0.1,
+        "store_and_fwd_flag": "N",
+        "trip_duration": duration,
+    })
+
+
+def query(sql: str, params=()) -> list:
+    from backend.config.db_connection import db_cursor
+
+    with db_cursor(dictionary=False) as (_, cursor):
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def count(table: str) -> int:
+    return query(f"SELECT COUNT(*) FROM {table}")[0][0]